@@ -0,0 +1,196 @@
+# ann_index.py
+"""
+FAISS index construction for the knowledge base.
+
+Supported index types (all inner product over normalized vectors):
+    flat   exact brute force (IndexFlatIP)
+    hnsw   graph index (IndexHNSWFlat), searched with efSearch
+    ivf    inverted lists (IndexIVFFlat), searched with nprobe
+    ivfpq  inverted lists + product quantization (IndexIVFPQ), searched with nprobe
+
+The chosen type and its build/search parameters are stored in
+index_meta.json next to faiss.index; rag_chat applies the search-time
+parameters when it loads the index.
+"""
+import os
+import json
+import time
+import numpy as np
+import faiss
+
+META_FILE = "index_meta.json"
+INDEX_TYPES = ("flat", "hnsw", "ivf", "ivfpq")
+
+DEFAULT_PARAMS = {
+    "hnsw_m": 32,
+    "ef_construction": 200,
+    "ef_search": 64,
+    "nlist": 0,        # 0 = pick from corpus size
+    "nprobe": 16,
+    "pq_m": 48,        # sub-quantizers; must divide the embedding dim
+    "pq_bits": 8,
+    "train_size": 50000,
+}
+
+def auto_nlist(n: int) -> int:
+    """Roughly 4*sqrt(n) lists, keeping >= 39 training points per list."""
+    return max(1, min(int(4 * np.sqrt(n)), n // 39))
+
+def min_train_size(index_type: str, params: dict, n: int) -> int:
+    """Training vectors an index type needs for n vectors (0 for flat and HNSW)."""
+    if index_type not in ("ivf", "ivfpq"):
+        return 0
+    need = params.get("nlist") or auto_nlist(n)
+    return max(need, 2 ** params["pq_bits"]) if index_type == "ivfpq" else need
+
+def search_params(index_type: str, params: dict) -> dict:
+    """Search-time FAISS parameters for an index type."""
+    if index_type == "hnsw":
+        return {"efSearch": params["ef_search"]}
+    if index_type in ("ivf", "ivfpq"):
+        return {"nprobe": params["nprobe"]}
+    return {}
+
+def build_index(embs, index_type: str = "flat", params: dict = None, holdout=None, ids=None, seed: int = 0):
+    """Build (and train, if needed) a FAISS index over embs. Returns (index, resolved params).
+
+    Rows listed in holdout are indexed but never used as training samples;
+    only when the other rows are too few to train on are all rows used, and
+    params["trained_on_holdout"] says so.
+    With ids, vectors are stored under those int64 ids (flat and HNSW are
+    wrapped in IndexIDMap2; IVF indexes carry ids natively) so they can be
+    removed again by incremental builds.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}; choose one of {', '.join(INDEX_TYPES)}")
+    params = {**DEFAULT_PARAMS, **(params or {})}
+    embs = np.ascontiguousarray(embs, dtype=np.float32)
+    n, dim = embs.shape
+
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, params["hnsw_m"], faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = params["ef_construction"]
+    else:
+        nlist = params["nlist"] or auto_nlist(n)
+        params["nlist"] = nlist
+        quantizer = faiss.IndexFlatIP(dim)
+        if index_type == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            if dim % params["pq_m"]:
+                raise ValueError(f"pq_m={params['pq_m']} must divide the embedding dim {dim}")
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, params["pq_m"], params["pq_bits"], faiss.METRIC_INNER_PRODUCT)
+
+        # Train on a sample that excludes the held-out evaluation rows, unless too few would be left
+        need = min_train_size(index_type, params, n)
+        if n < need:
+            raise ValueError(f"{index_type} with nlist={nlist}"
+                             + (f" and {params['pq_bits']}-bit codes" if index_type == "ivfpq" else "")
+                             + f" needs at least {need} training vectors, got {n}")
+        rng = np.random.default_rng(seed)
+        pool = np.setdiff1d(np.arange(n), np.asarray(holdout if holdout is not None else [], dtype=np.int64))
+        if len(pool) < need:
+            print(f"Warning: {len(pool)} rows outside the evaluation holdout are too few to train {index_type} "
+                  f"(needs {need}); training on all rows, so the recall report is optimistic")
+            pool = np.arange(n)
+            params["trained_on_holdout"] = True
+        if len(pool) > params["train_size"]:
+            pool = rng.choice(pool, params["train_size"], replace=False)
+        index.train(embs[np.sort(pool)])
+
+    if ids is None:
+        index.add(embs)
+    else:
+        if index_type in ("flat", "hnsw"):
+            index = faiss.IndexIDMap2(index)
+        index.add_with_ids(embs, np.asarray(ids, dtype=np.int64))
+    apply_search_params(index, search_params(index_type, params))
+    return index, params
+
+def index_ids(index):
+    """All ids stored in an id-mapped index."""
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.vector_to_array(index.id_map).astype(np.int64)
+    ivf = faiss.extract_index_ivf(index)
+    invlists = ivf.invlists
+    ids = [faiss.rev_swig_ptr(invlists.get_ids(l), invlists.list_size(l)).copy()
+           for l in range(ivf.nlist) if invlists.list_size(l)]
+    return np.concatenate(ids).astype(np.int64) if ids else np.zeros(0, dtype=np.int64)
+
+def remove_ids(index, index_type: str, ids, params: dict):
+    """Remove ids from an id-mapped index and return the updated index.
+
+    HNSW graphs do not support deletion, so the graph is rebuilt from the
+    stored vectors of the remaining ids (no re-embedding is needed).
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    if not len(ids):
+        return index
+    if index_type != "hnsw":
+        index.remove_ids(ids)
+        return index
+
+    keep = np.setdiff1d(index_ids(index), ids)
+    vecs = index.reconstruct_batch(keep) if len(keep) else np.zeros((0, index.d), dtype=np.float32)
+    rebuilt, _ = build_index(vecs, "hnsw", params, ids=keep)
+    return rebuilt
+
+def apply_search_params(index, sp: dict):
+    """Set efSearch/nprobe on an index (works through IDMap wrappers)."""
+    if not sp:
+        return
+    ps = faiss.ParameterSpace()
+    for name, value in sp.items():
+        ps.set_index_parameter(index, name, value)
+
+def write_meta(index_dir: str, meta: dict):
+    tmp = os.path.join(index_dir, META_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, os.path.join(index_dir, META_FILE))
+
+def read_meta(index_dir: str) -> dict:
+    path = os.path.join(index_dir, META_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def index_size_bytes(index) -> int:
+    return int(faiss.serialize_index(index).nbytes)
+
+def evaluate_index(index, exact, queries, k: int = 10):
+    """Recall@k of index against the exact index, plus per-query latency and size."""
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    _, truth = exact.search(queries, k)
+
+    latencies = []
+    found = np.empty_like(truth)
+    for row in range(len(queries)):
+        t0 = time.perf_counter()
+        _, I = index.search(queries[row:row + 1], k)
+        latencies.append(time.perf_counter() - t0)
+        found[row] = I[0]
+
+    hits = 0
+    for t_row, f_row in zip(truth, found):
+        hits += len(set(t_row[t_row >= 0]) & set(f_row[f_row >= 0]))
+    total = int((truth >= 0).sum())
+    lat = np.array(latencies) * 1000
+    return {
+        "recall_at_k": hits / total if total else 1.0,
+        "k": k,
+        "queries": len(queries),
+        "latency_ms_p50": float(np.percentile(lat, 50)),
+        "latency_ms_p95": float(np.percentile(lat, 95)),
+        "latency_ms_mean": float(lat.mean()),
+        "size_bytes": index_size_bytes(index),
+    }
+
+def print_report(rows):
+    print(f"\n{'index':8s} {'recall@k':>9s} {'p50 ms':>8s} {'p95 ms':>8s} {'size MB':>8s}")
+    for name, r in rows.items():
+        print(f"{name:8s} {r['recall_at_k']:9.3f} {r['latency_ms_p50']:8.3f} {r['latency_ms_p95']:8.3f} {r['size_bytes'] / 1e6:8.2f}"
+              + ("  (trained on the query rows)" if r.get("trained_on_holdout") else ""))
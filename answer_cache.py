@@ -0,0 +1,143 @@
+# answer_cache.py
+import os
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+class SemanticCache:
+    """
+    Answer cache keyed on normalized query embeddings.
+
+    A lookup hits when a cached query of the same language has cosine
+    similarity >= threshold with the new query. Each language keeps its own
+    bounded slot table so Arabic and English entries never match each other.
+    Entries expire after ttl_seconds; when full, the least recently used entry
+    is evicted. The whole cache is dropped when the files in index_dir change.
+    """
+
+    def __init__(self, threshold: float = 0.93, max_entries: int = 512, ttl_seconds: float = 3600,
+                 index_dir: str = None, check_interval: float = 30.0):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.index_dir = index_dir
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._langs = {}
+        self._fingerprint = self._index_fingerprint()
+        self._last_check = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_env(cls, index_dir: str = None):
+        return cls(
+            threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.93")),
+            max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "512")),
+            ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+            index_dir=index_dir,
+        )
+
+    def _index_fingerprint(self):
+        if not self.index_dir or not os.path.isdir(self.index_dir):
+            return None
+        entries = []
+        for name in sorted(os.listdir(self.index_dir)):
+            path = os.path.join(self.index_dir, name)
+            if os.path.isfile(path):
+                st = os.stat(path)
+                entries.append((name, st.st_mtime_ns, st.st_size))
+        return tuple(entries)
+
+    def _check_index(self):
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        fingerprint = self._index_fingerprint()
+        if fingerprint != self._fingerprint:
+            self._fingerprint = fingerprint
+            if self._langs:
+                self._langs = {}
+                self.invalidations += 1
+
+    def _table(self, lang: str, dim: int):
+        table = self._langs.get(lang)
+        if table is None or table["vecs"].shape[1] != dim:
+            table = {
+                "vecs": np.zeros((self.max_entries, dim), dtype=np.float32),
+                "entries": OrderedDict(),  # slot -> (answer, created_at), LRU order
+                "free": list(range(self.max_entries - 1, -1, -1)),
+            }
+            self._langs[lang] = table
+        return table
+
+    def _drop(self, table, slot):
+        del table["entries"][slot]
+        table["free"].append(slot)
+
+    def lookup(self, vec, lang: str):
+        """Return a cached answer for a similar query, or None."""
+        vec = np.asarray(vec, dtype=np.float32).reshape(-1)
+        with self._lock:
+            self._check_index()
+            table = self._langs.get(lang)
+            if table is None or not table["entries"]:
+                self.misses += 1
+                return None
+
+            now = time.monotonic()
+            for slot, (_, created) in list(table["entries"].items()):
+                if now - created > self.ttl_seconds:
+                    self._drop(table, slot)
+                    self.expirations += 1
+
+            slots = np.fromiter(table["entries"].keys(), dtype=np.int64)
+            if not len(slots):
+                self.misses += 1
+                return None
+            sims = table["vecs"][slots] @ vec
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            slot = int(slots[best])
+            table["entries"].move_to_end(slot)
+            self.hits += 1
+            return table["entries"][slot][0]
+
+    def store(self, vec, lang: str, answer: str):
+        """Cache an answer under the query embedding."""
+        vec = np.asarray(vec, dtype=np.float32).reshape(-1)
+        with self._lock:
+            self._check_index()
+            table = self._table(lang, vec.shape[0])
+            if not table["free"]:
+                oldest = next(iter(table["entries"]))
+                self._drop(table, oldest)
+                self.evictions += 1
+            slot = table["free"].pop()
+            table["vecs"][slot] = vec
+            table["entries"][slot] = (answer, time.monotonic())
+
+    def clear(self):
+        with self._lock:
+            self._langs = {}
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": {lang: len(t["entries"]) for lang, t in self._langs.items()},
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -1,12 +1,22 @@
 # app.py
 import streamlit as st
 import os
+import time
 import base64
 from dotenv import load_dotenv
+import resources
+import metrics
 
 # Load environment variables for local development
 load_dotenv()
 
+# Models and index load once per process on a background thread, shared by all sessions
+resources.start()
+metrics.start_server()  # /metrics when RAG_METRICS_PORT is set
+
+# On-screen transcript per session; the model sees a compacted history (summary + recent turns)
+MAX_DISPLAY_MESSAGES = int(os.getenv("MAX_DISPLAY_MESSAGES", "100"))
+
 # --- Configuration and Setup ---
 st.set_page_config(
     page_title="Manara - Your Guide to ATS",
@@ -131,12 +141,59 @@ def get_ats_logo_base64():
 def initialize_rag():
     """Initialize RAG system."""
     try:
-        from rag_chat import answer
-        return answer
+        import remote_client
+        if remote_client.ENABLED:  # answers come from server.py
+            return remote_client.answer_stream
+        from rag_chat import answer_stream
+        return answer_stream
     except Exception as e:
         st.error(f"Error initializing RAG system: {str(e)}")
         return None
 
+def warmup_notice():
+    """Tell users the models are still loading instead of letting the first answer hang."""
+    status = resources.status()
+    if status["state"] in ("loading", "warming"):
+        step = "loading models and index" if status["state"] == "loading" else "running a warmup query"
+        st.info(f"⏳ Manara is warming up ({step}, {status['elapsed']:.0f}s so far). "
+                "You can already ask; the answer starts as soon as loading finishes.")
+    elif status["state"] == "failed":
+        st.error(f"Manara could not load its knowledge base: {status['error']}")
+    if status["timings"]:
+        with st.sidebar.expander("Startup timings (s)"):
+            st.json(status["timings"])
+    return status["state"]
+
+def fast_path_stats():
+    """Sidebar share of questions answered by the intent router without retrieval or the LLM."""
+    import remote_client
+    if remote_client.ENABLED:  # the router runs in server.py
+        return
+    import rag_chat
+    stats = rag_chat.intent_stats()
+    if stats.get("requests"):
+        with st.sidebar.expander("Fast path"):
+            st.json(stats)
+
+def stream_response(rag_answer_stream, question, history, message_placeholder):
+    """Render a streamed answer into the placeholder; returns the full text and the compacted history."""
+    response = ""
+    new_history = history
+    for event in rag_answer_stream(question, history):
+        if event["type"] == "delta":
+            response += event["text"]
+            message_placeholder.markdown(response + "▌")
+        elif event["type"] == "done":
+            response = event["answer"]
+            new_history = event.get("history", history)
+    message_placeholder.markdown(response)
+    return response, new_history
+
+def add_message(role: str, content: str):
+    """Append to the on-screen transcript, keeping only the last MAX_DISPLAY_MESSAGES."""
+    st.session_state.messages.append({"role": role, "content": content})
+    del st.session_state.messages[:-MAX_DISPLAY_MESSAGES]
+
 # --- UI Components ---
 
 def header_html():
@@ -197,12 +254,16 @@ def main():
     # Initialize session state
     if "messages" not in st.session_state:
         st.session_state.messages = []
+    if "history" not in st.session_state:
+        st.session_state.history = []
     if "last_action" not in st.session_state:
         st.session_state.last_action = None
 
     # 1. Header and Features
     header_html()
     features_html()
+    warm_state = warmup_notice()
+    fast_path_stats()
     
     # DEBUG: Show current state
     st.sidebar.write(f"Last action: {st.session_state.last_action}")
@@ -212,6 +273,7 @@ def main():
     with col_clear:
         if st.button("🗑️ Clear Chat", use_container_width=True, key="clear_chat_btn"):
             st.session_state.messages = []
+            st.session_state.history = []
             st.session_state.last_action = None
             st.rerun()
 
@@ -228,7 +290,7 @@ def main():
         question = quick_actions[st.session_state.last_action]
         
         # Add user message
-        st.session_state.messages.append({"role": "user", "content": question})
+        add_message("user", question)
         
         # Get bot response
         with st.chat_message("assistant"):
@@ -236,15 +298,15 @@ def main():
             message_placeholder.markdown("Thinking...")
             
             try:
-                response = rag_answer(question, st.session_state.messages)
-                message_placeholder.markdown(response)
+                response, st.session_state.history = stream_response(
+                    rag_answer, question, st.session_state.history, message_placeholder)
             except Exception as e:
                 error_msg = f"Error: {str(e)}"
                 message_placeholder.markdown(error_msg)
                 response = error_msg
         
         # Add bot response
-        st.session_state.messages.append({"role": "assistant", "content": response})
+        add_message("assistant", response)
         
         # Reset action
         st.session_state.last_action = None
@@ -262,28 +324,22 @@ def main():
         # Regular chat input (only if no quick action in progress)
         if not st.session_state.last_action:
             if prompt := st.chat_input("Ask a question about ATS...", key="chat_input"):
-                st.session_state.messages.append({"role": "user", "content": prompt})
+                add_message("user", prompt)
                 
                 with st.chat_message("assistant"):
                     message_placeholder = st.empty()
                     message_placeholder.markdown("Thinking...")
                     
                     try:
-                        greeting_keywords = ["hello", "hi", "hey", "good morning", "good afternoon", "good evening", "greetings", "howdy"]
-                        is_greeting = any(keyword in prompt.lower() for keyword in greeting_keywords) and len(prompt.split()) <= 3
-                        
-                        if is_greeting:
-                            response = "Hello, my name is Manara. I'm a friendly bilingual assistant for Applied Technology Schools (ATS) in UAE. I'm here to help with any questions you may have about ATS. How can I assist you today?"
-                        else:
-                            response = rag_answer(prompt, st.session_state.messages)
-                        
-                        message_placeholder.markdown(response)
+                        # Greetings and other small talk are answered by the intent router (intent_router.py)
+                        response, st.session_state.history = stream_response(
+                            rag_answer, prompt, st.session_state.history, message_placeholder)
                     except Exception as e:
                         error_msg = f"Error: {str(e)}"
                         message_placeholder.markdown(error_msg)
                         response = error_msg
                 
-                st.session_state.messages.append({"role": "assistant", "content": response})
+                add_message("assistant", response)
 
     with col2:
         # Quick Actions
@@ -311,5 +367,10 @@ def main():
         </div>
         """, unsafe_allow_html=True)
 
+    # Refresh the warmup banner until loading has finished
+    if warm_state in ("loading", "warming"):
+        time.sleep(1)
+        st.rerun()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
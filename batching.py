@@ -0,0 +1,125 @@
+# batching.py
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+def _bucket(n: int) -> int:
+    """Power-of-two upper bound of n, for the histograms."""
+    bucket = 1
+    while bucket < n:
+        bucket *= 2
+    return bucket
+
+class MicroBatcher:
+    """
+    Cross-request micro-batching for a shared model.
+
+    Callers submit a list of items (e.g. one query to encode, or ~30
+    query/passage pairs to re-rank). A worker thread waits up to max_wait_ms
+    after the first pending request, collecting more until max_batch items are
+    queued, then runs fn once on the concatenated items and hands each caller
+    back its own slice of the results.
+    """
+
+    def __init__(self, fn, max_batch: int = 64, max_wait_ms: float = 5.0, name: str = "batcher"):
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._max_queue_depth = 0
+        self._batch_hist = {}  # power-of-two upper bound -> count
+        self._depth_hist = {}  # queue depth seen by a submit, same buckets
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"microbatch-{name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, items) -> Future:
+        """Queue items for the next batch; the future resolves to their results."""
+        if self._closed:
+            raise RuntimeError(f"MicroBatcher {self.name} is closed")
+        fut = Future()
+        items = list(items)
+        if not items:
+            fut.set_result([])
+            return fut
+        self._queue.put((items, fut))
+        depth = self._queue.qsize()
+        bucket = _bucket(depth)
+        with self._stats_lock:
+            self._max_queue_depth = max(self._max_queue_depth, depth)
+            self._depth_hist[bucket] = self._depth_hist.get(bucket, 0) + 1
+        return fut
+
+    def __call__(self, items):
+        return self.submit(items).result()
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            pending = [first]
+            count = len(first[0])
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while count < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    nxt = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stop = True
+                    break
+                pending.append(nxt)
+                count += len(nxt[0])
+
+            self._execute(pending, count)
+            if stop:
+                return
+
+    def _execute(self, pending, count):
+        flat = [item for items, _ in pending for item in items]
+        try:
+            results = self.fn(flat)
+        except Exception as e:
+            for _, fut in pending:
+                fut.set_exception(e)
+            return
+
+        offset = 0
+        for items, fut in pending:
+            fut.set_result(results[offset:offset + len(items)])
+            offset += len(items)
+
+        bucket = _bucket(count)
+        with self._stats_lock:
+            self._batches += 1
+            self._items += count
+            self._batch_hist[bucket] = self._batch_hist.get(bucket, 0) + 1
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "name": self.name,
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "queue_depth_histogram": {f"<={k}": v for k, v in sorted(self._depth_hist.items())},
+                "batches": self._batches,
+                "items": self._items,
+                "mean_batch_size": self._items / self._batches if self._batches else 0.0,
+                "batch_size_histogram": {f"<={k}": v for k, v in sorted(self._batch_hist.items())},
+            }
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
@@ -0,0 +1,90 @@
+# benchmarks/bench_async.py
+"""
+Concurrency benchmark: blocking answer() on a thread pool vs answer_async() on one event loop.
+
+A stub LLM is started in-process (see stub_llm.py), so no OpenAI key is used.
+Retrieval runs against the real models and INDEX_DIR.
+
+    python benchmarks/bench_async.py --requests 200 --concurrency 1 8 32 64
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_llm import start_stub_server
+
+QUERIES = [
+    "What are the admission requirements?",
+    "How much are the tuition fees?",
+    "What programs are available at ATS?",
+    "Where are the ATS campuses located?",
+    "What is on the cafeteria menu?",
+    "Who are the social counsellors?",
+    "What is the attendance policy?",
+    "ما هي شروط القبول؟",
+]
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+def summarize(name, concurrency, latencies, elapsed):
+    print(f"{name:6s} c={concurrency:<4d} throughput={len(latencies) / elapsed:7.1f} req/s  "
+          f"p50={statistics.median(latencies) * 1000:7.1f} ms  p99={percentile(latencies, 99) * 1000:7.1f} ms")
+
+def run_sync(rag_chat, n, concurrency):
+    def one(i):
+        t0 = time.perf_counter()
+        rag_chat.answer(QUERIES[i % len(QUERIES)], [])
+        return time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(one, range(n)))
+    summarize("sync", concurrency, latencies, time.perf_counter() - t0)
+
+async def run_async(rag_chat, n, concurrency):
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with sem:
+            t0 = time.perf_counter()
+            await rag_chat.answer_async(QUERIES[i % len(QUERIES)], [])
+            return time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    latencies = await asyncio.gather(*(one(i) for i in range(n)))
+    summarize("async", concurrency, latencies, time.perf_counter() - t0)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--ttft-ms", type=float, default=300.0)
+    parser.add_argument("--token-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(ttft_ms=args.ttft_ms, token_ms=args.token_ms)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    os.environ["ANSWER_CACHE_ENABLED"] = "0"  # measure the full pipeline
+    import rag_chat
+
+    rag_chat.get_rag_components()
+    rag_chat.answer(QUERIES[0], [])  # warm up models
+
+    print(f"{args.requests} requests per run, stub LLM ttft={args.ttft_ms}ms token={args.token_ms}ms, "
+          f"RAG_CPU_WORKERS={rag_chat.RAG_CPU_WORKERS}")
+    for c in args.concurrency:
+        run_sync(rag_chat, args.requests, c)
+        asyncio.run(run_async(rag_chat, args.requests, c))
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# benchmarks/bench_backends.py
+"""
+PyTorch vs ONNX Runtime (fp32 / dynamic int8) for the embedder and cross-encoder.
+
+Every backend runs in a fresh subprocess so cold start (imports + model
+load + first call) and peak RSS are measured in isolation. Each worker
+reports single-query encode latency, 30-pair re-rank latency, batch encode
+throughput and its raw outputs; the parent then checks parity against
+PyTorch: embedding cosine similarity and the re-rank top-5 / full ordering.
+
+    python model_backend.py --export --backend onnx-int8   # once, optional
+    python benchmarks/bench_backends.py --backends torch onnx onnx-int8
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_async import QUERIES, percentile
+
+def passages(n: int):
+    """Chunks from the index when there is one, else synthetic ATS-like text."""
+    from chunk_store import ChunkStore, has_chunk_store
+    from index_generations import current_dir
+    index_dir = current_dir(os.getenv("INDEX_DIR", "./kb_index"))
+    if has_chunk_store(index_dir):
+        store = ChunkStore(index_dir)
+        texts = store.texts[:n]
+        if len(texts) >= n:
+            return texts
+    base = ("Applied Technology Schools offer programmes in engineering, health sciences and IT. "
+            "Admission requires a completed application, grade reports and an entrance assessment. ")
+    return [f"{base} Campus {i}: fees, schedules and contacts for parents and students." for i in range(n)]
+
+def rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+def worker(backend: str, out_path: str, repeats: int, batch: int):
+    t0 = time.perf_counter()
+    import model_backend
+    emb = model_backend.load_embedder(backend=backend)
+    reranker = model_backend.load_cross_encoder(backend=backend)
+    emb.encode([QUERIES[0]], normalize_embeddings=True)
+    reranker.predict([[QUERIES[0], "warm up"]])
+    cold_start = time.perf_counter() - t0
+
+    docs = passages(max(batch, 30))
+    encode_lat, rerank_lat = [], []
+    for i in range(repeats):
+        q = QUERIES[i % len(QUERIES)]
+        t = time.perf_counter()
+        emb.encode([q], normalize_embeddings=True)
+        encode_lat.append(time.perf_counter() - t)
+        t = time.perf_counter()
+        reranker.predict([[q, d] for d in docs[:30]], batch_size=32)
+        rerank_lat.append(time.perf_counter() - t)
+
+    t = time.perf_counter()
+    doc_embs = emb.encode(docs[:batch], batch_size=32, normalize_embeddings=True)
+    throughput = batch / (time.perf_counter() - t)
+
+    query_embs = emb.encode(QUERIES, normalize_embeddings=True)
+    scores = [np.asarray(reranker.predict([[q, d] for d in docs[:30]]), dtype=np.float32).tolist() for q in QUERIES]
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "backend": backend,
+            "cold_start_s": cold_start,
+            "rss_mb": rss_mb(),
+            "encode_p50_ms": statistics.median(encode_lat) * 1000,
+            "encode_p95_ms": percentile(encode_lat, 95) * 1000,
+            "rerank30_p50_ms": statistics.median(rerank_lat) * 1000,
+            "rerank30_p95_ms": percentile(rerank_lat, 95) * 1000,
+            "encode_throughput": throughput,
+            "query_embs": np.asarray(query_embs).tolist(),
+            "doc_embs": np.asarray(doc_embs[:64]).tolist(),
+            "scores": scores,
+        }, f)
+
+def parity(ref: dict, other: dict, top_n: int = 5) -> dict:
+    """How closely a backend reproduces the PyTorch vectors and re-rank ordering."""
+    cos = np.sum(np.asarray(ref["query_embs"]) * np.asarray(other["query_embs"]), axis=1)
+    doc_cos = np.sum(np.asarray(ref["doc_embs"]) * np.asarray(other["doc_embs"]), axis=1)
+    overlap, exact_order = [], []
+    for a, b in zip(ref["scores"], other["scores"]):
+        ra, rb = np.argsort(a)[::-1], np.argsort(b)[::-1]
+        overlap.append(len(set(ra[:top_n]) & set(rb[:top_n])) / top_n)
+        exact_order.append(float(np.array_equal(ra[:top_n], rb[:top_n])))
+    return {"emb_cos_min": float(min(cos.min(), doc_cos.min())), "emb_cos_mean": float(np.mean(doc_cos)),
+            "rerank_top5_overlap": statistics.mean(overlap), "rerank_top5_same_order": statistics.mean(exact_order)}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"])
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--batch", type=int, default=256, help="passages for the throughput run")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    parser.add_argument("--json", help="write the summary here")
+    args = parser.parse_args()
+
+    if args.worker:
+        return worker(args.worker, args.out, args.repeats, args.batch)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in args.backends:
+            out = os.path.join(tmp, f"{backend}.json")
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", backend, "--out", out,
+                            "--repeats", str(args.repeats), "--batch", str(args.batch)], check=True)
+            with open(out, "r", encoding="utf-8") as f:
+                results[backend] = json.load(f)
+
+    summary = {}
+    for backend, r in results.items():
+        row = {k: v for k, v in r.items() if not isinstance(v, list) and k != "backend"}
+        if "torch" in results and backend != "torch":
+            row.update(parity(results["torch"], r))
+        summary[backend] = row
+        print(f"{backend:10s} cold={r['cold_start_s']:6.2f}s  rss={r['rss_mb']:7.1f} MB  "
+              f"encode p50={r['encode_p50_ms']:6.1f} ms  rerank30 p50={r['rerank30_p50_ms']:7.1f} ms  "
+              f"throughput={r['encode_throughput']:7.1f} passages/s")
+        if "emb_cos_min" in row:
+            print(f"{'':10s} parity vs torch: cos min={row['emb_cos_min']:.4f} mean={row['emb_cos_mean']:.4f}  "
+                  f"top5 overlap={row['rerank_top5_overlap']:.3f} same order={row['rerank_top5_same_order']:.3f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# benchmarks/bench_build.py
+"""
+Build-time benchmark: serial vs process-pool extraction/chunking.
+
+    python benchmarks/bench_build.py --data-dir ./data --workers 1 2 4 8 [--embed]
+
+With --embed the full extract + embed pipeline is timed, showing how much
+of the embedding time is hidden behind extraction.
+"""
+import argparse
+import contextlib
+import glob
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import build_index
+
+def run(paths, workers, embed):
+    current = {os.path.basename(p): {"path": p} for p in paths}
+    names = [os.path.basename(p) for p in paths]
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if embed:
+            texts = build_index.extract_and_embed(names, current, 0, workers)[0]
+        else:
+            texts = [c for chunks, *_ in build_index.iter_extracted(paths, workers) for c in chunks]
+    return time.perf_counter() - t0, texts
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-dir", default=build_index.DATA_DIR)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--embed", action="store_true", help="time extraction + embedding")
+    parser.add_argument("--repeat", type=int, default=1, help="replicate the file list to enlarge the run")
+    args = parser.parse_args()
+
+    paths = sorted(f for f in glob.glob(os.path.join(args.data_dir, "*")) if os.path.isfile(f)) * args.repeat
+    if args.embed:
+        build_index.get_embedder()  # exclude model load from the timings
+    print(f"{len(paths)} files from {args.data_dir}, stage={'extract+embed' if args.embed else 'extract'}")
+
+    baseline_time, baseline_texts = None, None
+    for w in sorted(set(args.workers)):
+        elapsed, texts = run(paths, w, args.embed)
+        if baseline_texts is None:
+            baseline_time, baseline_texts = elapsed, texts
+        same = "identical" if texts == baseline_texts else "DIFFERENT OUTPUT"
+        print(f"workers={w:<3d} {elapsed:7.2f} s  {len(paths) / elapsed:7.1f} files/s  "
+              f"speedup x{baseline_time / elapsed:4.2f}  chunks={len(texts)} ({same})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# benchmarks/bench_chunking.py
+"""
+Re-rank cost of fixed 500-word chunks vs structure-aware small-to-big chunks.
+
+Chunks DATA_DIR with each mode, embeds the chunks into an exact (flat)
+index, and for the benchmark queries times FAISS search + cross-encoder
+re-rank of the k candidates. Reported per mode: chunk (and parent) size
+distribution, tokens per (query, chunk) pair, the share of pairs longer
+than the cross-encoder's input (truncated, so partly unscored), and re-rank
+latency.
+
+    python benchmarks/bench_chunking.py --k 30 --child-words 120 --parent-words 400
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import faiss
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_async import QUERIES, percentile
+from chunking import CHILD_MAX_WORDS, PARENT_MAX_WORDS, Chunker, size_stats
+import build_index
+import model_backend
+
+def extract(chunker, workers):
+    paths = sorted(os.path.join(build_index.DATA_DIR, f) for f in os.listdir(build_index.DATA_DIR))
+    paths = [p for p in paths if os.path.isfile(p)]
+    texts, parents = [], []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for chunks, _, _, _, file_parents in build_index.iter_extracted(paths, workers, chunker=chunker):
+            texts.extend(chunks)
+            parents.extend(file_parents or [])
+    return texts, parents
+
+def pair_tokens(reranker, query, text):
+    tok = getattr(reranker, "tokenizer", None)
+    if callable(tok):  # Hugging Face tokenizer (torch backend)
+        return len(tok(query, text, truncation=False)["input_ids"])
+    return int(1.4 * len(f"{query} {text}".split()))  # rough WordPiece ratio for the ONNX backends
+
+def time_rerank(emb, reranker, index, texts, k, max_length):
+    latencies, tokens = [], []
+    for q in QUERIES:
+        t0 = time.perf_counter()
+        q_emb = emb.encode([q], normalize_embeddings=True).astype(np.float32)
+        _, I = index.search(q_emb, k)
+        pairs = [[q, texts[i]] for i in I[0] if i != -1]
+        reranker.predict(pairs, batch_size=32)
+        latencies.append(time.perf_counter() - t0)
+        tokens.extend(pair_tokens(reranker, q, t) for _, t in pairs)
+    return {"p50_ms": statistics.median(latencies) * 1000, "p95_ms": percentile(latencies, 95) * 1000,
+            "pair_tokens": statistics.mean(tokens), "truncated": sum(t > max_length for t in tokens) / len(tokens)}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k", type=int, default=30)
+    parser.add_argument("--child-words", type=int, default=CHILD_MAX_WORDS)
+    parser.add_argument("--parent-words", type=int, default=PARENT_MAX_WORDS)
+    parser.add_argument("--workers", type=int, default=build_index.BUILD_WORKERS)
+    args = parser.parse_args()
+
+    emb = build_index.get_embedder()
+    reranker = model_backend.load_cross_encoder()
+    max_length = getattr(reranker, "max_length", None) or model_backend.RERANK_MAX_LENGTH
+
+    for mode in ("fixed", "structured"):
+        texts, parents = extract(Chunker(mode, args.child_words, args.parent_words), args.workers)
+        embs = np.ascontiguousarray(
+            emb.encode(texts, batch_size=32, show_progress_bar=False, normalize_embeddings=True), dtype=np.float32)
+        index = faiss.IndexFlatIP(embs.shape[1])
+        index.add(embs)
+        time_rerank(emb, reranker, index, texts, args.k, max_length)  # warm up
+        r = time_rerank(emb, reranker, index, texts, args.k, max_length)
+        print(f"{mode:10s} chunks: {size_stats(texts)}")
+        if parents:
+            print(f"{'':10s} parents: {size_stats(parents)}")
+        print(f"{'':10s} k={args.k} pair tokens={r['pair_tokens']:6.1f}  truncated={r['truncated']:6.1%}  "
+              f"search+rerank p50={r['p50_ms']:7.1f} ms  p95={r['p95_ms']:7.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# benchmarks/bench_coldstart.py
+"""
+Cold start per component, each run in a fresh process.
+
+Every run starts resources.py's background load in a new interpreter and
+reports the seconds spent on imports, each model, the index files and the
+warmup pass, plus the time until the first retrieval returns. With
+--no-preload the first retrieval pays the whole load itself, which is what
+the first user saw before the background warmup.
+
+    python benchmarks/bench_coldstart.py --runs 3
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def worker(preload: bool):
+    t0 = time.perf_counter()
+    import resources
+    if preload:
+        resources.resources.start().wait()
+    import rag_chat
+    rag_chat.retrieve("What are the admission requirements?")
+    first = time.perf_counter() - t0
+    timings = resources.status()["timings"] or rag_chat.get_rag_components()["load_timings"]
+    print(json.dumps({"timings": timings, "first_retrieval": first}))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--no-preload", action="store_true", help="let the first retrieval load everything lazily")
+    parser.add_argument("--worker", choices=["preload", "lazy"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return worker(args.worker == "preload")
+
+    env = {**os.environ, "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "stub")}
+    mode = "lazy" if args.no_preload else "preload"
+    runs = []
+    for _ in range(args.runs):
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", mode], env=env, cwd=ROOT,
+                             check=True, capture_output=True, text=True).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+
+    components = sorted({name for r in runs for name in r["timings"]})
+    for name in components:
+        values = [r["timings"][name] for r in runs if name in r["timings"]]
+        print(f"{name:18s} median={statistics.median(values):7.3f} s  max={max(values):7.3f} s")
+    firsts = [r["first_retrieval"] for r in runs]
+    print(f"{'first retrieval':18s} median={statistics.median(firsts):7.3f} s  max={max(firsts):7.3f} s  ({mode})")
+
+if __name__ == "__main__":
+    main()
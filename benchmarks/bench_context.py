@@ -0,0 +1,67 @@
+# benchmarks/bench_context.py
+"""
+Prompt size of the legacy 200-word truncation vs the token-budgeted context.
+
+Retrieves the context for every query once (real index and models), then
+builds the prompt both ways and reports prompt tokens (mean / p95 / max and
+their spread) and the time spent assembling the context.
+
+    python benchmarks/bench_context.py --budget 800 1200 1600
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_async import QUERIES, percentile
+
+def measure(rag_chat, queries, contexts):
+    tokens, kept, build = [], [], []
+    for q, ctx in zip(queries, contexts):
+        stats = {}
+        t0 = time.perf_counter()
+        rag_chat.build_messages(q, ctx, stats=stats)
+        build.append(time.perf_counter() - t0)
+        tokens.append(stats["prompt_tokens"])
+        if stats.get("compressed"):
+            kept.append(stats["sentences_kept"] / max(1, stats["sentences"]))
+    return {"prompt_mean": statistics.mean(tokens), "prompt_p95": percentile(tokens, 95), "prompt_max": max(tokens),
+            "prompt_stdev": statistics.pstdev(tokens), "build_p50_ms": statistics.median(build) * 1000,
+            "compressed_share": len(kept) / len(tokens), "sentences_kept": statistics.mean(kept) if kept else 1.0}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", help="text file with one query per line (default: built-in queries)")
+    parser.add_argument("--budget", type=int, nargs="+", default=[800, 1200, 1600])
+    parser.add_argument("--json", help="write the results here")
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "stub")  # the LLM is never called
+    import rag_chat
+
+    queries = QUERIES
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    contexts = [rag_chat.retrieve(q) for q in queries]
+
+    report = {}
+    for budget in [0] + args.budget:
+        rag_chat.CONTEXT_TOKEN_BUDGET = rag_chat.context_budget.max_tokens = budget
+        name = "truncate 200 words" if budget == 0 else f"budget {budget}"
+        row = measure(rag_chat, queries, contexts)
+        print(f"{name:20s} prompt tokens mean={row['prompt_mean']:7.1f} p95={row['prompt_p95']:7.1f} "
+              f"max={row['prompt_max']:5d} stdev={row['prompt_stdev']:6.1f}  build p50={row['build_p50_ms']:6.1f} ms  "
+              f"compressed={row['compressed_share']:.0%} sentences kept={row['sentences_kept']:.0%}")
+        report[name] = row
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# benchmarks/bench_conversation.py
+"""
+Prompt size and per-session memory over a long conversation.
+
+Plays --turns questions (the benchmark queries, with follow-ups mixed in)
+through answer_stream() against a stub LLM, passing back the compacted
+history each turn as app.py does, and prints per turn the prompt tokens,
+the history part of them, the size of the kept history and whether the
+query was rewritten. Both should level off once the window is full.
+--full-history passes the whole transcript instead (as Gradio does); the
+prompt stays flat as well, the transcript does not.
+
+    python benchmarks/bench_conversation.py --turns 40
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_async import QUERIES
+from benchmarks.stub_llm import start_stub_server
+
+FOLLOW_UPS = ["What about the fees there?", "And for Arabic speakers?", "When does it start?"]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--full-history", action="store_true", help="pass the whole transcript every turn")
+    parser.add_argument("--every", type=int, default=5, help="print every n-th turn")
+    args = parser.parse_args()
+
+    _, url = start_stub_server(ttft_ms=20, token_ms=1)
+    os.environ.update({"OPENAI_BASE_URL": url, "ANSWER_CACHE_ENABLED": "0",
+                       "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "stub")})
+    import rag_chat
+
+    history, transcript = [], []
+    for i in range(args.turns):
+        query = FOLLOW_UPS[i // 2 % len(FOLLOW_UPS)] if i % 2 else QUERIES[i // 2 % len(QUERIES)]
+        sent = transcript if args.full_history else history
+        for event in rag_chat.answer_stream(query, sent):
+            if event["type"] == "done":
+                done = event
+        history = done["history"]
+        transcript += [{"role": "user", "content": query}, {"role": "assistant", "content": done["answer"]}]
+        kept = transcript if args.full_history else history
+        if i % args.every == 0 or i == args.turns - 1:
+            print(f"turn {i + 1:3d}  prompt={done['tokens'].get('prompt_tokens', 0):5d} tokens  "
+                  f"history={done['tokens'].get('history_tokens', 0):4d} tokens  "
+                  f"kept={len(json.dumps(kept, ensure_ascii=False)):6d} bytes  "
+                  f"rewritten={done['search_query'] != query}")
+        time.sleep(0.05)  # let the background summary refinement run, as between real turns
+    print(f"memory: {rag_chat.memory.stats}")
+
+if __name__ == "__main__":
+    main()
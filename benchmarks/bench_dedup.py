@@ -0,0 +1,95 @@
+# benchmarks/bench_dedup.py
+"""
+Index shrinkage and retrieval speedup from near-duplicate chunk removal.
+
+Chunks DATA_DIR once, builds exact (flat) indexes with and without
+near-duplicates, and times search + cross-encoder re-rank for the benchmark
+queries. Without dedup, part of the k=30 candidates are copies of each
+other; the deduplicated index reaches the same number of distinct
+candidates with a smaller k, i.e. fewer re-rank pairs.
+
+    python benchmarks/bench_dedup.py --threshold 0.85 --k 30
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import faiss
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_async import QUERIES, percentile
+import build_index
+import dedup
+
+def extract(threshold, num_perm, shingle, workers):
+    """All chunks, plus for each chunk the index of the canonical chunk it duplicates (itself if unique)."""
+    paths = sorted(os.path.join(build_index.DATA_DIR, f) for f in os.listdir(build_index.DATA_DIR))
+    paths = [p for p in paths if os.path.isfile(p)]
+    near_dups = dedup.NearDupIndex(dedup.MinHasher(num_perm, shingle), threshold)
+    texts, canonical = [], []
+    for chunks, _, sigs, _, _ in build_index.iter_extracted(paths, workers, near_dups.hasher):
+        for chunk, sig in zip(chunks, sigs):
+            match = near_dups.find(sig)
+            if match is None:
+                match = len(texts)
+                near_dups.add(match, sig)
+            texts.append(chunk)
+            canonical.append(match)
+    return texts, np.asarray(canonical)
+
+def time_retrieval(emb, reranker, index, texts, k, canonical):
+    latencies, distinct = [], []
+    for q in QUERIES:
+        t0 = time.perf_counter()
+        q_emb = emb.encode([q], normalize_embeddings=True).astype(np.float32)
+        _, I = index.search(q_emb, k)
+        ids = [int(i) for i in I[0] if i != -1]
+        reranker.predict([[q, texts[i]] for i in ids])
+        latencies.append(time.perf_counter() - t0)
+        distinct.append(len({int(canonical[i]) for i in ids}))
+    return {"p50_ms": statistics.median(latencies) * 1000, "p95_ms": percentile(latencies, 95) * 1000,
+            "distinct": statistics.mean(distinct)}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threshold", type=float, default=dedup.DEFAULT_THRESHOLD)
+    parser.add_argument("--minhash-perms", type=int, default=dedup.DEFAULT_NUM_PERM)
+    parser.add_argument("--shingle-words", type=int, default=dedup.DEFAULT_SHINGLE)
+    parser.add_argument("--k", type=int, default=30)
+    parser.add_argument("--workers", type=int, default=build_index.BUILD_WORKERS)
+    args = parser.parse_args()
+
+    from sentence_transformers import CrossEncoder
+    t0 = time.perf_counter()
+    texts, canonical = extract(args.threshold, args.minhash_perms, args.shingle_words, args.workers)
+    unique = np.flatnonzero(canonical == np.arange(len(canonical)))
+    print(f"Chunked and signed {len(texts)} chunks in {time.perf_counter() - t0:.1f}s")
+    print(f"Index shrinkage: {len(texts)} → {len(unique)} chunks "
+          f"(-{100 * (1 - len(unique) / max(1, len(texts))):.1f}%)")
+
+    emb = build_index.get_embedder()
+    reranker = CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2")
+    embs = np.ascontiguousarray(
+        emb.encode(texts, batch_size=32, show_progress_bar=False, normalize_embeddings=True), dtype=np.float32)
+
+    full = faiss.IndexFlatIP(embs.shape[1])
+    full.add(embs)
+    deduped = faiss.IndexIDMap2(faiss.IndexFlatIP(embs.shape[1]))
+    deduped.add_with_ids(embs[unique], unique.astype(np.int64))
+    time_retrieval(emb, reranker, full, texts, args.k, canonical)  # warm up
+
+    base = time_retrieval(emb, reranker, full, texts, args.k, canonical)
+    same_k = time_retrieval(emb, reranker, deduped, texts, args.k, canonical)
+    k_equal = max(1, int(np.ceil(base["distinct"])))
+    equal = time_retrieval(emb, reranker, deduped, texts, k_equal, canonical)
+    for name, k, r in (("full", args.k, base), ("dedup", args.k, same_k), ("dedup", k_equal, equal)):
+        print(f"{name:6s} k={k:<4d} distinct candidates={r['distinct']:5.1f}  "
+              f"p50={r['p50_ms']:7.1f} ms  p95={r['p95_ms']:7.1f} ms")
+    print(f"Retrieval speedup at equal distinct candidates: {base['p50_ms'] / equal['p50_ms']:.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# benchmarks/bench_intent.py
+"""
+Intent router fast path on mixed traffic.
+
+Replays greetings, thanks, out-of-scope requests, paraphrases of the
+quick-action FAQs and real knowledge questions, in English and Arabic,
+through answer_stream() against a stub LLM, each as the first message of a
+conversation. Prints the share of requests served on the fast path, the
+routing accuracy per kind against the expected intent, and p50 / p95
+latency of fast-path vs full-pipeline answers. The FAQ answers are built
+first, as `intent_router.py --build` does, but kept in memory so the stub
+answers never replace the stored ones; a warmup pass is not measured.
+
+    python benchmarks/bench_intent.py --passes 3
+    RAG_INTENT_ROUTER=0 python benchmarks/bench_intent.py   # everything through the pipeline
+"""
+import argparse
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_async import percentile
+from benchmarks.stub_llm import start_stub_server
+
+# (query, expected intent; None: a knowledge question for the pipeline)
+TRAFFIC = [
+    ("Hello!", "greeting"), ("hey there", "greeting"), ("Good morning Manara", "greeting"),
+    ("مرحبا", "greeting"), ("السلام عليكم ورحمة الله", "greeting"),
+    ("Thanks a lot!", "thanks"), ("thank you so much", "thanks"), ("شكرا جزيلا لك", "thanks"),
+    ("Can you tell me a joke?", "out_of_scope"), ("What's the weather in Dubai today?", "out_of_scope"),
+    ("اكتب لي قصيدة عن البحر", "out_of_scope"),
+    ("What are the admission requirements?", "faq_admission"), ("How can I apply to ATS?", "faq_admission"),
+    ("ما هي شروط القبول في المدارس؟", "faq_admission"),
+    ("How much are the tuition fees?", "faq_fees"), ("What does it cost to study at ATS?", "faq_fees"),
+    ("كم الرسوم الدراسية؟", "faq_fees"),
+    ("What programs are available at ATS?", "faq_programs"), ("Which programs can I study at ATS?", "faq_programs"),
+    ("Where are the ATS campuses located?", "faq_locations"), ("In which cities are ATS campuses?", "faq_locations"),
+    ("What is on the cafeteria menu?", None), ("Who are the social counsellors?", None),
+    ("What is the attendance policy?", None), ("Can students use their phones during class?", None),
+    ("What happens if a student is late for school?", None), ("ما هي قائمة طعام المقصف؟", None),
+    ("من هم المرشدون الاجتماعيون؟", None), ("ما هي سياسة الحضور والغياب؟", None),
+]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--passes", type=int, default=3, help="measured passes over the traffic")
+    args = parser.parse_args()
+
+    _, url = start_stub_server(ttft_ms=300, token_ms=10)
+    os.environ.update({"OPENAI_BASE_URL": url, "ANSWER_CACHE_ENABLED": "0",
+                       "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "stub")})
+    import rag_chat
+
+    def ask(query):
+        for event in rag_chat.answer_stream(query, []):
+            if event["type"] == "done":
+                return event
+
+    router = rag_chat.get_rag_components()["router"]
+    if router is not None:
+        router.store.path = None  # in memory only
+        router.build_answers(rag_chat.faq_answer)
+    for query, _ in TRAFFIC:  # warm up
+        ask(query)
+
+    latency = {"fast": [], "pipeline": []}
+    correct, total = {}, {}
+    for _ in range(args.passes):
+        for query, expected in TRAFFIC:
+            done = ask(query)
+            latency["fast" if done["fast_path"] else "pipeline"].append(done["latency"])
+            kind = "knowledge" if expected is None else "faq" if expected.startswith("faq_") else expected
+            total[kind] = total.get(kind, 0) + 1
+            correct[kind] = correct.get(kind, 0) + (done["intent"] == expected)
+
+    n = sum(len(v) for v in latency.values())
+    print(f"requests={n}  fast path={len(latency['fast']) / n:.1%}  "
+          f"routing accuracy={sum(correct.values()) / n:.1%}")
+    for kind in total:
+        print(f"  {kind:14s} accuracy={correct[kind] / total[kind]:6.1%}  (n={total[kind]})")
+    for path, lat in latency.items():
+        if lat:
+            print(f"{path:9s} n={len(lat):4d}  p50={statistics.median(lat) * 1000:8.1f} ms  "
+                  f"p95={percentile(lat, 95) * 1000:8.1f} ms")
+    print(f"router: {rag_chat.intent_stats()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# benchmarks/bench_microbatch.py
+"""
+Throughput vs p99 latency of retrieve() with and without cross-session micro-batching.
+
+Each simulated user thread calls retrieve() back to back; with batching on,
+their encode and re-rank calls are merged by the shared MicroBatcher.
+
+    python benchmarks/bench_microbatch.py --concurrency 1 4 16 64 --requests 256 --max-wait-ms 5
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_async import QUERIES, percentile
+
+def run(rag_chat, n, concurrency):
+    def one(i):
+        t0 = time.perf_counter()
+        rag_chat.retrieve(QUERIES[i % len(QUERIES)], k=30, top_n=5)
+        return time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(one, range(n)))
+    elapsed = time.perf_counter() - t0
+    return {
+        "throughput": n / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=256)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "stub")  # retrieval only, the LLM is never called
+    os.environ["RAG_BATCH_MAX_WAIT_MS"] = str(args.max_wait_ms)
+    import rag_chat
+
+    rag_chat.get_rag_components()
+    rag_chat.retrieve(QUERIES[0])  # warm up
+
+    for c in args.concurrency:
+        rag_chat.MICROBATCH_ENABLED = False
+        off = run(rag_chat, args.requests, c)
+        rag_chat.MICROBATCH_ENABLED = True
+        on = run(rag_chat, args.requests, c)
+        print(f"c={c:<4d} direct:  {off['throughput']:7.1f} req/s  p50={off['p50_ms']:7.1f} ms  p99={off['p99_ms']:7.1f} ms")
+        print(f"       batched: {on['throughput']:7.1f} req/s  p50={on['p50_ms']:7.1f} ms  p99={on['p99_ms']:7.1f} ms")
+
+    print(json.dumps(rag_chat.batcher_stats(), indent=2))
+
+if __name__ == "__main__":
+    main()
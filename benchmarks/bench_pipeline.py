@@ -0,0 +1,195 @@
+# benchmarks/bench_pipeline.py
+"""
+End-to-end offline benchmark of the RAG pipeline with a per-stage breakdown.
+
+Runs the benchmark queries through the serving path against a stub LLM (see
+stub_llm.py), on a synthetic index of --chunks chunks (synthetic_index.py,
+built once per size and type in a separate process and reused) or on an
+existing one (--index-dir). Reported:
+
+- p50 / p95 / p99 / mean per stage: query encode, FAISS (+ BM25) search,
+  re-rank, prompt assembly, LLM round trip, and the whole request;
+- throughput and latency of answer() at each --concurrency level;
+- load time per component and the peak RSS of the process.
+
+The answer cache is disabled so every request runs the full pipeline.
+--json saves the results (with git commit, index and backend settings) and
+--compare prints the change against a previous run's JSON.
+
+    python benchmarks/bench_pipeline.py --chunks 100000 --index-type hnsw --json after.json --compare before.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.bench_async import QUERIES, percentile
+from benchmarks.bench_backends import rss_mb
+from benchmarks.stub_llm import start_stub_server
+
+STAGES = ("encode", "search", "rerank", "prompt", "llm", "total")
+SYNTHETIC_DIR = os.path.join(ROOT, "benchmarks", ".synthetic")
+
+def distribution(values) -> dict:
+    return {"p50_ms": round(statistics.median(values), 2), "p95_ms": round(percentile(values, 95), 2),
+            "p99_ms": round(percentile(values, 99), 2), "mean_ms": round(statistics.mean(values), 2)}
+
+def synthetic_index(args) -> str:
+    out = os.path.join(SYNTHETIC_DIR, f"{args.chunks}-{args.index_type}-{args.vectors}")
+    if not os.path.exists(os.path.join(out, "index_meta.json")):
+        # Own process, so building does not count towards the serving RSS
+        subprocess.run([sys.executable, os.path.join(ROOT, "benchmarks", "synthetic_index.py"), "--out", out,
+                        "--chunks", str(args.chunks), "--index-type", args.index_type, "--vectors", args.vectors],
+                       check=True)
+    return out
+
+def run_stages(rag_chat, queries, args):
+    """One request at a time, timing each stage of answer()."""
+    client = rag_chat.get_rag_components()["client"]
+    times = {name: [] for name in STAGES}
+    for q in queries:
+        stats = {}
+        t0 = time.perf_counter()
+        q_emb = rag_chat.embed_query(q)
+        t_retrieve = time.perf_counter()
+        ctx = rag_chat.retrieve(q, k=args.k, top_n=args.top_n, q_emb=q_emb, stats=stats)
+        t_prompt = time.perf_counter()
+        messages = rag_chat.build_messages(q, ctx)
+        t_llm = time.perf_counter()
+        client.chat.completions.create(model=rag_chat.LLM_MODEL, messages=messages, temperature=0.7, max_tokens=300)
+        t_end = time.perf_counter()
+
+        times["encode"].append((t_retrieve - t0) * 1000)
+        times["search"].append(stats.get("search_ms", 0.0))
+        times["rerank"].append(stats.get("rerank_ms", 0.0))
+        times["prompt"].append((t_llm - t_prompt) * 1000)
+        times["llm"].append((t_end - t_llm) * 1000)
+        times["total"].append((t_end - t0) * 1000)
+    return {name: distribution(values) for name, values in times.items()}
+
+def run_concurrency(rag_chat, n: int, concurrency: int) -> dict:
+    def one(i):
+        t0 = time.perf_counter()
+        rag_chat.answer(QUERIES[i % len(QUERIES)], [])
+        return (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(one, range(n)))
+    elapsed = time.perf_counter() - t0
+    return {"concurrency": concurrency, "requests": n, "throughput_rps": round(n / elapsed, 2),
+            **distribution(latencies)}
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, check=True, capture_output=True,
+                              text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def print_report(report):
+    meta = report["meta"]
+    print(f"commit {meta['commit']}  index {meta['index_dir']} ({meta['ntotal']} chunks, {meta['index_type']})  "
+          f"backend {meta['model_backend']}")
+    for name, row in report["stages"].items():
+        print(f"  {name:8s} p50={row['p50_ms']:8.2f}  p95={row['p95_ms']:8.2f}  p99={row['p99_ms']:8.2f}  "
+              f"mean={row['mean_ms']:8.2f} ms")
+    for row in report["throughput"]:
+        print(f"  c={row['concurrency']:<4d} throughput={row['throughput_rps']:7.1f} req/s  "
+              f"p50={row['p50_ms']:8.1f}  p95={row['p95_ms']:8.1f}  p99={row['p99_ms']:8.1f} ms")
+    print(f"  peak RSS {report['peak_rss_mb']:.0f} MiB")
+
+def compare(old, new):
+    """Print new vs old for the latency percentiles, throughput and peak RSS."""
+    print(f"\nchange vs {old['meta']['commit']} (negative latency / positive throughput is better)")
+
+    def line(label, a, b):
+        delta = (b - a) / a * 100 if a else 0.0
+        print(f"  {label:24s} {a:10.2f} -> {b:10.2f}  ({delta:+6.1f}%)")
+
+    for name, row in new["stages"].items():
+        if name in old["stages"]:
+            for key in ("p50_ms", "p95_ms", "p99_ms"):
+                line(f"{name} {key}", old["stages"][name][key], row[key])
+    old_tp = {r["concurrency"]: r for r in old["throughput"]}
+    for row in new["throughput"]:
+        if row["concurrency"] in old_tp:
+            line(f"c={row['concurrency']} req/s", old_tp[row["concurrency"]]["throughput_rps"], row["throughput_rps"])
+            line(f"c={row['concurrency']} p95_ms", old_tp[row["concurrency"]]["p95_ms"], row["p95_ms"])
+    line("peak RSS MiB", old["peak_rss_mb"], new["peak_rss_mb"])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--index-dir", help="benchmark this index instead of a synthetic one")
+    parser.add_argument("--chunks", type=int, default=10_000, help="size of the synthetic index")
+    parser.add_argument("--index-type", default="flat", help="synthetic index type (flat, hnsw, ivf, ivfpq)")
+    parser.add_argument("--vectors", choices=["random", "model"], default="random")
+    parser.add_argument("--queries", type=int, default=100, help="sequential requests for the stage breakdown")
+    parser.add_argument("--requests", type=int, default=100, help="requests per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--k", type=int, default=30)
+    parser.add_argument("--top-n", type=int, default=5)
+    parser.add_argument("--ttft-ms", type=float, default=300.0)
+    parser.add_argument("--token-ms", type=float, default=20.0)
+    parser.add_argument("--json", help="write the results here")
+    parser.add_argument("--compare", help="results JSON of an earlier run to compare against")
+    args = parser.parse_args()
+
+    index_dir = args.index_dir or synthetic_index(args)
+    server, base_url = start_stub_server(ttft_ms=args.ttft_ms, token_ms=args.token_ms)
+    os.environ.update({"INDEX_DIR": index_dir, "OPENAI_BASE_URL": base_url, "ANSWER_CACHE_ENABLED": "0",
+                       "RAG_PRELOAD": "0", "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "stub")})
+    import rag_chat
+    import model_backend
+
+    t0 = time.perf_counter()
+    rag = rag_chat.get_rag_components()
+    load_seconds = time.perf_counter() - t0
+    queries = [QUERIES[i % len(QUERIES)] for i in range(args.queries)]
+    run_stages(rag_chat, queries[:len(QUERIES)], args)  # warm up
+    stages = run_stages(rag_chat, queries, args)
+    throughput = [run_concurrency(rag_chat, args.requests, c) for c in args.concurrency]
+    server.shutdown()
+
+    meta = rag.get("index_meta", {})
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "index_dir": index_dir,
+            "ntotal": int(rag["index"].ntotal),
+            "index_type": meta.get("index_type", "flat"),
+            "vectors": meta.get("synthetic", {}).get("vectors", "model"),
+            "model_backend": model_backend.MODEL_BACKEND,
+            "hybrid": rag_chat.HYBRID_ENABLED and rag.get("lexical") is not None,
+            "context_tokens": rag_chat.CONTEXT_TOKEN_BUDGET,
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+        "load_seconds": round(load_seconds, 3),
+        "load_timings": rag.get("load_timings", {}),
+        "stages": stages,
+        "throughput": throughput,
+        "peak_rss_mb": round(rss_mb(), 1),
+    }
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# benchmarks/bench_streaming.py
+"""
+Compare time-to-first-token of the streaming path against the blocking call.
+
+Runs fully offline: a stub LLM is started in-process and rag_chat's
+retrieval is bypassed so only the completion path is measured.
+
+    python benchmarks/bench_streaming.py --requests 20 --ttft-ms 300 --token-ms 20
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai import OpenAI
+
+from benchmarks.stub_llm import start_stub_server
+import rag_chat
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--ttft-ms", type=float, default=300.0)
+    parser.add_argument("--token-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(ttft_ms=args.ttft_ms, token_ms=args.token_ms)
+    client = OpenAI(api_key="stub", base_url=base_url)
+    ctx = [{"text": "ATS admissions are based on Grade 9 results.", "source": "stub.txt", "score": 1.0}]
+    messages = rag_chat.build_messages("What are the admission requirements?", ctx)
+
+    blocking, first_token, streamed = [], [], []
+    for _ in range(args.requests):
+        t0 = time.perf_counter()
+        client.chat.completions.create(model=rag_chat.LLM_MODEL, messages=messages)
+        blocking.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        ttft = None
+        text = ""
+        for delta in rag_chat.stream_completion(client, messages):
+            if ttft is None:
+                ttft = time.perf_counter() - t0
+            text += delta
+        first_token.append(ttft)
+        streamed.append(time.perf_counter() - t0)
+        assert text, "stream produced no text"
+
+    server.shutdown()
+    ms = lambda xs: statistics.median(xs) * 1000
+    print(f"requests:                 {args.requests}")
+    print(f"blocking answer (median): {ms(blocking):.1f} ms until anything is shown")
+    print(f"streaming TTFT (median):  {ms(first_token):.1f} ms")
+    print(f"streaming total (median): {ms(streamed):.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# benchmarks/eval_hybrid.py
+"""
+Dense-only vs hybrid (FAISS + BM25, reciprocal rank fusion) retrieval.
+
+For each k, every query runs twice through rag_chat.retrieve with the
+cross-encoder on all candidates (RAG_RERANK_POLICY=full), once with
+RAG_HYBRID off and once on, against the real index and models. Reported:
+
+  * cand_recall: share of the labelled relevant sources among the k candidates
+    the cross-encoder sees (what fusion can add at most)
+  * recall@top_n and MRR of the final context (with --labels)
+  * agreement of the top_n sources with dense-only at the largest k
+  * p50 / p95 retrieve latency
+
+Labels use the eval_rerank.py format (JSONL with "query" and "relevant").
+Mixed Arabic/English label sets show where exact terms (names, codes,
+numbers) are missed by the embedder.
+
+    python build_index.py                      # writes the BM25 files next to the chunk store
+    python benchmarks/eval_hybrid.py --labels queries.jsonl --k 10 15 20 30
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_async import QUERIES, percentile
+from benchmarks.eval_rerank import ctx_sources, load_labels, quality
+
+def candidate_recall(rag_chat, queries, labels, k):
+    """Share of relevant sources reachable among the k (fused) candidates."""
+    rag = rag_chat.get_rag_components()
+    recall = []
+    for query, relevant in zip(queries, labels):
+        if not relevant:
+            continue
+        D, I = rag["index"].search(rag_chat.embed_query(query), k)
+        cands = rag_chat._hybrid_candidates(query, I[0], D[0], k, rag)
+        found = set().union(*[ctx_sources(c) & relevant for c in cands]) if cands else set()
+        recall.append(len(found) / len(relevant))
+    return statistics.mean(recall) if recall else 0.0
+
+def run(rag_chat, queries, k, top_n):
+    results, latencies = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        results.append(rag_chat.retrieve(q, k=k, top_n=top_n))
+        latencies.append(time.perf_counter() - t0)
+    return results, latencies
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--labels", help="JSONL with query and relevant sources (default: built-in queries, no labels)")
+    parser.add_argument("--k", type=int, nargs="+", default=[10, 15, 20, 30])
+    parser.add_argument("--top-n", type=int, default=5)
+    parser.add_argument("--json", help="write the results here")
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "stub")  # retrieval only, the LLM is never called
+    import rag_chat
+
+    queries, labels = load_labels(args.labels) if args.labels else (QUERIES, None)
+    if rag_chat.get_rag_components().get("lexical") is None:
+        sys.exit(f"No BM25 index in {rag_chat.INDEX_DIR}; run build_index.py first.")
+    rag_chat.reranking.mode = "full"
+    rag_chat.retrieve(queries[0])  # warm up
+
+    rag_chat.HYBRID_ENABLED = False
+    reference, _ = run(rag_chat, queries, max(args.k), args.top_n)
+
+    report = {}
+    for k in args.k:
+        for mode, hybrid in (("dense", False), ("hybrid", True)):
+            rag_chat.HYBRID_ENABLED = hybrid
+            results, latencies = run(rag_chat, queries, k, args.top_n)
+            row = {"p50_ms": statistics.median(latencies) * 1000, "p95_ms": percentile(latencies, 95) * 1000,
+                   **quality(results, reference, labels, args.top_n)}
+            line = (f"{mode:6s} k={k:<3d} p50={row['p50_ms']:7.1f} ms  p95={row['p95_ms']:7.1f} ms  "
+                    f"agree@n={row['agreement']:.3f}")
+            if labels:
+                row["cand_recall"] = candidate_recall(rag_chat, queries, labels, k)
+                line += f"  cand_recall={row['cand_recall']:.3f}  recall@n={row['recall']:.3f}  mrr={row['mrr']:.3f}"
+            print(line)
+            report[f"{mode} k={k}"] = row
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# benchmarks/eval_language.py
+"""
+Language-routed vs whole-index retrieval on a bilingual query set.
+
+Every query runs through rag_chat.retrieve with RAG_LANG_ROUTING off
+(faiss.index over all chunks) and on (the sub-index of the query's language,
+plus the other language's when the best score is below the fallback score),
+against the real index and models. Reported per query language and overall:
+
+  * searched: vectors in the FAISS indexes a query searched
+  * fallback: share of queries that also searched the other language
+  * pairs: cross-encoder pairs per query, and p50 / p95 retrieve latency
+  * agreement of the top_n sources with the whole-index run and, with
+    --labels, recall@top_n and MRR (eval_rerank.py label format)
+
+The built-in queries are the bench_async questions in English and Arabic.
+
+    python build_index.py                     # writes faiss_ar.index / faiss_en.index
+    python benchmarks/eval_language.py --labels bilingual.jsonl --fallback-score 0.2 0.3 0.4
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_async import QUERIES, percentile
+from benchmarks.eval_rerank import load_labels, quality, run
+from language import detect_language
+
+BILINGUAL_QUERIES = QUERIES + [
+    "كم تبلغ الرسوم الدراسية؟",
+    "ما هي البرامج المتاحة في مدارس التكنولوجيا التطبيقية؟",
+    "أين تقع فروع مدارس التكنولوجيا التطبيقية؟",
+    "ما هي قائمة طعام المقصف؟",
+    "من هم المرشدون الاجتماعيون؟",
+    "ما هي سياسة الحضور والغياب؟",
+]
+
+def summarize(name, rows, results, reference, latencies, stats, labels, top_n):
+    pick = lambda values: [values[i] for i in rows]
+    lat = pick(latencies)
+    row = {"queries": len(rows),
+           "searched": statistics.mean(s.get("searched", 0) for s in pick(stats)),
+           "fallback": sum(bool(s.get("lang_fallback")) for s in pick(stats)) / len(rows),
+           "pairs": statistics.mean(s.get("reranked", 0) for s in pick(stats)),
+           "p50_ms": statistics.median(lat) * 1000, "p95_ms": percentile(lat, 95) * 1000,
+           **quality(pick(results), pick(reference), pick(labels) if labels else None, top_n)}
+    line = (f"{name:22s} n={row['queries']:<3d} searched={row['searched']:9.0f}  fallback={row['fallback']:5.1%}  "
+            f"pairs={row['pairs']:5.1f}  p50={row['p50_ms']:7.1f} ms  p95={row['p95_ms']:7.1f} ms  "
+            f"agree@n={row['agreement']:.3f}")
+    if "recall" in row:
+        line += f"  recall@n={row['recall']:.3f}  mrr={row['mrr']:.3f}"
+    print(line)
+    return row
+
+def report_run(name, queries, results, reference, latencies, stats, labels, top_n):
+    by_lang = {}
+    for i, query in enumerate(queries):
+        by_lang.setdefault(detect_language(query), []).append(i)
+    out = {}
+    for lang, rows in sorted(by_lang.items()):
+        out[lang] = summarize(f"{name} [{lang}]", rows, results, reference, latencies, stats, labels, top_n)
+    out["all"] = summarize(f"{name} [all]", list(range(len(queries))), results, reference, latencies, stats,
+                           labels, top_n)
+    return out
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--labels", help="JSONL with query and relevant sources (default: built-in queries, no labels)")
+    parser.add_argument("--k", type=int, default=30)
+    parser.add_argument("--top-n", type=int, default=5)
+    parser.add_argument("--fallback-score", type=float, nargs="+",
+                        help="RAG_LANG_FALLBACK_SCORE values to compare (default: the configured one)")
+    parser.add_argument("--json", help="write the results here")
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "stub")  # retrieval only, the LLM is never called
+    import rag_chat
+
+    queries, labels = load_labels(args.labels) if args.labels else (BILINGUAL_QUERIES, None)
+    if not rag_chat.get_rag_components()["lang_indexes"]:
+        sys.exit(f"No language sub-indexes in {rag_chat.INDEX_DIR}; run build_index.py without --no-lang-split.")
+    rag_chat.retrieve(queries[0])  # warm up
+
+    rag_chat.LANG_ROUTING_ENABLED = False
+    reference, latencies, stats = run(rag_chat, queries, args.k, args.top_n)
+    report = {"whole index": report_run("whole index", queries, reference, reference, latencies, stats, labels,
+                                        args.top_n)}
+
+    rag_chat.LANG_ROUTING_ENABLED = True
+    for score in args.fallback_score or [rag_chat.LANG_FALLBACK_SCORE]:
+        rag_chat.LANG_FALLBACK_SCORE = score
+        results, latencies, stats = run(rag_chat, queries, args.k, args.top_n)
+        name = f"routed fallback<{score:g}"
+        report[name] = report_run(name, queries, results, reference, latencies, stats, labels, args.top_n)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# benchmarks/eval_rerank.py
+"""
+Latency saved vs ranking quality lost by the adaptive re-rank policy.
+
+Runs every query with RAG_RERANK_POLICY=full (cross-encoder on all k FAISS
+candidates) and with the adaptive policy, for each --skip-gap / --margin
+setting, against the real index and models.
+
+Quality is measured two ways:
+  * agreement: overlap of the top_n sources with the full re-rank (no labels needed)
+  * with --labels, recall@top_n and MRR against the labelled relevant sources
+
+The labels file is JSONL, one query per line:
+
+    {"query": "What are the admission requirements?", "relevant": ["admissions.txt"]}
+
+    python benchmarks/eval_rerank.py --labels queries.jsonl --skip-gap 0.05 0.08 0.12
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_async import QUERIES, percentile
+
+def load_labels(path):
+    with open(path, "r", encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return [r["query"] for r in rows], [set(r.get("relevant", [])) for r in rows]
+
+def ctx_sources(c):
+    return {c["source"], *c.get("also_in", [])}
+
+def run(rag_chat, queries, k, top_n):
+    results, latencies, stats = [], [], []
+    for q in queries:
+        s = {}
+        t0 = time.perf_counter()
+        ctx = rag_chat.retrieve(q, k=k, top_n=top_n, stats=s)
+        latencies.append(time.perf_counter() - t0)
+        results.append(ctx)
+        stats.append(s)
+    return results, latencies, stats
+
+def quality(results, reference, labels, top_n):
+    agree = [len({c["source"] for c in r} & {c["source"] for c in ref}) / top_n
+             for r, ref in zip(results, reference)]
+    out = {"agreement": statistics.mean(agree)}
+    if labels:
+        recall, rr = [], []
+        for r, relevant in zip(results, labels):
+            if not relevant:
+                continue
+            hits = [bool(ctx_sources(c) & relevant) for c in r]
+            found = set().union(*[ctx_sources(c) & relevant for c in r]) if r else set()
+            recall.append(len(found) / len(relevant))
+            rr.append(1 / (hits.index(True) + 1) if True in hits else 0.0)
+        out.update(recall=statistics.mean(recall) if recall else 0.0, mrr=statistics.mean(rr) if rr else 0.0)
+    return out
+
+def summarize(name, latencies, stats, q):
+    pairs = statistics.mean(s.get("reranked", 0) for s in stats)
+    skip_rate = sum(bool(s.get("skipped")) for s in stats) / len(stats)
+    line = (f"{name:28s} p50={statistics.median(latencies) * 1000:7.1f} ms  "
+            f"p95={percentile(latencies, 95) * 1000:7.1f} ms  pairs={pairs:5.1f}  skip={skip_rate:5.1%}  "
+            f"agree@n={q['agreement']:.3f}")
+    if "recall" in q:
+        line += f"  recall@n={q['recall']:.3f}  mrr={q['mrr']:.3f}"
+    print(line)
+    return {"p50_ms": statistics.median(latencies) * 1000, "p95_ms": percentile(latencies, 95) * 1000,
+            "pairs": pairs, "skip_rate": skip_rate, **q}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--labels", help="JSONL with query and relevant sources (default: built-in queries, no labels)")
+    parser.add_argument("--k", type=int, default=30)
+    parser.add_argument("--top-n", type=int, default=5)
+    parser.add_argument("--skip-gap", type=float, nargs="+", default=[0.08])
+    parser.add_argument("--margin", type=float, nargs="+", default=[0.15])
+    parser.add_argument("--json", help="write the results here")
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "stub")  # retrieval only, the LLM is never called
+    import rag_chat
+
+    queries, labels = load_labels(args.labels) if args.labels else (QUERIES, None)
+    rag_chat.get_rag_components()
+    rag_chat.retrieve(queries[0])  # warm up
+
+    policy = rag_chat.reranking
+    policy.mode = "full"
+    reference, latencies, stats = run(rag_chat, queries, args.k, args.top_n)
+    report = {"full": summarize("full", latencies, stats, quality(reference, reference, labels, args.top_n))}
+    full_p50 = report["full"]["p50_ms"]
+
+    policy.mode = "adaptive"
+    for margin in args.margin:
+        for gap in args.skip_gap:
+            policy.margin, policy.skip_gap = margin, gap
+            results, latencies, stats = run(rag_chat, queries, args.k, args.top_n)
+            name = f"adaptive margin={margin} gap={gap}"
+            row = summarize(name, latencies, stats, quality(results, reference, labels, args.top_n))
+            row["latency_saved"] = 1 - row["p50_ms"] / full_p50
+            report[name] = row
+
+    print(json.dumps(rag_chat.rerank_stats(), indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# benchmarks/fixture_site.py
+"""
+Local fixture website for crawler tests and benchmarks.
+
+Serves /robots.txt and a deterministic graph of N HTML pages (each links to
+a few others). Every response is delayed by latency_ms, and pages whose
+number is a multiple of flaky_every answer 503 on their first request, so
+retry/backoff paths get exercised. Pages carry an ETag and answer a matching
+If-None-Match with 304, like a typical CMS behind a cache.
+
+    python benchmarks/fixture_site.py --pages 200 --latency-ms 50 --port 8098
+"""
+import argparse
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PARAGRAPH = (
+    "Applied Technology Schools provide secondary education with a focus on "
+    "engineering, health sciences and information technology. Page {i} covers "
+    "admissions, fees, programmes and campus locations in detail for parents and students."
+)
+
+def make_handler(pages: int, latency_ms: float, flaky_every: int, crawl_delay: float):
+    seen = set()
+    lock = threading.Lock()
+
+    class FixtureHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body: bytes, ctype="text/html; charset=utf-8", headers=None):
+            self.send_response(status)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_page(self, body: bytes):
+            etag = '"%s"' % hashlib.md5(body).hexdigest()
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self._send(200, body, headers={"ETag": etag})
+
+        def page_html(self, i: int) -> bytes:
+            links = "".join(f'<li><a href="/page/{(i * 7 + j) % pages}">Page {(i * 7 + j) % pages}</a></li>'
+                            for j in range(1, 5))
+            paras = "".join(f"<p>{PARAGRAPH.format(i=i)}</p>" for _ in range(5))
+            return (f"<html><head><title>Page {i}</title></head><body>"
+                    f"<nav><ul>{links}</ul></nav><article><h1>Page {i}</h1>{paras}</article>"
+                    f'<a href="/files/brochure{i}.pdf">Brochure</a></body></html>').encode()
+
+        def do_GET(self):
+            time.sleep(latency_ms / 1000)
+            if self.path == "/robots.txt":
+                body = "User-agent: *\nDisallow: /private\n"
+                if crawl_delay:
+                    body += f"Crawl-delay: {crawl_delay}\n"
+                return self._send(200, body.encode(), "text/plain")
+            if self.path in ("", "/"):
+                return self._send_page(self.page_html(0))
+            if self.path.startswith("/page/"):
+                try:
+                    i = int(self.path.rsplit("/", 1)[1])
+                except ValueError:
+                    return self._send(404, b"not found")
+                if not 0 <= i < pages:
+                    return self._send(404, b"not found")
+                with lock:
+                    first = i not in seen
+                    seen.add(i)
+                if flaky_every and i % flaky_every == 0 and i and first:
+                    return self._send(503, b"try again", headers={"Retry-After": "0"})
+                return self._send_page(self.page_html(i))
+            return self._send(404, b"not found")
+
+    return FixtureHandler
+
+def start_fixture_site(pages: int = 100, latency_ms: float = 50.0, flaky_every: int = 10,
+                       crawl_delay: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+    """Start the fixture site in a daemon thread. Returns (server, base_url)."""
+    server = ThreadingHTTPServer((host, port), make_handler(pages, latency_ms, flaky_every, crawl_delay))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Fixture website for crawler tests")
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--flaky-every", type=int, default=10)
+    parser.add_argument("--crawl-delay", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=8098)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(("127.0.0.1", args.port),
+                                 make_handler(args.pages, args.latency_ms, args.flaky_every, args.crawl_delay))
+    print(f"Fixture site on http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# benchmarks/load_test.py
+"""
+Load test for the HTTP answer API (server.py).
+
+Closed loop: at each --concurrency level that many clients send requests
+back to back for --duration seconds. Reported per level: completed
+requests per second, latency p50 / p95 / p99 of the successful ones (time
+to first event for --endpoint stream), and how many were refused with 429
+or timed out in the queue with 503, which is admission control at work
+once the offered load exceeds what the workers can run. A refused client
+waits --backoff seconds before its next request.
+
+Against a running server:
+
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --concurrency 1 8 32 128
+
+or with --spawn, a server with --workers workers is started on a free port
+against a stub LLM (no OpenAI key used) and INDEX_DIR:
+
+    python benchmarks/load_test.py --spawn --workers 4 --concurrency 1 16 64 256
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.bench_async import QUERIES, percentile
+from benchmarks.stub_llm import start_stub_server
+
+PATHS = {"answer": "/v1/answer", "stream": "/v1/answer/stream", "retrieve": "/v1/retrieve"}
+
+def one_request(client, path: str, query: str):
+    """(status, seconds to the answer or, when streaming, to the first event)."""
+    t0 = time.perf_counter()
+    with client.stream("POST", path, json={"query": query}) as resp:
+        if resp.status_code == 200 and path.endswith("/stream"):
+            lines = resp.iter_lines()
+            next(lines, None)
+            latency = time.perf_counter() - t0
+            for _ in lines:
+                pass
+            return resp.status_code, latency
+        resp.read()
+        return resp.status_code, time.perf_counter() - t0
+
+def run_level(url: str, path: str, concurrency: int, duration: float, backoff: float) -> dict:
+    statuses, latencies = Counter(), []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    def client_loop(worker: int):
+        i = worker
+        with httpx.Client(base_url=url, timeout=120.0, limits=limits) as client:
+            while time.perf_counter() < deadline:
+                try:
+                    status, seconds = one_request(client, path, QUERIES[i % len(QUERIES)])
+                except httpx.HTTPError as e:
+                    status, seconds = type(e).__name__, None
+                with lock:
+                    statuses[status] += 1
+                    if status == 200:
+                        latencies.append(seconds)
+                if status in (429, 503):
+                    time.sleep(backoff)  # a well-behaved client backs off instead of retrying at once
+                i += concurrency
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=client_loop, args=(w,)) for w in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    ok = statuses.get(200, 0)
+    row = {"concurrency": concurrency, "ok_rps": ok / elapsed, "statuses": dict(statuses)}
+    if latencies:
+        row.update(p50_ms=percentile(latencies, 50) * 1000, p95_ms=percentile(latencies, 95) * 1000,
+                   p99_ms=percentile(latencies, 99) * 1000)
+    return row
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def spawn_server(args):
+    _, llm_url = start_stub_server(ttft_ms=args.ttft_ms, token_ms=args.token_ms)
+    port = free_port()
+    env = {**os.environ, "OPENAI_BASE_URL": llm_url, "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "stub"),
+           "ANSWER_CACHE_ENABLED": "0", "PYTHONUNBUFFERED": "1"}
+    cmd = [sys.executable, os.path.join(ROOT, "server.py"), "--port", str(port), "--workers", str(args.workers),
+           "--concurrency", str(args.server_concurrency), "--queue", str(args.server_queue)]
+    proc = subprocess.Popen(cmd, env=env, cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    ready = 0
+    for line in proc.stdout:  # every worker prints "ready" once its models are loaded
+        if line.strip().endswith("ready"):
+            ready += 1
+            if ready == args.workers:
+                break
+    if ready < args.workers:
+        raise RuntimeError(f"server exited before all workers were ready ({proc.wait()})")
+    threading.Thread(target=lambda: [None for _ in proc.stdout], daemon=True).start()  # keep draining
+    return proc, f"http://127.0.0.1:{port}"
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--endpoint", choices=list(PATHS), default="answer")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per concurrency level")
+    parser.add_argument("--backoff", type=float, default=0.1, help="seconds a client waits after a 429 / 503")
+    parser.add_argument("--spawn", action="store_true", help="start server.py against a stub LLM")
+    parser.add_argument("--workers", type=int, default=2, help="server workers with --spawn")
+    parser.add_argument("--server-concurrency", type=int, default=8, help="per-worker concurrency with --spawn")
+    parser.add_argument("--server-queue", type=int, default=32, help="per-worker queue with --spawn")
+    parser.add_argument("--ttft-ms", type=float, default=300.0)
+    parser.add_argument("--token-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    proc, url = spawn_server(args) if args.spawn else (None, args.url)
+    try:
+        for c in args.concurrency:
+            row = run_level(url, PATHS[args.endpoint], c, args.duration, args.backoff)
+            lat = (f"p50={row['p50_ms']:8.1f}  p95={row['p95_ms']:8.1f}  p99={row['p99_ms']:8.1f} ms"
+                   if "p50_ms" in row else "no successful requests")
+            refused = {k: v for k, v in row["statuses"].items() if k != 200}
+            print(f"c={c:<5d} ok={row['ok_rps']:7.1f} req/s  {lat}  refused/errors={refused or 0}")
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+if __name__ == "__main__":
+    main()
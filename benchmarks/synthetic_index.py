@@ -0,0 +1,165 @@
+# benchmarks/synthetic_index.py
+"""
+Synthetic kb_index of any size, for benchmarking the serving path offline.
+
+Chunks are generated from per-topic English and Arabic vocabularies (about
+one in four is Arabic), so BM25 and the cross-encoder see text of realistic
+length and shape. Vectors are either clustered random unit vectors, one
+cluster per topic (fast, any size; --vectors random), or the embedder's
+vectors for the generated text (--vectors model, for corpora small enough
+to embed). The directory has the same files build_index.py writes: FAISS
+index, per-language sub-indexes, chunk store, BM25 index and index_meta.json.
+
+    python benchmarks/synthetic_index.py --out /tmp/kb_synth_100k --chunks 100000 --index-type hnsw
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+
+import numpy as np
+import faiss
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ann_index
+import language_index
+from chunk_store import write_chunk_store
+from lexical_index import write_lexical_index
+
+EN_COMMON = ("students", "school", "programme", "year", "campus", "parents", "information", "please", "office",
+             "apply", "semester", "required", "available", "contact", "week", "grade", "teachers", "policy")
+EN_TOPICS = (
+    ("admission", "application", "requirements", "entrance", "assessment", "documents", "deadline", "eligibility"),
+    ("tuition", "fees", "payment", "instalment", "scholarship", "refund", "invoice", "discount"),
+    ("engineering", "curriculum", "courses", "credits", "laboratory", "mathematics", "physics", "elective"),
+    ("health", "sciences", "nursing", "clinical", "biology", "laboratory", "hospital", "internship"),
+    ("cafeteria", "menu", "lunch", "breakfast", "meals", "nutrition", "snacks", "allergies"),
+    ("attendance", "absence", "late", "excuse", "warning", "minutes", "register", "medical"),
+    ("counsellor", "wellbeing", "support", "appointment", "guidance", "career", "mentoring", "confidential"),
+    ("transport", "bus", "route", "pickup", "drivers", "schedule", "morning", "afternoon"),
+    ("uniform", "dress", "shoes", "code", "sports", "badge", "colours", "inspection"),
+    ("examinations", "results", "marks", "certificate", "diploma", "graduation", "transcript", "appeal"),
+)
+AR_COMMON = ("الطلاب", "المدرسة", "البرنامج", "العام", "أولياء", "الأمور", "يرجى", "التواصل")
+AR_TOPICS = (
+    ("القبول", "شروط", "التسجيل", "الوثائق", "اختبار"),
+    ("الرسوم", "الدراسية", "الدفع", "منحة", "القسط"),
+    ("الهندسة", "المناهج", "المقررات", "المختبر", "الرياضيات"),
+    ("الصحة", "التمريض", "المستشفى", "الأحياء", "التدريب"),
+    ("المقصف", "الوجبات", "الغداء", "الإفطار", "التغذية"),
+)
+N_SOURCES = 500
+ARABIC_SHARE = 0.25
+
+def synthetic_texts(n: int, seed: int = 0):
+    """n chunk texts and their topic labels; chunk i's topic is drawn at random."""
+    rng = np.random.default_rng(seed)
+    topics = rng.integers(0, len(EN_TOPICS), size=n)
+    arabic = rng.random(n) < ARABIC_SHARE
+    lengths = rng.integers(60, 160, size=n)
+    texts = []
+    for i in range(n):
+        if arabic[i]:
+            topic, common = AR_TOPICS[topics[i] % len(AR_TOPICS)], AR_COMMON
+        else:
+            topic, common = EN_TOPICS[topics[i]], EN_COMMON
+        pool = topic * 3 + common  # topic words three times as likely as the shared ones
+        words = [pool[j] for j in rng.integers(0, len(pool), size=lengths[i])]
+        sentences = [" ".join(words[s:s + 15]) + "." for s in range(0, len(words), 15)]
+        texts.append(f"Section {i % 97}: " + " ".join(sentences))
+    return texts, topics
+
+def clustered_vectors(topics, dim: int = 384, spread: float = 0.6, seed: int = 0):
+    """float32 unit vectors scattered around one random centre per topic."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((int(topics.max()) + 1, dim)).astype(np.float32)
+    out = np.empty((len(topics), dim), dtype=np.float32)
+    for start in range(0, len(topics), 100_000):
+        rows = topics[start:start + 100_000]
+        block = centres[rows] + spread * rng.standard_normal((len(rows), dim)).astype(np.float32)
+        out[start:start + len(rows)] = block / np.linalg.norm(block, axis=1, keepdims=True)
+    return out
+
+def model_vectors(texts, batch_size: int = 64):
+    import model_backend
+    emb = model_backend.load_embedder("sentence-transformers/all-MiniLM-L6-v2")
+    return np.ascontiguousarray(
+        emb.encode(texts, batch_size=batch_size, show_progress_bar=False, normalize_embeddings=True), dtype=np.float32)
+
+def build_synthetic_index(out_dir: str, n_chunks: int, index_type: str = "flat", vectors: str = "random",
+                          dim: int = 384, seed: int = 0, lexical: bool = True, params: dict = None,
+                          lang_split: bool = True) -> dict:
+    """Write a synthetic index to out_dir. Returns its index_meta."""
+    t0 = time.perf_counter()
+    texts, topics = synthetic_texts(n_chunks, seed)
+    sources = [f"synthetic/doc_{i % N_SOURCES:04d}.txt" for i in range(n_chunks)]
+    if vectors == "model":
+        import model_backend
+        embs = model_vectors(texts)
+        model = model_backend.model_key("sentence-transformers/all-MiniLM-L6-v2")
+    else:
+        embs = clustered_vectors(topics, dim, seed=seed)
+        model = f"synthetic-random-{dim}d"
+    t_gen = time.perf_counter()
+
+    ids = np.arange(n_chunks, dtype=np.int64)
+    index, params = ann_index.build_index(embs, index_type, params, ids=ids, seed=seed)
+    os.makedirs(out_dir, exist_ok=True)
+    faiss.write_index(index, os.path.join(out_dir, "faiss.index"))
+    write_chunk_store(out_dir, texts, sources, ids=ids)
+    if lexical:
+        write_lexical_index(out_dir, texts, ids)
+    languages = None
+    if lang_split:
+        langs = np.asarray(language_index.chunk_languages(texts))
+        indexes, lang_meta = {}, {}
+        for lang in language_index.LANGUAGES:
+            rows = np.flatnonzero(langs == lang)
+            lang_type = index_type if len(rows) >= 256 else "flat"  # IVF-PQ needs 2**pq_bits vectors
+            indexes[lang], lang_params = ann_index.build_index(embs[rows], lang_type, {**params, "nlist": 0},
+                                                               ids=ids[rows], seed=seed)
+            lang_meta[lang] = {"index_type": lang_type, "build_params": lang_params,
+                               "search_params": ann_index.search_params(lang_type, lang_params),
+                               "model": "sentence-transformers/all-MiniLM-L6-v2", "model_key": model}
+        language_index.write_language_indexes(out_dir, indexes, lang_meta)
+        languages = {lang: int(index.ntotal) for lang, index in indexes.items()}
+    meta = {
+        "index_type": index_type,
+        "metric": "inner_product",
+        "dim": int(index.d),
+        "ntotal": int(index.ntotal),
+        "model": model,
+        "build_params": params,
+        "search_params": ann_index.search_params(index_type, params),
+        "languages": languages,
+        "synthetic": {"chunks": n_chunks, "vectors": vectors, "seed": seed, "lexical": lexical,
+                      "generate_seconds": round(t_gen - t0, 2),
+                      "build_seconds": round(time.perf_counter() - t_gen, 2)},
+        "built_at": datetime.datetime.now().isoformat(timespec="seconds"),
+    }
+    ann_index.write_meta(out_dir, meta)
+    return meta
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic kb_index for benchmarks")
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--chunks", type=int, default=10_000)
+    parser.add_argument("--index-type", choices=ann_index.INDEX_TYPES, default="flat")
+    parser.add_argument("--vectors", choices=["random", "model"], default="random",
+                        help="clustered random vectors, or embeddings of the generated text")
+    parser.add_argument("--dim", type=int, default=384, help="vector size for --vectors random")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-lexical", action="store_true", help="skip the BM25 index")
+    parser.add_argument("--no-lang-split", action="store_true", help="skip the per-language sub-indexes")
+    args = parser.parse_args()
+
+    meta = build_synthetic_index(args.out, args.chunks, args.index_type, args.vectors, args.dim, args.seed,
+                                 lexical=not args.no_lexical, lang_split=not args.no_lang_split)
+    s = meta["synthetic"]
+    print(f"{args.out}: {meta['ntotal']} chunks, {meta['index_type']} index, {s['vectors']} vectors "
+          f"(generated in {s['generate_seconds']} s, built in {s['build_seconds']} s)")
+
+if __name__ == "__main__":
+    main()
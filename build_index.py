@@ -1,109 +1,710 @@
 import os
 import glob
 import re
+import json
+import argparse
+import datetime
+import hashlib
+import io
+import queue
+import threading
+import contextlib
+import functools
+import shutil
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
 import faiss
 from openpyxl import load_workbook
 from docx import Document
+from docx.table import Table
+from docx.text.paragraph import Paragraph
 from bs4 import BeautifulSoup
+from chunk_store import (PARENT_IDS_FILE, ChunkStore, has_chunk_store, remove_parent_store, write_chunk_store,
+                         write_parent_store)
+from chunking import CHILD_MAX_WORDS, MODES, PARENT_MAX_WORDS, Chunker, ParentSpans, size_stats, table_blocks, text_blocks
+import ann_index
+import dedup
+import index_generations
+import language_index
+import lexical_index
+import model_backend
+from embedding_cache import EmbeddingCache
 
 load_dotenv()
 DATA_DIR = os.getenv("DATA_DIR", "./data")
 INDEX_DIR = os.getenv("INDEX_DIR", "./kb_index")
+INDEX_TYPE = os.getenv("INDEX_TYPE", "flat")
+BUILD_WORKERS = int(os.getenv("BUILD_WORKERS", str(os.cpu_count() or 1)))
+EMBED_BATCH_CHUNKS = 256  # chunks handed to the embedder thread at a time
+EMB_CACHE_DIR = os.getenv("EMB_CACHE_DIR", "./emb_cache")
+EMB_CACHE_MAX_ENTRIES = int(os.getenv("EMB_CACHE_MAX_ENTRIES", "1000000"))
 os.makedirs(INDEX_DIR, exist_ok=True)
 
-EMB = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-
-# FIXED: Use word count, not char count
-def chunk_text(text: str, max_words: int = 500, overlap: int = 50):
-    if not text or not text.strip():
-        return []
-    words = text.split()
-    if len(words) <= max_words:
-        return [text]
-    
-    chunks = []
-    i = 0
-    while i < len(words):
-        chunk_words = words[i:i + max_words]
-        chunk = " ".join(chunk_words)
-        chunks.append(chunk)
-        i += max_words - overlap
-        if i >= len(words):
-            break
-    return chunks
+EMB_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+CHUNKING = os.getenv("CHUNKING", "structured")
 
-def extract_text(file_path):
-    source = os.path.basename(file_path)
-    text = ""
-    try:
-        ext = file_path.lower().split('.')[-1]
-        print(f"Processing: {source} ({ext})")
-
-        # SKIP PDFs — use .txt only
-        if ext == 'pdf':
-            print("  SKIPPED: .pdf — use convert_pdfs.py first")
-            return [], source
-
-        if ext == 'txt':
-            with open(file_path, 'r', encoding='utf-8') as f:
-                text = f.read()
-            print(f"  TXT chars: {len(text)}, words: {len(text.split())}")
-
-        elif ext == 'xlsx':
-            wb = load_workbook(file_path, data_only=True)
-            lines = []
-            for sheet in wb.worksheets:
-                for row in sheet.iter_rows(values_only=True):
-                    row_text = " | ".join(str(c) if c is not None else "" for c in row)
-                    if row_text.strip():
-                        lines.append(row_text)
-            text = "\n".join(lines)
-            print(f"  XLSX rows: {len(lines)}")
-
-        elif ext == 'docx':
-            doc = Document(file_path)
-            paras = [p.text.strip() for p in doc.paragraphs if p.text.strip()]
-            tables = [cell.text.strip() for table in doc.tables for row in table.rows for cell in row.cells if cell.text.strip()]
-            text = "\n\n".join(paras + tables)
-            print(f"  DOCX paras: {len(paras)}, tables: {len(tables)}")
-
-        elif ext == 'html':
-            with open(file_path, 'r', encoding='utf-8') as f:
-                soup = BeautifulSoup(f, 'html.parser')
-                text = soup.get_text(separator="\n")
-            print(f"  HTML chars: {len(text)}")
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+
+_emb = None
+
+def get_embedder():
+    """Load the embedding model on first use (up-to-date rebuilds never need it)."""
+    global _emb
+    if _emb is None:
+        # Loaded here so extraction worker processes never load torch (or onnxruntime)
+        _emb = model_backend.load_embedder(EMB_MODEL)
+    return _emb
+
+def _docx_blocks(doc):
+    """Paragraphs and tables in document order; headings become the section of what follows."""
+    blocks, section = [], ""
+    n_paras = n_rows = 0
+    for el in doc.element.body.iterchildren():
+        tag = el.tag.rsplit("}", 1)[-1]
+        if tag == "p":
+            para = Paragraph(el, doc)
+            text = para.text.strip()
+            if not text:
+                continue
+            style = (para.style.name if para.style is not None else "") or ""
+            if style.startswith("Heading") or style == "Title":
+                section = text
+            else:
+                blocks.append((section, text))
+                n_paras += 1
+        elif tag == "tbl":
+            rows = []
+            for row in Table(el, doc).rows:
+                cells = []
+                for cell in row.cells:
+                    text = cell.text.strip()
+                    if not cells or text != cells[-1]:  # merged cells repeat their text
+                        cells.append(text)
+                rows.append(cells)
+            blocks.extend(table_blocks(rows, section))
+            n_rows += len(rows)
+    print(f"  DOCX paras: {n_paras}, table rows: {n_rows}")
+    return blocks
+
+HTML_HEADINGS = ("h1", "h2", "h3", "h4", "h5", "h6")
+HTML_BLOCKS = HTML_HEADINGS + ("p", "li", "tr", "pre", "blockquote", "dt", "dd", "caption")
 
+def _html_blocks(soup):
+    """Block elements in document order; falls back to lines when most text sits outside them."""
+    blocks, section = [], ""
+    for el in soup.find_all(HTML_BLOCKS):
+        if el.find(HTML_BLOCKS):  # the nested blocks are visited on their own
+            continue
+        if el.name == "tr":
+            text = " | ".join(c.get_text(" ", strip=True) for c in el.find_all(["th", "td"]))
         else:
-            print(f"  SKIPPED: unsupported format")
-            return [], source
+            text = el.get_text(" ", strip=True)
+        if not text:
+            continue
+        if el.name in HTML_HEADINGS:
+            section = text
+        else:
+            blocks.append((section, text))
+    full_text = soup.get_text(separator="\n")
+    covered = sum(len(t.split()) for _, t in blocks)
+    if covered < 0.5 * len(full_text.split()):
+        blocks = text_blocks(full_text)
+    print(f"  HTML chars: {len(full_text)}, blocks: {len(blocks)}")
+    return blocks
+
+def extract_blocks(file_path):
+    """(blocks, source) of a data file, blocks being (section, text) pairs in document order
+    (None for skipped formats)."""
+    source = os.path.basename(file_path)
+    blocks = []
+    ext = file_path.lower().split('.')[-1]
+    print(f"Processing: {source} ({ext})")
+
+    # SKIP PDFs — use .txt only
+    if ext == 'pdf':
+        print("  SKIPPED: .pdf — use convert_pdfs.py first")
+        return None, source
+
+    if ext == 'txt':
+        with open(file_path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        print(f"  TXT chars: {len(text)}, words: {len(text.split())}")
+        blocks = text_blocks(text)
+
+    elif ext == 'xlsx':
+        wb = load_workbook(file_path, data_only=True)
+        n_rows = 0
+        for sheet in wb.worksheets:
+            rows = [[str(c) if c is not None else "" for c in row] for row in sheet.iter_rows(values_only=True)]
+            sheet_blocks = table_blocks(rows, sheet.title)
+            blocks.extend(sheet_blocks)
+            n_rows += len(sheet_blocks)
+        print(f"  XLSX rows: {n_rows}")
 
-        if not text.strip():
+    elif ext == 'docx':
+        blocks = _docx_blocks(Document(file_path))
+
+    elif ext == 'html':
+        with open(file_path, 'r', encoding='utf-8') as f:
+            blocks = _html_blocks(BeautifulSoup(f, 'html.parser'))
+
+    else:
+        print(f"  SKIPPED: unsupported format")
+        return None, source
+    return blocks, source
+
+def extract_text(file_path, chunker: Chunker = None):
+    """Chunks of a data file: (children, source, parent_of, parents); the last two are None in fixed mode."""
+    chunker = chunker or Chunker(CHUNKING)
+    source = os.path.basename(file_path)
+    try:
+        blocks, source = extract_blocks(file_path)
+        if blocks is None:
+            return [], source, None, None
+        if not any(text.strip() for _, text in blocks):
             print(f"  WARNING: empty content")
-            return [], source
+            return [], source, None, None
 
-        chunks = chunk_text(text)
-        print(f"  → {len(chunks)} chunks created")
-        return chunks, source
+        chunks, parent_of, parents = chunker.split(blocks)
+        if parents is None:
+            print(f"  → {len(chunks)} chunks created")
+        else:
+            print(f"  → {len(chunks)} chunks created in {len(parents)} parent spans")
+        return chunks, source, parent_of, parents
 
     except Exception as e:
         print(f"  ERROR: {e}")
-        return [], source
+        return [], source, None, None
 
-def main():
-    print(f"Scanning {DATA_DIR}...")
-    files = sorted(glob.glob(os.path.join(DATA_DIR, "*")))
-    print(f"Found {len(files)} files\n")
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Build the Manara knowledge-base index")
+    p.add_argument("--full", action="store_true",
+                   help="ignore the manifest and rebuild everything from scratch")
+    p.add_argument("--workers", type=int, default=BUILD_WORKERS,
+                   help="extraction processes (default: $BUILD_WORKERS or CPU count; 1 = serial)")
+    p.add_argument("--changes",
+                   help="crawl_site.py changes file: only files listed there are re-checked against the manifest")
+    p.add_argument("--no-emb-cache", action="store_true", help="do not use the persistent embedding cache")
+    p.add_argument("--gc-emb-cache", action="store_true",
+                   help="drop cached embeddings of chunks that are no longer in the index")
+    p.add_argument("--no-dedup", action="store_true", help="embed near-duplicate chunks instead of dropping them")
+    p.add_argument("--dedup-threshold", type=float, default=dedup.DEFAULT_THRESHOLD,
+                   help="estimated Jaccard similarity at which a chunk counts as a near-duplicate")
+    p.add_argument("--minhash-perms", type=int, default=dedup.DEFAULT_NUM_PERM, help="MinHash signature length")
+    p.add_argument("--shingle-words", type=int, default=dedup.DEFAULT_SHINGLE, help="words per shingle")
+    p.add_argument("--chunking", choices=MODES, default=CHUNKING,
+                   help="structured: small children indexed, parent spans for the LLM (default: $CHUNKING or "
+                        "structured); fixed: 500-word windows")
+    p.add_argument("--child-words", type=int, default=CHILD_MAX_WORDS, help="max words of an indexed child chunk")
+    p.add_argument("--parent-words", type=int, default=PARENT_MAX_WORDS, help="max words of a parent span")
+    p.add_argument("--no-lexical", action="store_true",
+                   help="do not build the BM25 index used for hybrid retrieval (queries fall back to dense-only)")
+    p.add_argument("--no-lang-split", action="store_true",
+                   help="do not build the per-language sub-indexes used to route Arabic/English queries")
+    p.add_argument("--index-type", choices=ann_index.INDEX_TYPES, default=INDEX_TYPE,
+                   help="FAISS index type (default: $INDEX_TYPE or flat)")
+    d = ann_index.DEFAULT_PARAMS
+    p.add_argument("--hnsw-m", type=int, default=d["hnsw_m"], help="HNSW graph degree M")
+    p.add_argument("--ef-construction", type=int, default=d["ef_construction"])
+    p.add_argument("--ef-search", type=int, default=d["ef_search"], help="HNSW search beam width")
+    p.add_argument("--nlist", type=int, default=d["nlist"], help="IVF lists (0 = auto from corpus size)")
+    p.add_argument("--nprobe", type=int, default=d["nprobe"], help="IVF lists probed per query")
+    p.add_argument("--pq-m", type=int, default=d["pq_m"], help="IVF-PQ sub-quantizers (must divide dim)")
+    p.add_argument("--pq-bits", type=int, default=d["pq_bits"])
+    p.add_argument("--train-size", type=int, default=d["train_size"], help="max IVF training sample")
+    p.add_argument("--eval-queries", help="text file with one held-out query per line for the report")
+    p.add_argument("--eval-size", type=int, default=200,
+                   help="held-out chunk vectors used as queries when --eval-queries is not given")
+    p.add_argument("--report-k", type=int, default=10)
+    p.add_argument("--compare", action="store_true",
+                   help="also build and report every index type, not just the selected one")
+    return p.parse_args(argv)
+
+def index_params(args):
+    return {
+        "hnsw_m": args.hnsw_m,
+        "ef_construction": args.ef_construction,
+        "ef_search": args.ef_search,
+        "nlist": args.nlist,
+        "nprobe": args.nprobe,
+        "pq_m": args.pq_m,
+        "pq_bits": args.pq_bits,
+        "train_size": args.train_size,
+    }
+
+def build_settings(args):
+    """Everything that, when changed, invalidates the existing vectors or index structure."""
+    params = index_params(args)
+    for search_only in ("ef_search", "nprobe"):
+        params.pop(search_only)
+    return {
+        "model": model_backend.model_key(EMB_MODEL),
+        "index_type": args.index_type,
+        "build_params": params,
+        "chunking": make_chunker(args).settings(),
+        "dedup": None if args.no_dedup else {
+            "threshold": args.dedup_threshold, "num_perm": args.minhash_perms, "shingle": args.shingle_words},
+        "languages": None if args.no_lang_split else {
+            lang: model_backend.model_key(language_index.embedding_model(lang, EMB_MODEL))
+            for lang in language_index.LANGUAGES},
+    }
+
+def make_chunker(args):
+    return Chunker(args.chunking, args.child_words, args.parent_words)
+
+def make_dedup_index(args):
+    if args.no_dedup:
+        return None
+    return dedup.NearDupIndex(dedup.MinHasher(args.minhash_perms, args.shingle_words), args.dedup_threshold)
+
+def file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def load_manifest(index_dir):
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+def save_manifest(index_dir, manifest):
+    tmp = os.path.join(index_dir, MANIFEST_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, ensure_ascii=False)
+    os.replace(tmp, os.path.join(index_dir, MANIFEST_FILE))
+
+def load_changed_names(path):
+    """Names of the files a crawl changed or deleted, from crawl_site.py's changes file."""
+    with open(path, "r", encoding="utf-8") as f:
+        changes = json.load(f)
+    return set(changes["changed"]) | set(changes["deleted"])
+
+def scan_files(files, old_files, only=None):
+    """
+    Content hash of every data file; files whose size and mtime match the
+    manifest are not re-read. With only (a set of names), other files already
+    in the manifest are trusted without even a stat.
+    """
+    current = {}
+    for path in files:
+        name = os.path.basename(path)
+        old = old_files.get(name)
+        if old and only is not None and name not in only:
+            current[name] = {"path": path, "hash": old["hash"], "size": old["size"], "mtime_ns": old["mtime_ns"]}
+            continue
+        st = os.stat(path)
+        if old and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+            digest = old["hash"]
+        else:
+            digest = file_hash(path)
+        current[name] = {"path": path, "hash": digest, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    return current
+
+def _extract_signed(file_path, hasher=None, chunker=None):
+    """extract_text plus the MinHash signatures of the chunks (None without a hasher)."""
+    chunks, source, parent_of, parents = extract_text(file_path, chunker)
+    return chunks, source, hasher.signatures(chunks) if hasher else None, parent_of, parents
+
+def _extract_logged(file_path, hasher=None, chunker=None):
+    """_extract_signed in a worker process; its log lines are returned so they print in file order."""
+    buf = io.StringIO()
+    with contextlib.redirect_stdout(buf):
+        result = _extract_signed(file_path, hasher, chunker)
+    return result + (buf.getvalue(),)
+
+def iter_extracted(paths, workers: int, hasher=None, chunker=None):
+    """Yield (chunks, source, signatures, parent_of, parents) per path, in input order, extracting on a process pool."""
+    if workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield _extract_signed(path, hasher, chunker)
+        return
+
+    # spawn: workers must not inherit a half-initialised torch from the embedder thread
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(workers, len(paths)), mp_context=ctx) as pool:
+        extract = functools.partial(_extract_logged, hasher=hasher, chunker=chunker)
+        for *result, log in pool.map(extract, paths):
+            print(log, end="")
+            yield tuple(result)
+
+def _encode(chunks):
+    embs = get_embedder().encode(chunks, batch_size=32, show_progress_bar=False, normalize_embeddings=True)
+    return np.ascontiguousarray(embs, dtype=np.float32)
+
+class EmbeddingPipeline:
+    """Embeds chunk batches on a background thread while extraction keeps producing them.
+
+    With an EmbeddingCache, only chunks whose text is not cached reach the model.
+    """
+
+    def __init__(self, cache: EmbeddingCache = None, max_pending: int = 4):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._results = []
+        self._error = None
+        self.cache = cache
+        self.model_calls = 0
+        self._thread = threading.Thread(target=self._run, name="embedder", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            if self._error is not None:
+                continue
+            try:
+                if self.cache is None:
+                    self.model_calls += 1
+                    self._results.append(_encode(batch))
+                else:
+                    self._results.append(self.cache.encode(batch, self._encode_misses))
+            except Exception as e:
+                self._error = e
+
+    def _encode_misses(self, chunks):
+        self.model_calls += 1
+        return _encode(chunks)
+
+    def submit(self, chunks):
+        if chunks:
+            self._queue.put(list(chunks))
+
+    def finish(self):
+        """Wait for all batches and return the embeddings in submission order."""
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        if not self._results:
+            return None
+        return np.concatenate(self._results)
+
+def extract_and_embed(names, current, next_id: int, workers: int = BUILD_WORKERS, cache: EmbeddingCache = None,
+                      near_dups: dedup.NearDupIndex = None, chunker: Chunker = None, parents: ParentSpans = None):
+    """Extract, chunk and embed files, assigning consecutive chunk ids from next_id.
+
+    Extraction runs on a process pool and results are consumed in file order,
+    so chunk order and ids are deterministic. Chunks stream into the embedder
+    thread in batches, overlapping embedding with extraction.
+
+    With near_dups (seeded with the chunks already indexed, if any), a chunk
+    that near-duplicates an indexed or earlier chunk is neither embedded nor
+    stored; file_dups maps each file to the canonical chunk ids it reuses.
+
+    With structured chunking, the parent span of every stored chunk is added
+    to parents (new parent ids, linked to the chunk id).
+    """
+    texts, sources, ids, sigs = [], [], [], []
+    file_ids, file_dups = {}, {}
+    pipeline = EmbeddingPipeline(cache)
+    pending = []
+    hasher = near_dups.hasher if near_dups is not None else None
+    if names:
+        print("Extracting and embedding...")
+    paths = [current[n]["path"] for n in names]
+    extracted = iter_extracted(paths, workers, hasher, chunker)
+    for name, (chunks, source, chunk_sigs, parent_of, file_parents) in zip(names, extracted):
+        file_ids[name], file_dups[name] = [], []
+        parent_ids = {}  # parent position in the file -> parent id, for parents with a stored chunk
+        for j, chunk in enumerate(chunks):
+            if near_dups is not None:
+                canonical = near_dups.find(chunk_sigs[j])
+                if canonical is not None:
+                    file_dups[name].append(canonical)
+                    continue
+                near_dups.add(next_id, chunk_sigs[j])
+                sigs.append(chunk_sigs[j])
+            if parents is not None and file_parents is not None:
+                if parent_of[j] not in parent_ids:
+                    parent_ids[parent_of[j]] = parents.new_id(file_parents[parent_of[j]], source)
+                parents.link(next_id, parent_ids[parent_of[j]])
+            file_ids[name].append(next_id)
+            ids.append(next_id)
+            next_id += 1
+            texts.append(chunk)
+            sources.append(source)
+            pending.append(chunk)
+        if len(pending) >= EMBED_BATCH_CHUNKS:
+            pipeline.submit(pending)
+            pending = []
+    pipeline.submit(pending)
+    embs = pipeline.finish()
+    if names:
+        print(f"Embedding model calls: {pipeline.model_calls}")
+        if near_dups is not None:
+            dropped = sum(len(d) for d in file_dups.values())
+            print(f"Near-duplicate chunks skipped: {dropped} of {dropped + len(texts)}")
+    sigs = np.asarray(sigs, dtype=np.uint32).reshape(-1, hasher.num_perm) if hasher else None
+    return texts, sources, ids, sigs, file_ids, file_dups, next_id, embs
+
+def file_entry(current, name, ids, dups):
+    return {**{k: v for k, v in current[name].items() if k != "path"}, "ids": ids, "dups": dups}
 
-    all_chunks = []
-    all_sources = []
+def also_in_sources(files):
+    """{canonical chunk id: [other files whose near-duplicate chunks it replaced]} from the manifest."""
+    owner = {cid: name for name, entry in files.items() for cid in entry["ids"]}
+    also_in = {}
+    for name, entry in sorted(files.items()):
+        for cid in entry.get("dups", []):
+            if owner.get(cid) != name and name not in also_in.setdefault(cid, []):
+                also_in[cid].append(name)
+    return also_in
 
-    for file_path in files:
-        chunks, source = extract_text(file_path)
-        all_chunks.extend(chunks)
-        all_sources.extend([source] * len(chunks))
+def dedup_summary(files, n_chunks: int, args) -> dict:
+    if args.no_dedup:
+        return {}
+    dropped = sum(len(entry.get("dups", [])) for entry in files.values())
+    total = n_chunks + dropped
+    summary = {"threshold": args.dedup_threshold, "chunks_before": total, "chunks_after": n_chunks,
+               "shrinkage": round(dropped / total, 4) if total else 0.0}
+    print(f"Index shrinkage from near-duplicate removal: {total} → {n_chunks} chunks "
+          f"(-{100 * summary['shrinkage']:.1f}%)")
+    return summary
+
+def chunking_summary(texts, parents, args) -> dict:
+    summary = {**make_chunker(args).settings(), "chunks": size_stats(texts)}
+    if parents is not None:
+        summary["parents"] = size_stats(parents.texts)
+    print(f"Chunk sizes: {summary['chunks']}")
+    return summary
+
+def eval_holdout(n: int, args):
+    """Rows held out of IVF training to serve as report queries.
+
+    At most a fifth of the corpus, and never so many that too few rows are
+    left to train the selected index type, so the two sets stay disjoint.
+    """
+    need = ann_index.min_train_size(args.index_type, index_params(args), n)
+    size = max(0, min(args.eval_size, n // 5, n - need))
+    if size < min(args.eval_size, n // 5):
+        print(f"Evaluation holdout reduced to {size} rows to leave {need} for training")
+    return np.sort(np.random.default_rng(0).choice(n, size, replace=False))
+
+def index_report(embs, index, args, params, holdout):
+    """Compare the built index (and optionally all types) against exact search.
+
+    Each row's trained_on_holdout is true when its index had to train on the
+    query rows too (too small a corpus), which makes its recall optimistic.
+    """
+    if args.eval_queries:
+        with open(args.eval_queries, "r", encoding="utf-8") as f:
+            lines = [ln.strip() for ln in f if ln.strip()]
+        queries = get_embedder().encode(lines, batch_size=32, normalize_embeddings=True)
+    else:
+        queries = embs[holdout]
+    if not len(queries):
+        return {}
+
+    exact = faiss.IndexFlatIP(embs.shape[1])
+    exact.add(embs)
+    rows = {"flat": ann_index.evaluate_index(exact, exact, queries, args.report_k)}
+    rows[args.index_type] = ann_index.evaluate_index(index, exact, queries, args.report_k)
+    rows[args.index_type]["trained_on_holdout"] = bool(params.get("trained_on_holdout"))
+
+    if args.compare:
+        for other in ann_index.INDEX_TYPES:
+            if other in rows:
+                continue
+            try:
+                other_params = {k: v for k, v in params.items() if k != "trained_on_holdout"}
+                other_index, other_params = ann_index.build_index(embs, other, other_params, holdout=holdout)
+                rows[other] = ann_index.evaluate_index(other_index, exact, queries, args.report_k)
+                rows[other]["trained_on_holdout"] = bool(other_params.get("trained_on_holdout"))
+            except ValueError as e:
+                print(f"  {other}: skipped ({e})")
+
+    ann_index.print_report(rows)
+    return rows
+
+def write_index_files(index_dir, index, texts, sources, ids, sigs, args, params, manifest, parents=None, languages=None):
+    """Write faiss.index, the chunk and parent stores, signatures, BM25 index, language sub-indexes,
+    manifest and index metadata into index_dir, an unpublished generation (see index_generations.py)."""
+    index_tmp = os.path.join(index_dir, "faiss.index.tmp")
+    faiss.write_index(index, index_tmp)
+    os.replace(index_tmp, os.path.join(index_dir, "faiss.index"))
+    parent_ids = None
+    if parents is not None:
+        order = sorted(range(len(parents.ids)), key=lambda j: parents.ids[j])
+        write_parent_store(index_dir, [parents.texts[j] for j in order], [parents.sources[j] for j in order],
+                           [parents.ids[j] for j in order])
+        parent_ids = [parents.chunk_parent[int(cid)] for cid in ids]
+        manifest["next_parent_id"] = parents.next_id
+    else:
+        remove_parent_store(index_dir)
+    write_chunk_store(index_dir, texts, sources, ids, also_in=also_in_sources(manifest["files"]), parent_ids=parent_ids)
+    if sigs is not None:
+        dedup.write_signatures(index_dir, sigs)
+    elif os.path.exists(os.path.join(index_dir, dedup.SIGNATURES_FILE)):
+        os.remove(os.path.join(index_dir, dedup.SIGNATURES_FILE))
+    update_lexical_index(index_dir, texts, ids, args)
+    if languages is None:
+        language_index.remove_language_indexes(index_dir)
+    else:
+        language_index.write_language_indexes(index_dir, *languages)
+
+    # The chunk store replaces the old pickled arrays
+    for legacy in ("texts.npy", "sources.npy"):
+        legacy_path = os.path.join(index_dir, legacy)
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+
+    save_manifest(index_dir, manifest)
+    ann_index.write_meta(index_dir, {
+        "index_type": args.index_type,
+        "metric": "inner_product",
+        "dim": int(index.d),
+        "ntotal": int(index.ntotal),
+        "model": model_backend.model_key(EMB_MODEL),
+        "build_params": params,
+        "search_params": ann_index.search_params(args.index_type, params),
+        "dedup": dedup_summary(manifest["files"], len(texts), args),
+        "chunking": chunking_summary(texts, parents, args),
+        "languages": {lang: int(lang_index.ntotal) for lang, lang_index in languages[0].items()} if languages else None,
+        "built_at": datetime.datetime.now().isoformat(timespec="seconds"),
+    })
+
+def update_search_params(index_dir, args, params):
+    """Rewrite the search-time parameters in index_meta.json and languages.json, for an unchanged corpus."""
+    meta = ann_index.read_meta(index_dir)
+    meta["build_params"], meta["search_params"] = with_search_params(
+        meta.get("index_type", args.index_type), params, args)
+    ann_index.write_meta(index_dir, meta)
+    lang_meta = language_index.read_language_meta(index_dir)
+    for entry in lang_meta.values():
+        entry["build_params"], entry["search_params"] = with_search_params(
+            entry["index_type"], entry["build_params"], args)
+    if lang_meta:
+        language_index.write_language_meta(index_dir, lang_meta)
+    print(f"Search parameters updated: {meta['search_params']}")
+
+def update_lexical_index(index_dir, texts, ids, args):
+    """Rewrite the BM25 index over the chunks now in the store (it is cheap next to embedding)."""
+    if args.no_lexical:
+        lexical_index.remove_lexical_index(index_dir)
+        return
+    n_terms = lexical_index.write_lexical_index(index_dir, texts, ids)
+    print(f"BM25 index: {len(texts)} chunks, {n_terms} terms")
+
+_lang_embedders = {}
+
+def language_vectors(lang, texts, embs, args):
+    """Vectors of a language's chunks for its sub-index: embs, unless the language has its own model."""
+    model = language_index.embedding_model(lang, EMB_MODEL)
+    if model == EMB_MODEL:
+        return embs
+    if model not in _lang_embedders:
+        _lang_embedders[model] = model_backend.load_embedder(model)
+    encode = lambda chunks: np.ascontiguousarray(_lang_embedders[model].encode(
+        chunks, batch_size=32, show_progress_bar=False, normalize_embeddings=True), dtype=np.float32)
+    if args.no_emb_cache:
+        return encode(texts)
+    cache = EmbeddingCache(EMB_CACHE_DIR, model_backend.model_key(model), normalize=True,
+                           max_entries=EMB_CACHE_MAX_ENTRIES)
+    return cache.encode(texts, encode)
+
+def _language_rows(texts):
+    langs = language_index.chunk_languages(texts)
+    return {lang: [r for r, chunk_lang in enumerate(langs) if chunk_lang == lang] for lang in language_index.LANGUAGES}
+
+def _build_language_index(lang, vecs, ids, args, params):
+    """A language's sub-index, of the main index type with lists sized for its own chunks."""
+    lang_params = {**params, "nlist": 0}
+    try:
+        index, lang_params = ann_index.build_index(vecs, args.index_type, lang_params, ids=ids)
+        index_type = args.index_type
+    except ValueError as e:  # e.g. too few chunks for IVF-PQ
+        print(f"  {lang} sub-index: {e}; using flat")
+        index, lang_params = ann_index.build_index(vecs, "flat", lang_params, ids=ids)
+        index_type = "flat"
+    return index, index_type, lang_params
+
+def with_search_params(index_type, build_params, args):
+    """(build params, search params) of an existing index with the current --ef-search / --nprobe."""
+    build_params = {**build_params, "ef_search": args.ef_search, "nprobe": args.nprobe}
+    return build_params, ann_index.search_params(index_type, build_params)
+
+def _language_entry(lang, index_type, lang_params):
+    model = language_index.embedding_model(lang, EMB_MODEL)
+    return {"index_type": index_type, "build_params": lang_params,
+            "search_params": ann_index.search_params(index_type, lang_params),
+            "model": model, "model_key": model_backend.model_key(model)}
+
+def build_language_indexes(texts, ids, embs, args, params):
+    """(indexes, meta) of the per-language sub-indexes over all chunks, or None with --no-lang-split."""
+    if args.no_lang_split:
+        return None
+    indexes, meta = {}, {}
+    ids = np.asarray(ids, dtype=np.int64)
+    for lang, rows in _language_rows(texts).items():
+        if not rows:
+            continue
+        vecs = language_vectors(lang, [texts[r] for r in rows], embs[rows], args)
+        indexes[lang], index_type, lang_params = _build_language_index(lang, vecs, ids[rows], args, params)
+        meta[lang] = _language_entry(lang, index_type, lang_params)
+    print("Language sub-indexes: " + ", ".join(f"{lang} {index.ntotal}" for lang, index in indexes.items()))
+    return indexes, meta
+
+def update_language_indexes(index_dir, stale_ids, new_texts, new_ids, new_embs, args, params):
+    """The sub-indexes with stale ids removed and the new chunks added to their language's index."""
+    if args.no_lang_split:
+        return None
+    old_meta = language_index.read_language_meta(index_dir)
+    indexes, meta = {}, {}
+    new_ids = np.asarray(new_ids, dtype=np.int64)
+    for lang, rows in _language_rows(new_texts).items():
+        index = None
+        if lang in old_meta:
+            entry = old_meta[lang]
+            index = faiss.read_index(os.path.join(index_dir, language_index.index_file(lang)))
+            index = ann_index.remove_ids(index, entry["index_type"], stale_ids, entry["build_params"])
+            meta[lang] = {k: v for k, v in entry.items() if k != "ntotal"}
+            meta[lang]["build_params"], meta[lang]["search_params"] = with_search_params(
+                entry["index_type"], entry["build_params"], args)
+        if rows:
+            vecs = language_vectors(lang, [new_texts[r] for r in rows], new_embs[rows], args)
+            if index is None:
+                index, index_type, lang_params = _build_language_index(lang, vecs, new_ids[rows], args, params)
+                meta[lang] = _language_entry(lang, index_type, lang_params)
+            else:
+                index.add_with_ids(vecs, new_ids[rows])
+        if index is not None and index.ntotal:
+            indexes[lang] = index
+    meta = {lang: meta[lang] for lang in indexes}
+    print("Language sub-indexes: " + ", ".join(f"{lang} {index.ntotal}" for lang, index in indexes.items()))
+    return indexes, meta
+
+def open_embedding_cache(args):
+    if args.no_emb_cache:
+        return None
+    return EmbeddingCache(EMB_CACHE_DIR, model_backend.model_key(EMB_MODEL), normalize=True, max_entries=EMB_CACHE_MAX_ENTRIES)
+
+def finish_embedding_cache(cache, live_texts, args):
+    """Garbage-collect the cache against the chunks now in the index and report its counters."""
+    if cache is None:
+        return
+    removed = cache.gc(live_texts, drop_unused=args.gc_emb_cache)
+    st = cache.stats()
+    print(f"Embedding cache: {st['hits']} hits, {st['misses']} misses, "
+          f"{st['entries']} entries ({removed} collected)")
+
+def full_build(index_dir, args, current):
+    """Build the index set into the empty index_dir; False if there was nothing to index."""
+    names = sorted(current)
+    cache = open_embedding_cache(args)
+    parents = ParentSpans() if args.chunking == "structured" else None
+    all_chunks, all_sources, all_ids, sigs, file_ids, file_dups, next_id, embs = extract_and_embed(
+        names, current, 0, args.workers, cache, make_dedup_index(args), make_chunker(args), parents)
 
     print(f"\nTOTAL CHUNKS: {len(all_chunks)}")
     if all_chunks:
@@ -111,21 +712,172 @@ def main():
 
     if not all_chunks:
         print("No chunks! Run convert_pdfs.py first.")
-        return
+        return False
+
+    holdout = eval_holdout(len(embs), args)
+
+    print(f"Building {args.index_type} index...")
+    index, params = ann_index.build_index(embs, args.index_type, index_params(args), holdout=holdout, ids=all_ids)
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "settings": build_settings(args),
+        "resolved_params": params,
+        "next_id": next_id,
+        "files": {name: file_entry(current, name, file_ids[name], file_dups[name]) for name in names},
+    }
+    languages = build_language_indexes(all_chunks, all_ids, embs, args, params)
+    write_index_files(index_dir, index, all_chunks, all_sources, all_ids, sigs, args, params, manifest, parents,
+                      languages)
+    finish_embedding_cache(cache, all_chunks, args)
+
+    report = index_report(embs, index, args, params, holdout)
+    if report:
+        with open(os.path.join(index_dir, "index_report.json"), "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return True
+
+def incremental_build(index_dir, args, current, manifest):
+    """Update the index set in index_dir, staged from the published one (see index_generations.stage)."""
+    old_files = manifest["files"]
+    added = sorted(n for n in current if n not in old_files)
+    changed = sorted(n for n in current if n in old_files and old_files[n]["hash"] != current[n]["hash"])
+    deleted = sorted(n for n in old_files if n not in current)
+    print(f"Incremental build: {len(added)} new, {len(changed)} changed, {len(deleted)} deleted, "
+          f"{len(current) - len(added) - len(changed)} unchanged")
+
+    # Unchanged files whose near-duplicates point at a chunk that is going away are redone too
+    redo = set(changed)
+    while True:
+        stale = {i for n in redo | set(deleted) for i in old_files[n]["ids"]}
+        dependents = {n for n in current if n in old_files and n not in redo
+                      and stale.intersection(old_files[n].get("dups", []))}
+        if not dependents:
+            break
+        redo |= dependents
+    if len(redo) > len(changed):
+        print(f"  {len(redo) - len(changed)} unchanged files re-deduplicated (their canonical chunks changed)")
+    changed = sorted(redo)
+
+    files = {}
+    for name in current:
+        if name in old_files and name not in changed:
+            files[name] = file_entry(current, name, old_files[name]["ids"], old_files[name].get("dups", []))
+
+    params = {**manifest["resolved_params"], "ef_search": args.ef_search, "nprobe": args.nprobe}
+    if not (added or changed or deleted):
+        manifest["files"] = files  # refresh size/mtime of touched-but-identical files
+        if params != manifest["resolved_params"]:
+            # Search-time parameters need no rebuild, only new metadata
+            update_search_params(index_dir, args, params)
+            manifest["resolved_params"] = params
+        save_manifest(index_dir, manifest)
+        if args.no_lexical == lexical_index.has_lexical_index(index_dir):
+            # Index predates the BM25 files (or they are no longer wanted)
+            store = ChunkStore(index_dir)
+            ids = store.chunk_ids()
+            update_lexical_index(index_dir, [store.texts[cid] for cid in ids], ids, args)
+            store.close()
+        print("Index is up to date.")
+        return True
 
-    print("Embedding...")
-    embs = EMB.encode(all_chunks, batch_size=32, show_progress_bar=True, normalize_embeddings=True)
+    stale_ids = [i for n in changed + deleted for i in old_files[n]["ids"]]
 
-    dim = embs.shape[1]
-    index = faiss.IndexFlatIP(dim)
-    index.add(embs)
+    # 1. Drop vectors of changed/deleted files
+    index = faiss.read_index(os.path.join(index_dir, "faiss.index"))
+    index = ann_index.remove_ids(index, args.index_type, stale_ids, params)
 
-    faiss.write_index(index, os.path.join(INDEX_DIR, "faiss.index"))
-    np.save(os.path.join(INDEX_DIR, "texts.npy"), np.array(all_chunks, dtype=object))
-    np.save(os.path.join(INDEX_DIR, "sources.npy"), np.array(all_sources, dtype=object))
+    # 2. Keep the unchanged chunks (read fully so the store can be rewritten), their signatures
+    # and parent spans
+    store = ChunkStore(index_dir)
+    parents = ParentSpans(manifest.get("next_parent_id", 0)) if args.chunking == "structured" else None
+    stale = set(stale_ids)
+    near_dups = make_dedup_index(args)
+    old_sigs = dedup.read_signatures(index_dir) if near_dups is not None else None
+    kept, kept_sigs, kept_parents = [], [], set()
+    for row, cid in enumerate(store.chunk_ids()):
+        if int(cid) in stale:
+            continue
+        kept.append((int(cid), store.texts[cid], store.sources[cid]))
+        if parents is not None:
+            pid = store.parent_id(cid)
+            if pid not in kept_parents:
+                kept_parents.add(pid)
+                parents.add(pid, store.parents.text(pid), store.parents.source(pid))
+            parents.link(cid, pid)
+        if near_dups is not None:
+            near_dups.add(int(cid), old_sigs[row])
+            kept_sigs.append(old_sigs[row])
+    store.close()
+
+    # 3. Extract, embed and add the new/changed files under fresh ids
+    cache = open_embedding_cache(args)
+    new_texts, new_sources, new_ids, new_sigs, file_ids, file_dups, next_id, embs = extract_and_embed(
+        added + changed, current, manifest["next_id"], args.workers, cache, near_dups, make_chunker(args), parents)
+    if new_texts:
+        index.add_with_ids(embs, np.asarray(new_ids, dtype=np.int64))
+    for name in added + changed:
+        files[name] = file_entry(current, name, file_ids[name], file_dups[name])
+
+    ids = [cid for cid, _, _ in kept] + new_ids
+    texts = [t for _, t, _ in kept] + new_texts
+    sources = [s for _, _, s in kept] + new_sources
+    sigs = None
+    if near_dups is not None:
+        sigs = np.concatenate([np.asarray(kept_sigs, dtype=np.uint32).reshape(-1, args.minhash_perms), new_sigs])
+    print(f"\nTOTAL CHUNKS: {len(texts)} ({len(new_texts)} embedded, {len(stale_ids)} removed)")
+
+    manifest.update({"resolved_params": params, "next_id": next_id, "files": files})
+    languages = update_language_indexes(index_dir, stale_ids, new_texts, new_ids, embs, args, params)
+    write_index_files(index_dir, index, texts, sources, ids, sigs, args, params, manifest, parents, languages)
+    finish_embedding_cache(cache, texts, args)
+    return True
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    print(f"Scanning {DATA_DIR}...")
+    files = sorted(f for f in glob.glob(os.path.join(DATA_DIR, "*")) if os.path.isfile(f))
+    print(f"Found {len(files)} files\n")
+
+    # Builds read the published index set and write a new generation, published once complete
+    published = index_generations.current_dir(INDEX_DIR)
+    manifest = None if args.full else load_manifest(published)
+    if manifest and not index_generations.has_generations(INDEX_DIR):
+        print("Index predates versioned generations; rebuilding from scratch.")
+        manifest = None
+    if manifest and manifest.get("settings") != build_settings(args):
+        print("Build settings changed since the last build; rebuilding from scratch.")
+        manifest = None
+    if manifest and not (os.path.exists(os.path.join(published, "faiss.index")) and has_chunk_store(published)):
+        manifest = None
+    if manifest and not args.no_dedup and not os.path.exists(os.path.join(published, dedup.SIGNATURES_FILE)):
+        manifest = None
+    if manifest and args.chunking == "structured" and not os.path.exists(os.path.join(published, PARENT_IDS_FILE)):
+        manifest = None
+    if manifest and not args.no_lang_split and not language_index.has_language_indexes(published):
+        manifest = None
+
+    only = load_changed_names(args.changes) if args.changes and manifest else None
+    if only is not None:
+        print(f"Checking only the {len(only)} files listed in {args.changes}")
+    current = scan_files(files, manifest["files"] if manifest else {}, only)
+    staged = index_generations.stage(INDEX_DIR, published if manifest else None)
+    try:
+        if manifest:
+            built = incremental_build(staged, args, current, manifest)
+        else:
+            built = full_build(staged, args, current)
+    except BaseException:
+        shutil.rmtree(staged, ignore_errors=True)
+        raise
+    if not built:
+        shutil.rmtree(staged, ignore_errors=True)
+        return
+    index_generations.publish(INDEX_DIR, staged)
 
-    print(f"\nIndex saved to {INDEX_DIR}/")
+    print(f"\nIndex saved to {staged}/")
     print("Build complete!")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
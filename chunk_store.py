@@ -0,0 +1,245 @@
+# chunk_store.py
+"""
+Compact, memory-mapped chunk store.
+
+Layout inside the index directory:
+    chunks.bin          all chunk texts as one UTF-8 blob
+    chunk_offsets.npy   uint64 byte offsets, len = n_chunks + 1
+    chunk_sources.npy   uint32 id into sources.json, one per chunk
+    sources.json        interned table of source names
+    chunk_ids.npy       optional sorted int64 chunk ids (FAISS ids of
+                        incrementally built indexes); absent = row number
+    chunk_also_in.json  optional {chunk id: [other sources]} for chunks whose
+                        near-duplicates in other files were dropped
+    chunk_parents.npy   optional int64 parent id per chunk (small-to-big
+                        chunking); the parents are a chunk store of their
+                        own in parents/, keyed by parent id
+
+Readers mmap the blob and offsets, so worker processes share the page cache
+and a chunk is only decoded when it is actually returned by a search.
+"""
+import os
+import sys
+import json
+import mmap
+import numpy as np
+
+BLOB_FILE = "chunks.bin"
+OFFSETS_FILE = "chunk_offsets.npy"
+SOURCE_IDS_FILE = "chunk_sources.npy"
+SOURCES_FILE = "sources.json"
+IDS_FILE = "chunk_ids.npy"
+ALSO_IN_FILE = "chunk_also_in.json"
+PARENT_IDS_FILE = "chunk_parents.npy"
+PARENTS_DIR = "parents"
+
+def has_chunk_store(index_dir: str) -> bool:
+    return all(os.path.exists(os.path.join(index_dir, f)) for f in (BLOB_FILE, OFFSETS_FILE, SOURCE_IDS_FILE, SOURCES_FILE))
+
+def write_chunk_store(index_dir: str, texts, sources, ids=None, also_in=None, parent_ids=None):
+    """Write texts/sources as a chunk store. Each file is replaced atomically, but not the
+    store as a whole: write into an unpublished directory (index_generations.stage).
+
+    ids, if given, are the strictly increasing chunk ids of the rows; also_in
+    maps a chunk id to the further sources it stands for; parent_ids gives
+    each row's parent id (see write_parent_store).
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    if len(texts) != len(sources):
+        raise ValueError(f"texts ({len(texts)}) and sources ({len(sources)}) differ in length")
+    if ids is not None:
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) != len(texts):
+            raise ValueError(f"ids ({len(ids)}) and texts ({len(texts)}) differ in length")
+        if len(ids) > 1 and not np.all(np.diff(ids) > 0):
+            raise ValueError("chunk ids must be strictly increasing")
+
+    table = {}
+    source_ids = np.empty(len(sources), dtype=np.uint32)
+    for i, src in enumerate(sources):
+        source_ids[i] = table.setdefault(str(src), len(table))
+
+    offsets = np.empty(len(texts) + 1, dtype=np.uint64)
+    offsets[0] = 0
+    blob_tmp = os.path.join(index_dir, BLOB_FILE + ".tmp")
+    with open(blob_tmp, "wb") as f:
+        pos = 0
+        for i, txt in enumerate(texts):
+            data = str(txt).encode("utf-8")
+            f.write(data)
+            pos += len(data)
+            offsets[i + 1] = pos
+
+    offsets_tmp = os.path.join(index_dir, OFFSETS_FILE + ".tmp")
+    ids_tmp = os.path.join(index_dir, SOURCE_IDS_FILE + ".tmp")
+    sources_tmp = os.path.join(index_dir, SOURCES_FILE + ".tmp")
+    with open(offsets_tmp, "wb") as f:
+        np.save(f, offsets)
+    with open(ids_tmp, "wb") as f:
+        np.save(f, source_ids)
+    with open(sources_tmp, "w", encoding="utf-8") as f:
+        json.dump(list(table), f, ensure_ascii=False)
+
+    files = [(BLOB_FILE, blob_tmp), (OFFSETS_FILE, offsets_tmp), (SOURCE_IDS_FILE, ids_tmp), (SOURCES_FILE, sources_tmp)]
+    if ids is not None:
+        chunk_ids_tmp = os.path.join(index_dir, IDS_FILE + ".tmp")
+        with open(chunk_ids_tmp, "wb") as f:
+            np.save(f, ids)
+        files.append((IDS_FILE, chunk_ids_tmp))
+    elif os.path.exists(os.path.join(index_dir, IDS_FILE)):
+        os.remove(os.path.join(index_dir, IDS_FILE))
+    if also_in:
+        also_in_tmp = os.path.join(index_dir, ALSO_IN_FILE + ".tmp")
+        with open(also_in_tmp, "w", encoding="utf-8") as f:
+            json.dump({str(k): list(v) for k, v in sorted(also_in.items())}, f, ensure_ascii=False)
+        files.append((ALSO_IN_FILE, also_in_tmp))
+    elif os.path.exists(os.path.join(index_dir, ALSO_IN_FILE)):
+        os.remove(os.path.join(index_dir, ALSO_IN_FILE))
+    if parent_ids is not None:
+        parent_ids = np.asarray(parent_ids, dtype=np.int64)
+        if len(parent_ids) != len(texts):
+            raise ValueError(f"parent_ids ({len(parent_ids)}) and texts ({len(texts)}) differ in length")
+        parents_tmp = os.path.join(index_dir, PARENT_IDS_FILE + ".tmp")
+        with open(parents_tmp, "wb") as f:
+            np.save(f, parent_ids)
+        files.append((PARENT_IDS_FILE, parents_tmp))
+    elif os.path.exists(os.path.join(index_dir, PARENT_IDS_FILE)):
+        os.remove(os.path.join(index_dir, PARENT_IDS_FILE))
+
+    for name, tmp in files:
+        os.replace(tmp, os.path.join(index_dir, name))
+
+def write_parent_store(index_dir: str, texts, sources, ids):
+    """Write the parent spans (strictly increasing parent ids) next to the chunk store."""
+    write_chunk_store(os.path.join(index_dir, PARENTS_DIR), texts, sources, ids)
+
+def remove_parent_store(index_dir: str):
+    parents_dir = os.path.join(index_dir, PARENTS_DIR)
+    if os.path.isdir(parents_dir):
+        for name in os.listdir(parents_dir):
+            os.remove(os.path.join(parents_dir, name))
+        os.rmdir(parents_dir)
+
+class _View:
+    """Read-only sequence over the store.
+
+    Integer indexing takes a chunk id (the FAISS id); slices and iteration
+    walk the rows in storage order.
+    """
+
+    def __init__(self, store, at_row):
+        self._store = store
+        self._at_row = at_row
+
+    def __len__(self):
+        return len(self._store)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._at_row(j) for j in range(*i.indices(len(self)))]
+        return self._at_row(self._store.row(i))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._at_row(i)
+
+    def __repr__(self):
+        return repr(self[:5])
+
+class ChunkStore:
+    """Memory-mapped reader for a chunk store written by write_chunk_store."""
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        self._offsets = np.load(os.path.join(index_dir, OFFSETS_FILE), mmap_mode="r")
+        self._source_ids = np.load(os.path.join(index_dir, SOURCE_IDS_FILE), mmap_mode="r")
+        with open(os.path.join(index_dir, SOURCES_FILE), "r", encoding="utf-8") as f:
+            self.source_table = json.load(f)
+        ids_path = os.path.join(index_dir, IDS_FILE)
+        self.ids = np.load(ids_path, mmap_mode="r") if os.path.exists(ids_path) else None
+        self.also_in = {}
+        also_in_path = os.path.join(index_dir, ALSO_IN_FILE)
+        if os.path.exists(also_in_path):
+            with open(also_in_path, "r", encoding="utf-8") as f:
+                self.also_in = {int(k): v for k, v in json.load(f).items()}
+        parent_ids_path = os.path.join(index_dir, PARENT_IDS_FILE)
+        parents_dir = os.path.join(index_dir, PARENTS_DIR)
+        self.parent_ids, self.parents = None, None
+        if os.path.exists(parent_ids_path) and has_chunk_store(parents_dir):
+            self.parent_ids = np.load(parent_ids_path, mmap_mode="r")
+            self.parents = ChunkStore(parents_dir)
+
+        blob_path = os.path.join(index_dir, BLOB_FILE)
+        self._blob = b""
+        if os.path.getsize(blob_path):
+            with open(blob_path, "rb") as f:
+                self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.texts = _View(self, self._text_at)
+        self.sources = _View(self, self._source_at)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def chunk_ids(self):
+        """Chunk ids in row order."""
+        if self.ids is None:
+            return np.arange(len(self), dtype=np.int64)
+        return np.asarray(self.ids)
+
+    def row(self, chunk_id) -> int:
+        """Row holding chunk_id."""
+        chunk_id = int(chunk_id)
+        if self.ids is None:
+            row = chunk_id + len(self) if chunk_id < 0 else chunk_id
+            if not 0 <= row < len(self):
+                raise IndexError(chunk_id)
+            return row
+        row = int(np.searchsorted(self.ids, chunk_id))
+        if row >= len(self.ids) or int(self.ids[row]) != chunk_id:
+            raise KeyError(f"chunk id {chunk_id} not in store")
+        return row
+
+    def _text_at(self, row: int) -> str:
+        start, end = int(self._offsets[row]), int(self._offsets[row + 1])
+        return self._blob[start:end].decode("utf-8")
+
+    def _source_at(self, row: int) -> str:
+        return self.source_table[int(self._source_ids[row])]
+
+    def text(self, chunk_id) -> str:
+        return self._text_at(self.row(chunk_id))
+
+    def source(self, chunk_id) -> str:
+        return self._source_at(self.row(chunk_id))
+
+    def all_sources(self, chunk_id) -> list[str]:
+        """The chunk's own source followed by those of its dropped near-duplicates."""
+        return [self.source(chunk_id)] + self.also_in.get(int(chunk_id), [])
+
+    def parent_id(self, chunk_id):
+        """Parent id of chunk_id, or None without small-to-big chunking."""
+        if self.parent_ids is None:
+            return None
+        return int(self.parent_ids[self.row(chunk_id)])
+
+    def parent_text(self, chunk_id) -> str:
+        """The parent span of chunk_id (the chunk itself without parents)."""
+        pid = self.parent_id(chunk_id)
+        return self.text(chunk_id) if pid is None else self.parents.text(pid)
+
+    def close(self):
+        if self.parents is not None:
+            self.parents.close()
+        if isinstance(self._blob, mmap.mmap):
+            self._blob.close()
+
+def convert_legacy(index_dir: str):
+    """Convert pickled texts.npy/sources.npy in index_dir into a chunk store."""
+    texts = np.load(os.path.join(index_dir, "texts.npy"), allow_pickle=True)
+    sources = np.load(os.path.join(index_dir, "sources.npy"), allow_pickle=True)
+    write_chunk_store(index_dir, texts, sources)
+    print(f"Wrote chunk store for {len(texts)} chunks to {index_dir}/")
+
+if __name__ == "__main__":
+    convert_legacy(sys.argv[1] if len(sys.argv) > 1 else os.getenv("INDEX_DIR", "./kb_index"))
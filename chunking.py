@@ -0,0 +1,182 @@
+# chunking.py
+"""
+Structure-aware small-to-big chunking.
+
+Extraction produces blocks, (section, text) pairs in document order: a
+paragraph, a list item, a table or sheet row (its section carries the
+table header), an HTML block. The section is the heading the block sits
+under, so a block keeps its context when it ends up in a small chunk.
+
+Blocks are packed into parents of up to parent_words, which start at a new
+section once the current parent holds a quarter of that. Each parent is cut
+into children of up to child_words along the same block boundaries; blocks
+longer than a child are split at sentences. Children are what gets embedded,
+deduplicated and re-ranked (short, precise, within the cross-encoder's input
+length); the LLM gets the parent span of a matched child.
+
+mode "fixed" is the original 500-word window chunker without parents.
+"""
+import re
+import statistics
+from context_budget import split_sentences
+
+CHUNK_MAX_WORDS = 500
+CHUNK_OVERLAP = 50
+CHILD_MAX_WORDS = 120
+PARENT_MAX_WORDS = 400
+MODES = ("structured", "fixed")
+
+HEADING_END_RE = re.compile("[.,;!?\u061F\u060C]$")  # sentence or clause punctuation, incl. Arabic ? and ,
+
+def chunk_text(text: str, max_words: int = CHUNK_MAX_WORDS, overlap: int = CHUNK_OVERLAP):
+    if not text or not text.strip():
+        return []
+    words = text.split()
+    if len(words) <= max_words:
+        return [text]
+
+    chunks = []
+    i = 0
+    while i < len(words):
+        chunk_words = words[i:i + max_words]
+        chunk = " ".join(chunk_words)
+        chunks.append(chunk)
+        i += max_words - overlap
+        if i >= len(words):
+            break
+    return chunks
+
+def looks_like_heading(line: str, prev: str, next_line: str) -> bool:
+    """Plain-text heading heuristic: a short unpunctuated line that opens a paragraph."""
+    if line.startswith("#"):
+        return True
+    words = line.split()
+    if not words or len(words) > 8 or HEADING_END_RE.search(line) or line[0] in "•-*|":
+        return False
+    if not (line[0].isupper() or line[0].isdigit() or not line[0].isascii()):
+        return False
+    # Previous line closed a sentence (so this is not a wrapped line) and real text follows
+    return (not prev or HEADING_END_RE.search(prev) is not None) and len(next_line.split()) > 8
+
+def text_blocks(text: str):
+    """Blocks of plain text (TXT files, HTML without block markup): one per non-empty line."""
+    lines = [ln.strip() for ln in text.splitlines()]
+    lines = [ln for ln in lines if ln]
+    blocks, section = [], ""
+    for i, line in enumerate(lines):
+        prev = lines[i - 1] if i else ""
+        next_line = lines[i + 1] if i + 1 < len(lines) else ""
+        if looks_like_heading(line, prev, next_line):
+            section = line.lstrip("#").strip()
+            continue
+        blocks.append((section, line))
+    return blocks
+
+def table_blocks(rows, section: str = ""):
+    """Blocks for table or sheet rows (lists of cell strings); the first row is the header."""
+    rows = [r for r in rows if any(c.strip() for c in r)]
+    if not rows:
+        return []
+    header = " | ".join(rows[0])
+    if len(rows) == 1:
+        return [(section, header)]
+    table_section = f"{section}\n{header}" if section else header
+    return [(table_section, " | ".join(r)) for r in rows[1:]]
+
+def _words(text: str) -> int:
+    return len(text.split())
+
+def _render(units) -> str:
+    """Text of a run of (section, text) units, each section written once where it starts."""
+    lines, current = [], None
+    for section, text in units:
+        if section != current:
+            if section:
+                lines.append(section)
+            current = section
+        lines.append(text)
+    return "\n".join(lines)
+
+def _pack(units, max_words: int, new_group_at_section: int = None):
+    """Greedy groups of consecutive units up to max_words; a new section starts a new group
+    once the current one holds new_group_at_section words."""
+    groups, group, size = [], [], 0
+    for unit in units:
+        n = _words(unit[1])
+        section_break = (new_group_at_section is not None and group and unit[0] != group[-1][0]
+                         and size >= new_group_at_section)
+        if group and (size + n > max_words or section_break):
+            groups.append(group)
+            group, size = [], 0
+        group.append(unit)
+        size += n
+    if group:
+        groups.append(group)
+    return groups
+
+class Chunker:
+    """Turns extracted blocks into (children, parent_of, parents); parents is None in fixed mode."""
+
+    def __init__(self, mode: str = "structured", child_words: int = CHILD_MAX_WORDS,
+                 parent_words: int = PARENT_MAX_WORDS):
+        if mode not in MODES:
+            raise ValueError(f"unknown chunking mode {mode!r}; expected one of {MODES}")
+        self.mode = mode
+        self.child_words = child_words
+        self.parent_words = parent_words
+
+    def settings(self) -> dict:
+        if self.mode == "fixed":
+            return {"mode": "fixed", "max_words": CHUNK_MAX_WORDS, "overlap": CHUNK_OVERLAP}
+        return {"mode": self.mode, "child_words": self.child_words, "parent_words": self.parent_words}
+
+    def split(self, blocks):
+        if self.mode == "fixed":
+            return chunk_text(_render(blocks)), None, None
+
+        units = []
+        for section, text in blocks:
+            if _words(text) <= self.child_words:
+                units.append((section, text))
+            else:
+                units.extend((section, s) for s in split_sentences(text) if s)
+
+        children, parent_of, parents = [], [], []
+        for group in _pack(units, self.parent_words, new_group_at_section=self.parent_words // 4):
+            pid = len(parents)
+            parents.append(_render(group))
+            for child in _pack(group, self.child_words):
+                children.append(_render(child))
+                parent_of.append(pid)
+        return children, parent_of, parents
+
+def size_stats(texts) -> dict:
+    """Word-count distribution of chunks, for the index metadata."""
+    sizes = sorted(_words(str(t)) for t in texts)
+    if not sizes:
+        return {"count": 0}
+    return {"count": len(sizes), "mean_words": round(statistics.mean(sizes), 1),
+            "p50_words": sizes[len(sizes) // 2], "p95_words": sizes[min(len(sizes) - 1, int(0.95 * len(sizes)))],
+            "max_words": sizes[-1]}
+
+class ParentSpans:
+    """Parent spans referenced by the indexed children, under stable parent ids."""
+
+    def __init__(self, next_id: int = 0):
+        self.next_id = next_id
+        self.ids, self.texts, self.sources = [], [], []
+        self.chunk_parent = {}  # chunk id -> parent id
+
+    def add(self, pid: int, text: str, source: str):
+        self.ids.append(pid)
+        self.texts.append(text)
+        self.sources.append(source)
+
+    def new_id(self, text: str, source: str) -> int:
+        pid = self.next_id
+        self.next_id += 1
+        self.add(pid, text, source)
+        return pid
+
+    def link(self, chunk_id: int, pid: int):
+        self.chunk_parent[int(chunk_id)] = int(pid)
@@ -0,0 +1,133 @@
+# context_budget.py
+"""
+Token-budgeted context assembly for the LLM prompt.
+
+The re-ranked chunks are sent whole when they fit in the budget. Otherwise
+they are compressed extractively: chunks are split into sentences, each
+sentence is scored by its embedding similarity to the query (plus a small
+prior for the chunk's re-rank position), near-duplicate sentences are
+dropped, and the best sentences are taken greedily until the budget is
+full. Kept sentences are put back in document order per chunk, chunks in
+re-rank order, with "…" where sentences were left out.
+
+Token counts use tiktoken's encoding for the LLM. When the encoding cannot
+be loaded (offline host without a tiktoken cache) a byte-length estimate is
+used instead, which over-counts slightly and so stays within budget.
+"""
+import re
+import time
+import threading
+import numpy as np
+
+SENTENCE_END_RE = re.compile("(?<=[.!?\u061F\u06D4])\\s+|\n+")  # . ! ? and Arabic ? and full stop, or line breaks
+MAX_SENTENCE_WORDS = 60  # longer runs (tables, lists) are cut into windows of this size
+GAP = " … "
+MESSAGE_OVERHEAD_TOKENS = 4  # role/separator tokens per chat message
+
+_encodings = {}
+_encoding_lock = threading.Lock()
+
+def get_encoding(model: str):
+    """tiktoken encoding for model, or None when it cannot be loaded."""
+    with _encoding_lock:
+        if model not in _encodings:
+            try:
+                import tiktoken
+                try:
+                    _encodings[model] = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    _encodings[model] = tiktoken.get_encoding("o200k_base")
+            except Exception as e:
+                print(f"Warning: tiktoken encoding for {model} unavailable ({type(e).__name__}); estimating token counts")
+                _encodings[model] = None
+        return _encodings[model]
+
+def count_tokens(text: str, model: str) -> int:
+    enc = get_encoding(model)
+    if enc is None:
+        return (len(text.encode("utf-8")) + 3) // 4
+    return len(enc.encode(text, disallowed_special=()))
+
+def count_message_tokens(messages, model: str) -> int:
+    return sum(count_tokens(m["content"], model) + MESSAGE_OVERHEAD_TOKENS for m in messages) + 3
+
+def split_sentences(text: str):
+    out = []
+    for sent in SENTENCE_END_RE.split(text):
+        words = sent.split()
+        for start in range(0, len(words), MAX_SENTENCE_WORDS):
+            out.append(" ".join(words[start:start + MAX_SENTENCE_WORDS]))
+    return out
+
+class ContextBudget:
+    """
+    Fits the re-ranked chunks into max_tokens of prompt context.
+
+    redundancy: sentences at least this similar (cosine) to one already kept
+    are dropped. chunk_prior: bonus for a sentence from the top-ranked chunk,
+    decaying as 1 / (1 + rank) for lower-ranked ones.
+    """
+
+    def __init__(self, max_tokens: int = 1200, model: str = "gpt-4o-mini", redundancy: float = 0.9,
+                 chunk_prior: float = 0.1):
+        self.max_tokens = max_tokens
+        self.model = model
+        self.redundancy = redundancy
+        self.chunk_prior = chunk_prior
+
+    def assemble(self, query: str, chunks, encode):
+        """
+        chunks are texts in re-rank order; encode maps a list of texts to
+        normalized embeddings. Returns (context texts, one per chunk used,
+        and the token accounting).
+        """
+        t0 = time.perf_counter()
+        chunk_tokens = [count_tokens(c, self.model) for c in chunks]
+        stats = {"budget": self.max_tokens, "chunks": len(chunks), "source_tokens": sum(chunk_tokens),
+                 "compressed": False}
+        if sum(chunk_tokens) <= self.max_tokens:
+            stats.update(context_tokens=sum(chunk_tokens), chunks_used=len(chunks),
+                         assemble_ms=round((time.perf_counter() - t0) * 1000, 2))
+            return list(chunks), stats
+
+        sents, owner = [], []
+        seen = set()
+        for rank, chunk in enumerate(chunks):
+            for sent in split_sentences(chunk):
+                key = " ".join(sent.lower().split())
+                if key and key not in seen:  # exact repeats across chunks
+                    seen.add(key)
+                    sents.append(sent)
+                    owner.append(rank)
+        embs = np.asarray(encode([query] + sents), dtype=np.float32)
+        q, s_embs = embs[0], embs[1:]
+        scores = s_embs @ q + self.chunk_prior / (1 + np.asarray(owner, dtype=np.float32))
+        # +1 for the separator each kept sentence adds when the context is reassembled
+        tokens = [count_tokens(s, self.model) + 1 for s in sents]
+
+        kept, redundant, used = [], 0, 0
+        for j in np.argsort(-scores, kind="stable"):
+            if used + tokens[j] > self.max_tokens:
+                continue
+            if kept and float(np.max(s_embs[kept] @ s_embs[j])) >= self.redundancy:
+                redundant += 1
+                continue
+            kept.append(int(j))
+            used += tokens[j]
+            if self.max_tokens - used < 8:
+                break
+
+        context = []
+        for rank in range(len(chunks)):
+            rows = sorted(j for j in kept if owner[j] == rank)
+            if not rows:
+                continue
+            parts = [sents[rows[0]]]
+            for prev, j in zip(rows, rows[1:]):
+                parts.append(GAP if j != prev + 1 else " ")
+                parts.append(sents[j])
+            context.append("".join(parts))
+        stats.update(compressed=True, context_tokens=sum(count_tokens(c, self.model) for c in context),
+                     chunks_used=len(context), sentences=len(sents), sentences_kept=len(kept),
+                     redundant_dropped=redundant, assemble_ms=round((time.perf_counter() - t0) * 1000, 2))
+        return context, stats
@@ -0,0 +1,314 @@
+# conversation.py
+"""
+Bounded conversation memory for follow-up questions.
+
+A history is a list of {"role", "content"} messages (Gradio's [user, bot]
+pairs are accepted too), optionally starting with a {"role": "summary"}
+entry that stands for everything before it. Memory.prepare() turns it into
+a Turn:
+
+- recent: the last window_messages messages, within history_tokens, sent
+  to the LLM verbatim;
+- summary: a rolling summary of the older messages, within summary_tokens;
+- search_query: the query rewritten into a standalone question when it
+  looks like a follow-up ("what about the fees there?": it starts with a
+  continuation or refers back with a pronoun), used for the answer cache
+  and retrieval.
+
+Older messages are folded into the summary one exchange at a time. A fold
+is extractive (questions asked, first sentence of each answer) and so free;
+it is also handed to a background thread that asks the LLM for a better
+summary, which replaces the extractive one from the next turn on. Neither
+the fold nor its refinement adds an LLM round trip to a request. Rewrites
+only run for follow-ups and are cached per (previous question, follow-up),
+so a common follow-up to a common question is rewritten once; after a
+chain of follow-ups the earlier conversation is part of the key. On an event
+loop, rewrite_async() awaits the LLM instead of blocking a thread.
+
+Turn.history(answer) is the compacted history to keep for the next turn:
+summary entry plus the window. Per-session memory and prompt size stay
+flat however long the conversation runs.
+"""
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from context_budget import count_tokens, split_sentences
+
+SUMMARY_ROLE = "summary"
+# A question that continues the previous one: English "what/how about", "and ...", "also", "same for";
+# Arabic "and what about", "what about", "and" + question word (what, how, where, how much)
+FOLLOW_UP_START_RE = re.compile(
+    r"^\s*(what about|how about|and|also|same for)\b"
+    "|^\\s*(\u0648?\u0645\u0627\u0630\u0627 \u0639\u0646|\u0648(\u0645\u0627|\u0643\u064A\u0641|\u0623\u064A\u0646|\u0643\u0645)\\b)",
+    re.IGNORECASE,
+)
+# Pronouns that refer back (not "is there"/"there are"): English it, they, there, those...;
+# Arabic there, about it, in it, for it
+FOLLOW_UP_REF_RE = re.compile(
+    r"\b(it|its|they|them|their|(?<!is )(?<!are )there(?! (is|are|was|were)\b)|those|these|he|she|his|her)\b"
+    "|\\b(\u0647\u0646\u0627\u0643|\u0639\u0646\u0647\u0627|\u0639\u0646\u0647|\u0641\u064A\u0647\u0627|\u0641\u064A\u0647|\u0644\u0647\u0627)\\b",
+    re.IGNORECASE,
+)
+
+REWRITE_PROMPT = (
+    "Rewrite the user's last question as a standalone question that can be understood without the "
+    "conversation. Resolve pronouns and references using the conversation. Keep the language of the "
+    "question. Reply with the question only."
+)
+SUMMARY_PROMPT = (
+    "Update the running summary of a conversation between a user and Manara, an assistant for Applied "
+    "Technology Schools. Keep what the user asked about and the key facts given (programmes, campuses, "
+    "fees, dates), most recent last. At most {words} words. Reply with the summary only."
+)
+
+def normalize_history(history, query: str = None):
+    """(summary, messages) from a message list, Gradio pairs, or a compacted history.
+
+    A trailing user message equal to query (the UI already appended the
+    question being answered) is dropped.
+    """
+    summary, messages = "", []
+    for item in history or []:
+        if isinstance(item, dict):
+            role, content = item.get("role"), item.get("content")
+            if role == SUMMARY_ROLE and not messages:
+                summary = str(content or "")
+            elif role in ("user", "assistant") and isinstance(content, str) and content.strip():
+                messages.append({"role": role, "content": content})
+        elif isinstance(item, (list, tuple)) and len(item) == 2:
+            for role, content in zip(("user", "assistant"), item):
+                if isinstance(content, str) and content.strip():
+                    messages.append({"role": role, "content": content})
+    if query is not None and messages and messages[-1]["role"] == "user" \
+            and messages[-1]["content"].strip() == query.strip():
+        messages.pop()
+    return summary, messages
+
+def looks_like_follow_up(query: str) -> bool:
+    return FOLLOW_UP_START_RE.search(query) is not None or FOLLOW_UP_REF_RE.search(query) is not None
+
+def _key(*parts) -> str:
+    h = hashlib.sha1()
+    for p in parts:
+        h.update(p.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+class _LRU:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                return self._data[key]
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+class Turn:
+    """What one request needs from the conversation."""
+
+    def __init__(self, query: str, search_query: str, summary: str, recent, rewritten: bool):
+        self.query = query
+        self.search_query = search_query
+        self.summary = summary
+        self.recent = recent
+        self.rewritten = rewritten
+
+    def messages(self):
+        """Chat messages placed between the system prompt and the question."""
+        out = []
+        if self.summary:
+            out.append({"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"})
+        return out + [dict(m) for m in self.recent]
+
+    def history(self, answer: str = None):
+        """Compacted history to pass back in with the next question."""
+        out = [{"role": SUMMARY_ROLE, "content": self.summary}] if self.summary else []
+        out += [dict(m) for m in self.recent]
+        out.append({"role": "user", "content": self.query})
+        if answer:
+            out.append({"role": "assistant", "content": answer})
+        return out
+
+class Memory:
+    """
+    complete(messages, max_tokens) -> str runs an LLM call; without it only
+    the extractive summary and the concatenation rewrite are used.
+    acomplete is its coroutine counterpart for rewrite_async(); without it
+    the async path uses the concatenation rewrite.
+    rewrite: "llm", "concat" (previous question + query) or "off".
+    """
+
+    def __init__(self, complete=None, acomplete=None, window_messages: int = 6, history_tokens: int = 500,
+                 summary_tokens: int = 200, rewrite: str = "llm", model: str = "gpt-4o-mini",
+                 cache_size: int = 2048):
+        self.complete = complete
+        self.acomplete = acomplete
+        self.window_messages = window_messages
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.rewrite_mode = rewrite
+        self.model = model
+        self._rewrites = _LRU(cache_size)
+        self._refined = _LRU(cache_size)  # extractive summary -> LLM summary of the same messages
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rag-summary")
+        self.stats = {"rewrites": 0, "rewrite_cache_hits": 0, "folds": 0, "refined_used": 0}
+
+    def prepare(self, query: str, history, rewrite: bool = True) -> Turn:
+        summary, messages = normalize_history(history, query)
+        # Fold whole exchanges beyond the window into the summary, oldest first
+        excess = max(0, len(messages) - self.window_messages)
+        excess += excess % 2
+        for start in range(0, excess, 2):
+            # Only the newest fold is refined; the older ones were refined on earlier turns
+            summary = self.fold(summary, messages[start:start + 2], refine=start + 2 >= excess)
+        summary = self._refined.get(summary) or summary
+        recent = self._fit_window(messages[excess:])
+        search_query, rewritten = self.rewrite(query, recent, summary) if rewrite else (query, False)
+        return Turn(query, search_query, summary, recent, rewritten)
+
+    def _fit_window(self, messages):
+        """Newest messages first until history_tokens; long messages are cut to a share of it."""
+        per_message = max(40, self.history_tokens // max(1, self.window_messages))
+        kept, used = [], 0
+        for m in reversed(messages):
+            text = self._clip(m["content"], per_message)
+            tokens = count_tokens(text, self.model)
+            if used + tokens > self.history_tokens:
+                break
+            kept.append({"role": m["role"], "content": text})
+            used += tokens
+        return kept[::-1]
+
+    def _clip(self, text: str, max_tokens: int) -> str:
+        if count_tokens(text, self.model) <= max_tokens:
+            return text
+        out = []
+        for sent in split_sentences(text):
+            if count_tokens(" ".join(out + [sent]), self.model) > max_tokens:
+                break
+            out.append(sent)
+        return " ".join(out) if out else " ".join(text.split()[:max_tokens // 2]) + " …"
+
+    # --- rolling summary -------------------------------------------------
+
+    def fold(self, summary: str, exchange, refine: bool = True) -> str:
+        """Summary with exchange folded in: extractive now, LLM-refined in the background."""
+        summary = self._refined.get(summary) or summary
+        lines = [ln for ln in summary.split("\n") if ln]
+        for m in exchange:
+            first = next((s for s in split_sentences(m["content"]) if s), "")
+            lines.append(("Q: " if m["role"] == "user" else "A: ") + self._clip(first, 60))
+        while len(lines) > 1 and count_tokens("\n".join(lines), self.model) > self.summary_tokens:
+            lines.pop(0)  # oldest first
+        draft = "\n".join(lines)
+        self.stats["folds"] += 1
+        refined = self._refined.get(draft)
+        if refined is not None:
+            self.stats["refined_used"] += 1
+            return refined
+        if refine:
+            self._schedule_refine(draft, summary, exchange)
+        return draft
+
+    def _schedule_refine(self, draft: str, summary: str, exchange):
+        if self.complete is None:
+            return
+        with self._pending_lock:
+            if draft in self._pending:
+                return
+            self._pending.add(draft)
+        self._executor.submit(self._refine, draft, summary, list(exchange))
+
+    def _refine(self, draft: str, summary: str, exchange):
+        try:
+            words = max(30, int(self.summary_tokens * 0.6))
+            convo = "\n".join(f"{m['role']}: {m['content']}" for m in exchange)
+            text = self.complete([
+                {"role": "system", "content": SUMMARY_PROMPT.format(words=words)},
+                {"role": "user", "content": f"Current summary:\n{summary or '(empty)'}\n\nNew messages:\n{convo}"},
+            ], self.summary_tokens)
+            if text and text.strip():
+                self._refined.put(draft, self._clip(text.strip(), self.summary_tokens))
+        except Exception as e:
+            print(f"Warning: conversation summary update failed: {e}")
+        finally:
+            with self._pending_lock:
+                self._pending.discard(draft)
+
+    # --- query rewriting -------------------------------------------------
+
+    def rewrite(self, query: str, recent, summary: str):
+        """(search query, rewritten?) for retrieval."""
+        result, key, messages = self._rewrite_request(query, recent, summary, self.complete is not None)
+        if result is not None:
+            return result
+        try:
+            return self._rewritten(key, self.complete(messages, 60), recent, query)
+        except Exception as e:
+            return self._rewrite_failed(e, recent, query)
+
+    async def rewrite_async(self, query: str, recent, summary: str):
+        """rewrite() awaiting acomplete, so a slow LLM does not hold a thread."""
+        result, key, messages = self._rewrite_request(query, recent, summary, self.acomplete is not None)
+        if result is not None:
+            return result
+        try:
+            return self._rewritten(key, await self.acomplete(messages, 60), recent, query)
+        except Exception as e:
+            return self._rewrite_failed(e, recent, query)
+
+    def _rewrite_request(self, query: str, recent, summary: str, can_call: bool):
+        """(result, None, None) when no LLM call is needed, else (None, cache key, messages)."""
+        previous = self._previous(recent)
+        if self.rewrite_mode == "off" or previous is None or not looks_like_follow_up(query):
+            return (query, False), None, None
+        if self.rewrite_mode != "llm" or not can_call:
+            return (f"{previous} {query}", True), None, None
+        # Keyed on the two questions, so the same follow-up to the same question repeats. A previous
+        # question that was a follow-up itself depends on the turns before it, so they join the key
+        context = [previous]
+        if looks_like_follow_up(previous):
+            context = [summary] + [m["content"] for m in recent]
+        key = _key(*(" ".join(text.lower().split()) for text in context + [query]))
+        cached = self._rewrites.get(key)
+        if cached is not None:
+            self.stats["rewrite_cache_hits"] += 1
+            return (cached, True), None, None
+        convo = "\n".join(f"{m['role']}: {self._clip(m['content'], 80)}" for m in recent[-4:])
+        if summary:
+            convo = f"(earlier: {summary})\n{convo}"
+        return None, key, [
+            {"role": "system", "content": REWRITE_PROMPT},
+            {"role": "user", "content": f"Conversation:\n{convo}\n\nLast question: {query}"},
+        ]
+
+    def _rewritten(self, key: str, text, recent, query: str):
+        text = (text or "").strip().strip('"')
+        if text and len(text.split()) <= 40:  # a question, not an answer
+            self.stats["rewrites"] += 1
+            self._rewrites.put(key, text)
+            return text, True
+        return f"{self._previous(recent)} {query}", True
+
+    def _rewrite_failed(self, error, recent, query: str):
+        print(f"Warning: query rewrite failed, using the previous question as context: {error}")
+        return f"{self._previous(recent)} {query}", True
+
+    @staticmethod
+    def _previous(recent):
+        return next((m["content"] for m in reversed(recent) if m["role"] == "user"), None)
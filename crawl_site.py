@@ -1,19 +1,33 @@
-import os, time, re, queue, requests, tldextract
+import os, time, re, json, queue, random, hashlib, asyncio, argparse, requests, httpx, tldextract
 from typing import Optional
+from urllib import robotparser
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse, urldefrag
+from email.utils import parsedate_to_datetime
 from dotenv import load_dotenv
 import trafilatura
+from crawl_state import CrawlState
 
 load_dotenv()
 BASE_URL = os.getenv("BASE_URL", "https://www.ats.sch.ae")
 DATA_DIR = os.getenv("DATA_DIR", "./kb_data")
+CRAWL_STATE = os.getenv("CRAWL_STATE", "./crawl_state.sqlite")  # outside DATA_DIR: not a knowledge file
+CRAWL_CHANGES = os.getenv("CRAWL_CHANGES", "./crawl_changes.json")
 os.makedirs(DATA_DIR, exist_ok=True)
 
 HEADERS = {"User-Agent": "ATS-KB-Bot/1.0 (+research; respectful crawler)"}
 VISITED = set()
-ALLOWED_NETLOC = tldextract.extract(BASE_URL).registered_domain  # e.g. ats.sch.ae
 RATE_SECONDS = 1.0  # be nice
+MAX_RETRIES = 3
+BACKOFF_SECONDS = 1.0
+RETRY_STATUS = {429, 500, 502, 503, 504}
+GONE_STATUS = {404, 410}
+
+def site_domain(base_url: str) -> str:
+    # registered domain, e.g. ats.sch.ae; bare hosts (localhost, IPs) have none
+    return tldextract.extract(base_url).registered_domain or urlparse(base_url).hostname or ""
+
+ALLOWED_NETLOC = site_domain(BASE_URL)
 
 def is_same_site(url: str) -> bool:
     netloc = urlparse(url).netloc
@@ -32,14 +46,38 @@ def should_skip_path(path: str) -> bool:
         ".doc",".docx",".xls",".xlsx",".ppt",".pptx",".xml"
     ])
 
+def retry_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """Backoff before retry number attempt (0-based): Retry-After if given, else exponential with jitter."""
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return BACKOFF_SECONDS * (2 ** attempt) * (0.5 + random.random() / 2)
+
+_session = requests.Session()
+_session.headers.update(HEADERS)
+
 def fetch(url: str) -> Optional[requests.Response]:
-    try:
+    for attempt in range(MAX_RETRIES + 1):
         time.sleep(RATE_SECONDS)
-        r = requests.get(url, headers=HEADERS, timeout=20)
-        if r.status_code == 200:
-            return r
-    except Exception:
-        pass
+        try:
+            r = _session.get(url, timeout=20)
+        except requests.RequestException as e:
+            error, retry_after = str(e), None
+        else:
+            if r.status_code == 200:
+                return r
+            if r.status_code not in RETRY_STATUS:
+                print(f"✗ {url}: HTTP {r.status_code}")
+                return None
+            error, retry_after = f"HTTP {r.status_code}", r.headers.get("Retry-After")
+        if attempt < MAX_RETRIES:
+            time.sleep(retry_delay(attempt, retry_after))
+    print(f"✗ {url}: giving up after {MAX_RETRIES + 1} attempts ({error})")
     return None
 
 def extract_links(base_url: str, html: str) -> list[str]:
@@ -50,28 +88,58 @@ def extract_links(base_url: str, html: str) -> list[str]:
         links.append(href)
     return links
 
-def save_clean_text(url: str, html: str):
+def clean_text(url: str, html: str) -> str:
     # Trafilatura does robust boilerplate removal
     text = trafilatura.extract(html, url=url, include_tables=True, favor_recall=True) or ""
-    text = re.sub(r"\n{3,}", "\n\n", text).strip()
-    if not text:
-        return
-    # Make a filename from URL
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+def page_files(url: str) -> tuple[str, str]:
+    """(text, source) file names in DATA_DIR for a URL."""
     safe = re.sub(r"[^a-zA-Z0-9]+", "_", urlparse(url).path.strip("/")) or "index"
-    out_path = os.path.join(DATA_DIR, f"{safe}.txt")
-    meta_path = os.path.join(DATA_DIR, f"{safe}.source")
+    return f"{safe}.txt", f"{safe}.source"
+
+def write_page(url: str, text: str) -> str:
+    txt_name, source_name = page_files(url)
+    out_path = os.path.join(DATA_DIR, txt_name)
     with open(out_path, "w", encoding="utf-8") as f:
         f.write(text)
-    with open(meta_path, "w", encoding="utf-8") as f:
+    with open(os.path.join(DATA_DIR, source_name), "w", encoding="utf-8") as f:
         f.write(url)
     print(f"✓ Saved {url} → {out_path}")
+    return out_path
+
+def save_clean_text(url: str, html: str):
+    text = clean_text(url, html)
+    if text:
+        write_page(url, text)
 
-def main():
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def site_links(url: str, html: str) -> list[str]:
+    """Same-site, non-binary links on a page, normalized and de-duplicated."""
+    found = {}
+    for link in extract_links(url, html):
+        link = normalize(link)
+        if not is_same_site(link): 
+            continue
+        if should_skip_path(urlparse(link).path):
+            continue
+        found[link] = None
+    return list(found)
+
+def new_links(url: str, html: str) -> list[str]:
+    """Same-site, non-binary links on a page that have not been queued yet (marks them visited)."""
+    found = [link for link in site_links(url, html) if link not in VISITED]
+    VISITED.update(found)
+    return found
+
+def crawl_serial(start: str, max_pages: Optional[int] = None) -> int:
+    """One URL at a time with a fixed delay before every request (the original crawler)."""
     q = queue.Queue()
-    start = normalize(BASE_URL)
     q.put(start)
     VISITED.add(start)
-    print(f"Starting crawl at {start}")
+    pages = 0
 
     while not q.empty():
         url = q.get()
@@ -85,19 +153,300 @@ def main():
             continue
 
         html = resp.text
+        pages += 1
         save_clean_text(url, html)
+        if max_pages and pages >= max_pages:
+            break
+
+        for link in new_links(url, html):
+            q.put(link)
+    return pages
+
+class TokenBucket:
+    """Async token bucket: rate requests/second with bursts of up to burst requests."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class AsyncCrawler:
+    """
+    Concurrent crawler: a bounded pool of workers sharing one keep-alive
+    connection pool, a token-bucket rate limit per host (slowed down to the
+    robots.txt Crawl-delay when one is set) and per-URL retry with backoff.
 
-        for link in extract_links(url, html):
-            link = normalize(link)
-            if not is_same_site(link): 
-                continue
-            if should_skip_path(urlparse(link).path):
-                continue
+    With a CrawlState the frontier and visited set live on disk (so the crawl
+    can resume), requests are conditional on the last ETag/Last-Modified, and
+    a page is only rewritten when its extracted text changed.
+    """
+
+    def __init__(self, start: str, workers: int = 8, rate: float = 1 / RATE_SECONDS, burst: int = 1,
+                 max_pages: Optional[int] = None, retries: int = MAX_RETRIES, state: Optional[CrawlState] = None):
+        self.start = start
+        self.workers = workers
+        self.rate = rate
+        self.burst = burst
+        self.max_pages = max_pages
+        self.retries = retries
+        self.state = state
+        self.buckets = {}
+        self.robots = {}
+        self.stats = {"fetched": 0, "pages": 0, "failed": 0, "retries": 0, "robots_blocked": 0,
+                      "not_modified": 0, "unchanged": 0, "saved": 0, "deleted": 0}
+
+    async def _robots_for(self, host_url: str):
+        host = urlparse(host_url).netloc
+        if host not in self.robots:
+            parser = robotparser.RobotFileParser()
+            robots_url = f"{urlparse(host_url).scheme}://{host}/robots.txt"
+            try:
+                r = await self.client.get(robots_url)
+                lines = r.text.splitlines() if r.status_code == 200 else []
+            except httpx.HTTPError as e:
+                print(f"! robots.txt unavailable for {host}: {e}")
+                lines = []
+            parser.parse(lines)
+            self.robots[host] = parser
+
+            rate = self.rate
+            delay = parser.crawl_delay(HEADERS["User-Agent"])
+            if delay:
+                rate = min(rate, 1 / float(delay))
+                print(f"robots.txt Crawl-delay for {host}: {delay}s")
+            self.buckets[host] = TokenBucket(rate, self.burst)
+        return self.robots[host], self.buckets[host]
+
+    async def fetch(self, url: str, headers: Optional[dict] = None) -> Optional[httpx.Response]:
+        """200, 304, 404 or 410 response for url; None if blocked or it kept failing."""
+        robots, bucket = await self._robots_for(url)
+        if not robots.can_fetch(HEADERS["User-Agent"], url):
+            self.stats["robots_blocked"] += 1
+            return None
+
+        error = None
+        for attempt in range(self.retries + 1):
+            await bucket.acquire()
+            retry_after = None
+            try:
+                r = await self.client.get(url, headers=headers)
+                self.stats["fetched"] += 1
+                if r.status_code in (200, 304) or r.status_code in GONE_STATUS:
+                    return r
+                if r.status_code not in RETRY_STATUS:
+                    print(f"✗ {url}: HTTP {r.status_code}")
+                    self.stats["failed"] += 1
+                    return None
+                error, retry_after = f"HTTP {r.status_code}", r.headers.get("Retry-After")
+            except httpx.HTTPError as e:
+                error = f"{type(e).__name__}: {e}"
+            if attempt < self.retries:
+                self.stats["retries"] += 1
+                await asyncio.sleep(retry_delay(attempt, retry_after))
+        print(f"✗ {url}: giving up after {self.retries + 1} attempts ({error})")
+        self.stats["failed"] += 1
+        return None
+
+    def _queue_links(self, q: asyncio.Queue, links):
+        for link in links:
             if link not in VISITED:
                 VISITED.add(link)
-                q.put(link)
+                if self.state:
+                    self.state.enqueue(link)
+                q.put_nowait(link)
+
+    def _record(self, url: str, status: str, **fields):
+        if self.state:
+            self.state.record(url, status, **fields)
+
+    @staticmethod
+    def _have_saved(prev: dict) -> bool:
+        return bool(prev.get("file")) and os.path.exists(os.path.join(DATA_DIR, prev["file"]))
+
+    def _conditional_headers(self, prev: dict) -> dict:
+        # only trust validators while the saved file is still there to reuse
+        if not self._have_saved(prev):
+            return {}
+        headers = {}
+        if prev.get("etag"):
+            headers["If-None-Match"] = prev["etag"]
+        if prev.get("last_modified"):
+            headers["If-Modified-Since"] = prev["last_modified"]
+        return headers
+
+    def _remove_page(self, url: str, prev: dict):
+        """The page is gone from the site (or no longer linked): delete its data files."""
+        if prev.get("file"):
+            for name in page_files(url):
+                path = os.path.join(DATA_DIR, name)
+                if os.path.exists(path):
+                    os.remove(path)
+                    self.state.changed(name, "deleted")
+            self.state.forget(url)
+            self.stats["deleted"] += 1
+            print(f"✗ Removed {url}")
+
+    async def _process(self, q: asyncio.Queue, url: str):
+        prev = self.state.previous(url) if self.state else {}
+        headers = self._conditional_headers(prev)
+        resp = await self.fetch(url, headers)
+        if resp is None:
+            return self._record(url, "failed")
+        if resp.status_code in GONE_STATUS:
+            print(f"✗ {url}: HTTP {resp.status_code}")
+            self.stats["failed"] += 1
+            if self.state:
+                self._remove_page(url, prev)
+            return self._record(url, "gone")
+        if resp.status_code == 304:
+            if not headers:  # a 304 we did not ask for: nothing to reuse
+                print(f"✗ {url}: unexpected HTTP 304")
+                self.stats["failed"] += 1
+                return self._record(url, "failed")
+            self.stats["not_modified"] += 1
+            self._queue_links(q, prev["links"])
+            return self._record(url, "done")
+        if "text/html" not in resp.headers.get("Content-Type", "").lower():
+            return self._record(url, "done")
+
+        html = resp.text
+        self.stats["pages"] += 1
+        # trafilatura is CPU-bound; keep the event loop free for I/O
+        text = await asyncio.to_thread(clean_text, url, html)
+        links = site_links(url, html)
+        fields = {"etag": resp.headers.get("ETag"), "last_modified": resp.headers.get("Last-Modified"),
+                  "links": links}
+        if text:
+            digest = text_hash(text)
+            txt_name, source_name = page_files(url)
+            if digest == prev.get("content_hash") and self._have_saved(prev):
+                self.stats["unchanged"] += 1
+            else:
+                await asyncio.to_thread(write_page, url, text)
+                self.stats["saved"] += 1
+                if self.state:
+                    self.state.changed(txt_name)
+                    self.state.changed(source_name)
+            fields.update(content_hash=digest, file=txt_name)
+        self._queue_links(q, links)
+        self._record(url, "done", **fields)
+
+    async def _worker(self, q: asyncio.Queue):
+        while True:
+            url = await q.get()
+            try:
+                # past the page budget the rest stays queued (resumable with a state)
+                if self.max_pages and self.stats["pages"] >= self.max_pages:
+                    continue
+                await self._process(q, url)
+            except Exception as e:
+                print(f"✗ {url}: {type(e).__name__}: {e}")
+                self.stats["failed"] += 1
+                self._record(url, "failed")
+            finally:
+                q.task_done()
+
+    async def run(self) -> dict:
+        limits = httpx.Limits(max_connections=self.workers, max_keepalive_connections=self.workers)
+        async with httpx.AsyncClient(headers=HEADERS, timeout=20, limits=limits, follow_redirects=True) as client:
+            self.client = client
+            q = asyncio.Queue()
+            if self.state:
+                VISITED.update(self.state.visited())
+                frontier = self.state.frontier()
+            else:
+                VISITED.add(self.start)
+                frontier = [self.start]
+            for url in frontier:
+                q.put_nowait(url)
+            tasks = [asyncio.create_task(self._worker(q)) for _ in range(self.workers)]
+            await q.join()
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return self.stats
+
+def write_changes(path: str, crawl_id: int, complete: bool, changes: dict):
+    """Changed/deleted file names (relative to DATA_DIR) of a crawl, for incremental index builds."""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"crawl_id": crawl_id, "complete": complete, "data_dir": os.path.abspath(DATA_DIR), **changes},
+                  f, indent=2)
+    os.replace(tmp, path)
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Crawl the ATS website into DATA_DIR as .txt files")
+    p.add_argument("--base-url", default=BASE_URL)
+    p.add_argument("--data-dir", default=DATA_DIR)
+    p.add_argument("--serial", action="store_true", help="original one-at-a-time crawler")
+    p.add_argument("--workers", type=int, default=8, help="concurrent fetches")
+    p.add_argument("--rate", type=float, default=1 / RATE_SECONDS, help="max requests/second per host")
+    p.add_argument("--burst", type=int, default=1, help="token-bucket burst size per host")
+    p.add_argument("--retries", type=int, default=MAX_RETRIES)
+    p.add_argument("--max-pages", type=int, default=None,
+                   help="page budget for this run; the rest of the frontier is resumed next run")
+    p.add_argument("--state", default=CRAWL_STATE, help="SQLite crawl state (frontier, validators, hashes)")
+    p.add_argument("--no-state", action="store_true", help="in-memory crawl that rewrites every page")
+    p.add_argument("--restart", action="store_true", help="abandon an unfinished crawl instead of resuming it")
+    p.add_argument("--prune", action="store_true",
+                   help="after a complete crawl, delete pages saved earlier that are no longer linked")
+    p.add_argument("--changes-file", default=CRAWL_CHANGES,
+                   help="JSON list of data files this crawl changed or deleted (for build_index.py --changes)")
+    return p.parse_args(argv)
+
+def main(argv=None):
+    global BASE_URL, DATA_DIR, ALLOWED_NETLOC
+    args = parse_args(argv)
+    BASE_URL, DATA_DIR = args.base_url, args.data_dir
+    ALLOWED_NETLOC = site_domain(BASE_URL)
+    os.makedirs(DATA_DIR, exist_ok=True)
+
+    start = normalize(BASE_URL)
+    print(f"Starting crawl at {start}")
+    t0 = time.perf_counter()
+    if args.serial:
+        stats = {"pages": crawl_serial(start, args.max_pages)}
+    elif args.no_state:
+        crawler = AsyncCrawler(start, workers=args.workers, rate=args.rate, burst=args.burst,
+                               max_pages=args.max_pages, retries=args.retries)
+        stats = asyncio.run(crawler.run())
+    else:
+        state = CrawlState(args.state)
+        try:
+            if state.begin(start, restart=args.restart):
+                print(f"Resuming crawl {state.crawl_id} ({len(state.frontier())} URLs left in the frontier)")
+            crawler = AsyncCrawler(start, workers=args.workers, rate=args.rate, burst=args.burst,
+                                   max_pages=args.max_pages, retries=args.retries, state=state)
+            stats = asyncio.run(crawler.run())
+            complete = not state.frontier()
+            if complete and args.prune:
+                for url, file in state.unreached():
+                    crawler._remove_page(url, {"file": file})
+            changes = state.finish() if complete else state.changes()
+        finally:
+            state.close()
+        write_changes(args.changes_file, state.crawl_id, complete, changes)
+        print(f"{len(changes['changed'])} files changed, {len(changes['deleted'])} deleted "
+              f"→ {args.changes_file}" + ("" if complete else " (crawl incomplete; rerun to resume)"))
+    elapsed = time.perf_counter() - t0
 
     print("Done.")
+    print(f"{stats['pages']} pages in {elapsed:.1f}s ({stats['pages'] / elapsed:.2f} pages/s) "
+          + " ".join(f"{k}={v}" for k, v in stats.items() if k != "pages"))
+    return stats, elapsed
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,163 @@
+# crawl_state.py
+"""
+Persistent crawl state (SQLite), so a crawl can resume after a crash and a
+recrawl only downloads and rewrites what changed.
+
+Tables:
+    crawls   one row per crawl; finished_at is NULL while it is in progress
+    urls     per URL: the crawl that last queued it and its status there
+             (queued / done / failed / gone), the ETag, Last-Modified and
+             extracted-text hash of the last good fetch, the file it was saved
+             to and its same-site links (so a 304 still expands the frontier)
+    changes  data files written or removed by each crawl
+"""
+import json
+import time
+import sqlite3
+from typing import Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS crawls (
+    id          INTEGER PRIMARY KEY,
+    start_url   TEXT NOT NULL,
+    started_at  REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS urls (
+    url           TEXT PRIMARY KEY,
+    crawl_id      INTEGER NOT NULL,
+    status        TEXT NOT NULL,
+    etag          TEXT,
+    last_modified TEXT,
+    content_hash  TEXT,
+    file          TEXT,
+    links         TEXT,
+    fetched_at    REAL
+);
+CREATE INDEX IF NOT EXISTS urls_by_crawl ON urls (crawl_id, status);
+CREATE TABLE IF NOT EXISTS changes (
+    crawl_id INTEGER NOT NULL,
+    file     TEXT NOT NULL,
+    kind     TEXT NOT NULL,
+    PRIMARY KEY (crawl_id, file)
+);
+"""
+
+class CrawlState:
+    """
+    Frontier, visited set and per-URL validators of the current crawl.
+
+    Writes are committed every commit_every updates (and on finish/close); a
+    crash loses at most those, and their URLs are simply fetched again.
+    """
+
+    def __init__(self, path: str, commit_every: int = 50):
+        self.path = path
+        self.commit_every = commit_every
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.crawl_id = None
+        self._pending = 0
+
+    def begin(self, start_url: str, restart: bool = False) -> bool:
+        """Resume the unfinished crawl if there is one (returns True), else start a new one."""
+        row = self.conn.execute(
+            "SELECT id, start_url FROM crawls WHERE finished_at IS NULL ORDER BY id DESC LIMIT 1").fetchone()
+        if row and not restart and row[1] == start_url:
+            self.crawl_id = row[0]
+            return True
+        if row:
+            # abandoned: close it so its URLs count as fetched by an earlier crawl
+            self.conn.execute("UPDATE crawls SET finished_at = ? WHERE id = ?", (time.time(), row[0]))
+        cur = self.conn.execute("INSERT INTO crawls (start_url, started_at) VALUES (?, ?)", (start_url, time.time()))
+        self.crawl_id = cur.lastrowid
+        self.enqueue(start_url)
+        self.conn.commit()
+        return False
+
+    def enqueue(self, url: str) -> bool:
+        """Add url to this crawl's frontier; False if it was already queued or visited in this crawl."""
+        cur = self.conn.execute(
+            "INSERT INTO urls (url, crawl_id, status) VALUES (?, ?, 'queued') "
+            "ON CONFLICT (url) DO UPDATE SET crawl_id = excluded.crawl_id, status = 'queued' "
+            "WHERE urls.crawl_id != excluded.crawl_id",
+            (url, self.crawl_id))
+        self._tick()
+        return cur.rowcount > 0
+
+    def frontier(self) -> list[str]:
+        """URLs queued in this crawl but not fetched yet."""
+        rows = self.conn.execute("SELECT url FROM urls WHERE crawl_id = ? AND status = 'queued'", (self.crawl_id,))
+        return [r[0] for r in rows]
+
+    def visited(self) -> set[str]:
+        """Every URL queued in this crawl, fetched or not."""
+        return {r[0] for r in self.conn.execute("SELECT url FROM urls WHERE crawl_id = ?", (self.crawl_id,))}
+
+    def unreached(self) -> list[tuple[str, str]]:
+        """(url, file) of pages saved by earlier crawls that this crawl never queued."""
+        rows = self.conn.execute("SELECT url, file FROM urls WHERE crawl_id != ? AND file IS NOT NULL",
+                                 (self.crawl_id,))
+        return [tuple(r) for r in rows]
+
+    def previous(self, url: str) -> dict:
+        """Validators, text hash, file and links from the last good fetch of url (empty if none)."""
+        row = self.conn.execute(
+            "SELECT etag, last_modified, content_hash, file, links FROM urls WHERE url = ?", (url,)).fetchone()
+        if not row:
+            return {}
+        return {"etag": row[0], "last_modified": row[1], "content_hash": row[2], "file": row[3],
+                "links": json.loads(row[4]) if row[4] else []}
+
+    def record(self, url: str, status: str, *, etag: Optional[str] = None, last_modified: Optional[str] = None,
+               content_hash: Optional[str] = None, file: Optional[str] = None, links: Optional[list] = None):
+        """Finish url in this crawl; validators and links are only overwritten when given."""
+        self.conn.execute(
+            "UPDATE urls SET status = ?, fetched_at = ?, "
+            "etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified), "
+            "content_hash = COALESCE(?, content_hash), file = COALESCE(?, file), links = COALESCE(?, links) "
+            "WHERE url = ?",
+            (status, time.time(), etag, last_modified, content_hash, file,
+             json.dumps(links) if links is not None else None, url))
+        self._tick()
+
+    def forget(self, url: str):
+        """Drop url's validators and file after it disappeared from the site."""
+        self.conn.execute(
+            "UPDATE urls SET etag = NULL, last_modified = NULL, content_hash = NULL, file = NULL, links = NULL "
+            "WHERE url = ?", (url,))
+        self._tick()
+
+    def changed(self, file: str, kind: str = "changed"):
+        """Note a data file this crawl wrote ("changed") or removed ("deleted")."""
+        self.conn.execute("INSERT OR REPLACE INTO changes (crawl_id, file, kind) VALUES (?, ?, ?)",
+                          (self.crawl_id, file, kind))
+        self._tick()
+
+    def changes(self) -> dict:
+        """{"changed": [...], "deleted": [...]} data files touched by this crawl so far."""
+        out = {"changed": [], "deleted": []}
+        rows = self.conn.execute("SELECT file, kind FROM changes WHERE crawl_id = ? ORDER BY file", (self.crawl_id,))
+        for file, kind in rows:
+            out[kind].append(file)
+        return out
+
+    def finish(self) -> dict:
+        """Mark this crawl complete and return its changes."""
+        self.conn.execute("UPDATE crawls SET finished_at = ? WHERE id = ?", (time.time(), self.crawl_id))
+        self.commit()
+        return self.changes()
+
+    def _tick(self):
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        self.conn.commit()
+        self._pending = 0
+
+    def close(self):
+        self.commit()
+        self.conn.close()
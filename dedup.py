@@ -0,0 +1,121 @@
+# dedup.py
+"""
+Near-duplicate chunk detection with MinHash signatures and LSH banding.
+
+A chunk is shingled into overlapping word n-grams. num_perm universal hash
+functions over the shingle hashes give its MinHash signature, and the share
+of equal slots between two signatures estimates their Jaccard similarity.
+Signatures are cut into bands; chunks sharing any band become candidates,
+and a candidate is a duplicate when its estimated similarity reaches the
+threshold.
+
+Signatures of the indexed chunks are kept in chunk_minhash.npy (rows follow
+the chunk store), so incremental builds can dedup new chunks against the
+existing index without re-reading it.
+"""
+import os
+import hashlib
+from typing import Optional
+import numpy as np
+
+SIGNATURES_FILE = "chunk_minhash.npy"
+DEFAULT_THRESHOLD = 0.85
+DEFAULT_NUM_PERM = 128
+DEFAULT_SHINGLE = 5
+
+_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+def lsh_bands(num_perm: int, threshold: float) -> tuple[int, int]:
+    """
+    (bands, rows) with bands * rows == num_perm whose S-curve midpoint
+    (1/bands) ** (1/rows) is closest to the threshold from below, so true
+    duplicates are rarely missed; false candidates are filtered afterwards.
+    """
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        midpoint = (1 / bands) ** (1 / rows)
+        key = (midpoint > threshold, abs(threshold - midpoint))
+        if best is None or key < best[0]:
+            best = (key, bands, rows)
+    return best[1], best[2]
+
+class MinHasher:
+    """MinHash signatures of word shingles. Picklable, so extraction workers can sign their chunks."""
+
+    def __init__(self, num_perm: int = DEFAULT_NUM_PERM, shingle: int = DEFAULT_SHINGLE, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle = shingle
+        rng = np.random.default_rng(seed)
+        # 32-bit coefficients keep a * h + b (h < 2**32) inside uint64
+        self._a = rng.integers(1, 1 << 32, size=(num_perm, 1), dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, size=(num_perm, 1), dtype=np.uint64)
+
+    def _shingle_hashes(self, text: str) -> np.ndarray:
+        words = text.lower().split()
+        if len(words) <= self.shingle:
+            grams = {" ".join(words)} if words else set()
+        else:
+            grams = {" ".join(words[i:i + self.shingle]) for i in range(len(words) - self.shingle + 1)}
+        return np.fromiter(
+            (int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=4).digest(), "little") for g in grams),
+            dtype=np.uint64, count=len(grams))
+
+    def signature(self, text: str) -> np.ndarray:
+        h = self._shingle_hashes(text)
+        if not len(h):
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint32)
+        return (((self._a * h[None, :] + self._b) % _PRIME) & _MAX_HASH).min(axis=1).astype(np.uint32)
+
+    def signatures(self, texts) -> np.ndarray:
+        out = np.empty((len(texts), self.num_perm), dtype=np.uint32)
+        for i, text in enumerate(texts):
+            out[i] = self.signature(text)
+        return out
+
+class NearDupIndex:
+    """LSH index over chunk signatures: find() returns the canonical chunk a new one duplicates."""
+
+    def __init__(self, hasher: MinHasher, threshold: float = DEFAULT_THRESHOLD):
+        self.hasher = hasher
+        self.threshold = threshold
+        self.bands, self.rows = lsh_bands(hasher.num_perm, threshold)
+        self._buckets = [{} for _ in range(self.bands)]
+        self._sigs = {}
+
+    def __len__(self):
+        return len(self._sigs)
+
+    def _keys(self, sig: np.ndarray):
+        for band in range(self.bands):
+            yield band, sig[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, chunk_id: int, sig: np.ndarray):
+        self._sigs[chunk_id] = sig
+        for band, key in self._keys(sig):
+            self._buckets[band].setdefault(key, []).append(chunk_id)
+
+    def find(self, sig: np.ndarray) -> Optional[int]:
+        """Most similar indexed chunk at or above the threshold, or None."""
+        candidates = set()
+        for band, key in self._keys(sig):
+            candidates.update(self._buckets[band].get(key, ()))
+        best, best_sim = None, self.threshold
+        for cid in candidates:
+            sim = float(np.mean(self._sigs[cid] == sig))
+            if sim >= best_sim and (best is None or sim > best_sim or cid < best):
+                best, best_sim = cid, sim
+        return best
+
+def write_signatures(index_dir: str, sigs: np.ndarray):
+    tmp = os.path.join(index_dir, SIGNATURES_FILE + ".tmp")
+    with open(tmp, "wb") as f:
+        np.save(f, np.asarray(sigs, dtype=np.uint32))
+    os.replace(tmp, os.path.join(index_dir, SIGNATURES_FILE))
+
+def read_signatures(index_dir: str) -> Optional[np.ndarray]:
+    path = os.path.join(index_dir, SIGNATURES_FILE)
+    return np.load(path) if os.path.exists(path) else None
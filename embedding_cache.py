@@ -0,0 +1,150 @@
+# embedding_cache.py
+"""
+Persistent embedding cache for index builds.
+
+Vectors are keyed by (model name, normalisation flag, chunk text hash).
+Each (model, normalize) pair gets its own namespace directory holding
+meta.json and vectors.bin, an append-only file of fixed-size records
+(16-byte blake2b digest of the chunk text + float32 vector). New vectors
+are appended after every batch; gc() rewrites the file keeping the entries
+still in use plus the most recent others up to max_entries.
+"""
+import os
+import json
+import hashlib
+import numpy as np
+
+VECTORS_FILE = "vectors.bin"
+META_FILE = "meta.json"
+
+def text_digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+class EmbeddingCache:
+    def __init__(self, cache_dir: str, model: str, normalize: bool = True, max_entries: int = 1_000_000):
+        self.model = model
+        self.normalize = normalize
+        self.max_entries = max_entries
+        ns = hashlib.sha1(f"{model}|normalize={normalize}".encode("utf-8")).hexdigest()[:16]
+        self.dir = os.path.join(cache_dir, ns)
+        self.path = os.path.join(self.dir, VECTORS_FILE)
+        self.dim = None
+        self._rows = {}       # digest -> row in self._vecs
+        self._vecs = np.zeros((0, 0), dtype=np.float32)  # grows by doubling; rows < len(self._keys) are valid
+        self._keys = []       # digests in file order
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _dtype(self):
+        return np.dtype([("key", "V16"), ("vec", "<f4", (self.dim,))])
+
+    def _load(self):
+        meta_path = os.path.join(self.dir, META_FILE)
+        if not os.path.exists(meta_path) or not os.path.exists(self.path):
+            return
+        with open(meta_path, "r", encoding="utf-8") as f:
+            self.dim = json.load(f)["dim"]
+        dtype = self._dtype()
+        n = os.path.getsize(self.path) // dtype.itemsize  # ignore a torn trailing record
+        records = np.fromfile(self.path, dtype=dtype, count=n)
+        self._vecs = np.ascontiguousarray(records["vec"])
+        self._keys = [bytes(k) for k in records["key"]]
+        self._rows = {k: i for i, k in enumerate(self._keys)}  # later duplicates win
+
+    def __len__(self):
+        return len(self._rows)
+
+    def lookup(self, texts):
+        """Return (vectors or None per text, digests)."""
+        digests = [text_digest(t) for t in texts]
+        found = []
+        for d in digests:
+            row = self._rows.get(d)
+            found.append(None if row is None else self._vecs[row])
+        hits = sum(v is not None for v in found)
+        self.hits += hits
+        self.misses += len(texts) - hits
+        return found, digests
+
+    def add(self, digests, vecs):
+        """Append newly computed vectors."""
+        vecs = np.ascontiguousarray(vecs, dtype=np.float32)
+        if not len(digests):
+            return
+        if self.dim is None:
+            self.dim = int(vecs.shape[1])
+            os.makedirs(self.dir, exist_ok=True)
+            with open(os.path.join(self.dir, META_FILE), "w", encoding="utf-8") as f:
+                json.dump({"model": self.model, "normalize": self.normalize, "dim": self.dim}, f)
+            self._vecs = np.zeros((0, self.dim), dtype=np.float32)
+        records = np.empty(len(digests), dtype=self._dtype())
+        records["key"] = digests
+        records["vec"] = vecs
+        with open(self.path, "ab") as f:
+            records.tofile(f)
+
+        start = len(self._keys)
+        needed = start + len(vecs)
+        if needed > len(self._vecs):
+            grown = np.zeros((max(needed, 2 * len(self._vecs)), self.dim), dtype=np.float32)
+            grown[:start] = self._vecs[:start]
+            self._vecs = grown
+        self._vecs[start:needed] = vecs
+        for i, d in enumerate(digests):
+            self._keys.append(d)
+            self._rows[d] = start + i
+
+    def encode(self, texts, encode_fn):
+        """Embed texts, calling encode_fn(list_of_texts) only for cache misses."""
+        found, digests = self.lookup(texts)
+        missing = [i for i, v in enumerate(found) if v is None]
+        if missing:
+            new = np.asarray(encode_fn([texts[i] for i in missing]), dtype=np.float32)
+            # texts repeated within one batch are only stored once
+            seen = {}
+            for i, vec in zip(missing, new):
+                found[i] = vec
+                seen.setdefault(digests[i], vec)
+            self.add(list(seen), np.array(list(seen.values())))
+        if not texts:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.vstack(found).astype(np.float32)
+
+    def gc(self, live_texts, drop_unused: bool = False):
+        """Compact the cache file.
+
+        Entries for live_texts are always kept. Other entries are kept, most
+        recent first, up to max_entries, or dropped entirely with drop_unused.
+        Returns the number of entries removed.
+        """
+        if self.dim is None:
+            return 0
+        live = {text_digest(t) for t in live_texts}
+        # latest row per digest, in file order
+        latest = sorted(self._rows.items(), key=lambda kv: kv[1])
+        keep_live = [(d, r) for d, r in latest if d in live]
+        others = [] if drop_unused else [(d, r) for d, r in latest if d not in live]
+        budget = max(0, self.max_entries - len(keep_live))
+        others = others[max(0, len(others) - budget):] if budget else []
+        kept = sorted(keep_live + others, key=lambda kv: kv[1])
+
+        removed = len(self._keys) - len(kept)
+        if removed <= 0:
+            return 0
+        rows = np.array([r for _, r in kept], dtype=np.int64)
+        records = np.empty(len(kept), dtype=self._dtype())
+        records["key"] = [d for d, _ in kept]
+        records["vec"] = self._vecs[rows]
+        tmp = self.path + ".tmp"
+        records.tofile(tmp)
+        os.replace(tmp, self.path)
+
+        self._vecs = np.ascontiguousarray(records["vec"])
+        self._keys = [d for d, _ in kept]
+        self._rows = {d: i for i, d in enumerate(self._keys)}
+        return removed
+
+    def stats(self):
+        return {"entries": len(self._rows), "hits": self.hits, "misses": self.misses,
+                "file_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0}
@@ -1,5 +1,10 @@
 # gradio_wrapper.py
-from rag_chat import answer as rag_answer
+import remote_client
+
+if remote_client.ENABLED:  # answers come from server.py (RAG_BACKEND_URL)
+    from remote_client import answer as rag_answer, answer_stream as rag_answer_stream
+else:
+    from rag_chat import answer as rag_answer, answer_stream as rag_answer_stream
 
 def gradio_answer(message: str, history: list):
     """
@@ -17,4 +22,24 @@ def gradio_answer(message: str, history: list):
     except Exception as e:
         error_msg = f"Error: {str(e)}"
         print(f"❌ Error: {error_msg}")
-        return error_msg
\ No newline at end of file
+        return error_msg
+
+def gradio_answer_stream(message: str, history: list):
+    """
+    Streaming wrapper for gr.ChatInterface: yields the growing answer text
+    so the chat bubble renders token by token.
+    """
+    print(f"📨 Received message: {message}")
+    text = ""
+    try:
+        for event in rag_answer_stream(message, history):
+            if event["type"] == "delta":
+                text += event["text"]
+                yield text
+            elif event["type"] == "done":
+                ttft = event["ttft"] or 0.0
+                print(f"✅ Response streamed: ttft={ttft:.2f}s total={event['latency']:.2f}s")
+    except Exception as e:
+        error_msg = f"Error: {str(e)}"
+        print(f"❌ Error: {error_msg}")
+        yield error_msg
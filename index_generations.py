@@ -0,0 +1,70 @@
+# index_generations.py
+"""
+Versioned index directories, so a rebuild replaces the whole index set at once.
+
+build_index.py writes every file of a build (faiss.index, chunk and parent
+stores, signatures, BM25 and language sub-indexes, manifest and metadata)
+into a fresh directory and then swaps a single pointer:
+
+    <INDEX_DIR>/CURRENT                       "generations/<timestamp>"
+    <INDEX_DIR>/generations/<timestamp>/      one complete index set
+
+A loader resolves CURRENT once and reads every file from that directory,
+so a worker that starts during a rebuild sees either the old set or the
+new one, never a new faiss.index over old chunk offsets. Incremental builds
+start from hard links to the current set's files (copies where the file
+system has no hard links); the writers always replace files, so the
+published set is never modified. The previous generation is kept for
+workers still loading it; older ones are removed.
+
+An INDEX_DIR without CURRENT is read as the flat layout of older builds.
+Files that are not part of a build (onnx/, faq/) stay at the top level.
+"""
+import os
+import shutil
+import datetime
+
+CURRENT_FILE = "CURRENT"
+GENERATIONS_DIR = "generations"
+KEEP_GENERATIONS = 2  # the published one and the one it replaced
+
+def has_generations(index_dir: str) -> bool:
+    return os.path.exists(os.path.join(index_dir, CURRENT_FILE))
+
+def current_dir(index_dir: str) -> str:
+    """Directory of the published index set (index_dir itself for the flat layout)."""
+    path = os.path.join(index_dir, CURRENT_FILE)
+    if not os.path.exists(path):
+        return index_dir
+    with open(path, "r", encoding="utf-8") as f:
+        return os.path.join(index_dir, f.read().strip())
+
+def _link(src: str, dst: str):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+def stage(index_dir: str, base: str = None) -> str:
+    """A new, unpublished generation directory, holding the files of base when given."""
+    name = datetime.datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    gen_dir = os.path.join(index_dir, GENERATIONS_DIR, name)
+    if base is None:
+        os.makedirs(gen_dir)
+    else:
+        shutil.copytree(base, gen_dir, copy_function=_link, ignore=shutil.ignore_patterns("*.tmp"))
+    return gen_dir
+
+def publish(index_dir: str, gen_dir: str):
+    """Point CURRENT at gen_dir (one atomic rename) and remove generations older than the previous one."""
+    tmp = os.path.join(index_dir, CURRENT_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(os.path.relpath(gen_dir, index_dir).replace(os.sep, "/"))
+    os.replace(tmp, os.path.join(index_dir, CURRENT_FILE))
+    root = os.path.join(index_dir, GENERATIONS_DIR)
+    names = sorted(os.listdir(root))
+    keep = set(names[max(0, names.index(os.path.basename(gen_dir)) - KEEP_GENERATIONS + 1):])
+    for name in names:
+        if name not in keep:
+            # Fails on Windows while a worker still maps the files; retried after the next build
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
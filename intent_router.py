@@ -0,0 +1,243 @@
+# intent_router.py
+"""
+Embedding-based intent router: a fast path for small talk and known FAQs.
+
+Each intent in intents.json (RAG_INTENTS_FILE) has example phrasings per
+language and a kind:
+
+    small_talk    greetings, thanks: a fixed reply, for messages of at most
+                  SMALL_TALK_MAX_WORDS words
+    out_of_scope  requests Manara should not handle: a fixed redirect
+    faq           the quick-action questions: a stored answer per language
+
+The examples are encoded once, with the shared embedder, when the models
+load. A query is compared with the examples of its own language using the
+query vector the pipeline computes anyway, so routing costs one small
+matrix-vector product. A match at or above RAG_INTENT_THRESHOLD
+(RAG_FAQ_THRESHOLD for FAQs) is answered right away, without retrieval or
+the LLM; everything else goes through the full pipeline.
+
+FAQ answers are produced offline: `python intent_router.py --build` runs
+each FAQ through the pipeline once per language, without history and at
+temperature 0, and stores the answers and sources in
+<INDEX_DIR>/faq/answers.json, tagged with the index build, so a rebuilt
+index makes them stale. Until then (or for a FAQ the build could not
+answer) the question goes through the full pipeline. A curated "answer"
+in intents.json takes precedence. Serving never writes the store.
+
+    python intent_router.py --build                                # store the FAQ answers for this index
+    python intent_router.py "hi there" "how much are the fees?"   # show the routing decision
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import Counter
+import numpy as np
+from conversation import looks_like_follow_up
+from language import detect_language
+
+INTENTS_FILE = os.getenv("RAG_INTENTS_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "intents.json"))
+STORE_FILE = os.path.join("faq", "answers.json")  # in a subdirectory, so writing it does not invalidate the answer cache
+KINDS = ("small_talk", "out_of_scope", "faq")
+SMALL_TALK_MAX_WORDS = 6
+
+def load_intents(path: str = INTENTS_FILE):
+    with open(path, "r", encoding="utf-8") as f:
+        intents = json.load(f)["intents"]
+    for intent in intents:
+        if intent.get("kind") not in KINDS:
+            raise ValueError(f"intent {intent.get('name')!r}: unknown kind {intent.get('kind')!r}")
+        if intent["kind"] != "faq" and not intent.get("answer"):
+            raise ValueError(f"intent {intent['name']!r} needs an answer")
+    return intents
+
+class Match:
+    """A query routed to an intent; answer is set when it can be served on the fast path."""
+
+    def __init__(self, intent: str, kind: str, score: float, lang: str, answer: str = None, sources=()):
+        self.intent = intent
+        self.kind = kind
+        self.score = score
+        self.lang = lang
+        self.answer = answer
+        self.sources = list(sources)
+
+    @property
+    def fast(self) -> bool:
+        return self.answer is not None
+
+class AnswerStore:
+    """Pipeline answers to the FAQs, per intent and language, valid for one index build."""
+
+    def __init__(self, path: str = None, fingerprint: str = None):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.answers = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Warning: stored FAQ answers not loaded, FAQs go through the pipeline: {e}")
+                return
+            if data.get("fingerprint") == fingerprint:
+                self.answers = data.get("answers", {})
+            else:
+                print("Stored FAQ answers are from another index build; run `python intent_router.py --build`")
+
+    def get(self, intent: str, lang: str):
+        return self.answers.get(intent, {}).get(lang)
+
+    def save(self, answers: dict):
+        """Replace every stored answer ({intent: {lang: {"answer", "sources"}}}) at once."""
+        self.answers = answers
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": self.fingerprint, "answers": answers}, f, indent=1, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+class IntentRouter:
+    """
+    encode(texts) -> normalized vectors, from the same embedder as the
+    query vectors passed to route().
+    """
+
+    def __init__(self, intents, encode, store: AnswerStore = None, threshold: float = 0.8,
+                 faq_threshold: float = 0.88):
+        self.intents = {intent["name"]: intent for intent in intents}
+        self.store = store or AnswerStore()
+        self.threshold = threshold
+        self.faq_threshold = faq_threshold
+        self._examples = {}  # lang -> (example vectors, intent name per row)
+        for lang in ("ar", "en"):
+            names, texts = [], []
+            for intent in intents:
+                for text in intent["examples"].get(lang, []):
+                    names.append(intent["name"])
+                    texts.append(text)
+            if texts:
+                self._examples[lang] = (np.asarray(encode(texts), dtype=np.float32), names)
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._by_intent = Counter()
+
+    @classmethod
+    def from_env(cls, encode, index_dir: str, fingerprint: str = None):
+        return cls(
+            load_intents(INTENTS_FILE),
+            encode,
+            AnswerStore(os.path.join(index_dir, STORE_FILE), fingerprint),
+            threshold=float(os.getenv("RAG_INTENT_THRESHOLD", "0.8")),
+            faq_threshold=float(os.getenv("RAG_FAQ_THRESHOLD", "0.88")),
+        )
+
+    def classify(self, vec, lang: str):
+        """(intent name, similarity) of the closest example in lang, or (None, 0.0)."""
+        if lang not in self._examples:
+            return None, 0.0
+        vecs, names = self._examples[lang]
+        sims = vecs @ np.asarray(vec, dtype=np.float32).reshape(-1)
+        best = int(np.argmax(sims))
+        return names[best], float(sims[best])
+
+    def route(self, query: str, vec, in_conversation: bool = False):
+        """Match for a query (vec: its normalized embedding), or None for the full pipeline."""
+        lang = detect_language(query)
+        name, score = self.classify(vec, lang)
+        match = None
+        if name is not None:
+            intent = self.intents[name]
+            threshold = self.faq_threshold if intent["kind"] == "faq" else self.threshold
+            if score >= threshold and self._applies(intent, query, in_conversation):
+                answer, sources = self._answer(intent, lang)
+                match = Match(name, intent["kind"], score, lang, answer, sources)
+        self._count(match)
+        return match
+
+    @staticmethod
+    def _applies(intent, query: str, in_conversation: bool) -> bool:
+        if intent["kind"] == "small_talk":
+            return len(query.split()) <= SMALL_TALK_MAX_WORDS
+        if intent["kind"] == "faq" and in_conversation:
+            # "and the fees there?" depends on what was said before
+            return not looks_like_follow_up(query)
+        return True
+
+    def _answer(self, intent, lang: str):
+        curated = intent.get("answer")
+        if curated:
+            return curated.get(lang) or next(iter(curated.values())), ()
+        stored = self.store.get(intent["name"], lang)
+        return (stored["answer"], stored["sources"]) if stored else (None, ())
+
+    def build_answers(self, faq_answer):
+        """Store an answer to every FAQ without a curated one, in each language.
+
+        faq_answer(question) -> (answer, sources), or (None, []) when the
+        pipeline found nothing; such FAQs keep going through the pipeline.
+        Returns the stored answers.
+        """
+        answers = {}
+        for intent in self.intents.values():
+            if intent["kind"] != "faq" or intent.get("answer"):
+                continue
+            for lang, examples in intent["examples"].items():
+                answer, sources = faq_answer(examples[0])
+                if answer:
+                    answers.setdefault(intent["name"], {})[lang] = {
+                        "question": examples[0], "answer": answer, "sources": list(sources),
+                        "created_at": round(time.time())}
+        self.store.save(answers)
+        return answers
+
+    def _count(self, match):
+        with self._lock:
+            self._counts["requests"] += 1
+            if match is None:
+                return
+            self._by_intent[match.intent] += 1
+            self._counts["fast_path" if match.fast else "faq_misses"] += 1
+
+    def stats(self) -> dict:
+        """Requests routed, how many were served on the fast path, and matches per intent."""
+        with self._lock:
+            n = self._counts["requests"]
+            return {"requests": n, "fast_path": self._counts["fast_path"],
+                    "fast_share": round(self._counts["fast_path"] / n, 4) if n else 0.0,
+                    "faq_misses": self._counts["faq_misses"], "intents": dict(self._by_intent)}
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Show intent routing decisions, or produce the stored FAQ answers")
+    p.add_argument("queries", nargs="*")
+    p.add_argument("--build", action="store_true",
+                   help="answer every FAQ without a curated answer in each language through the full pipeline")
+    args = p.parse_args(argv)
+
+    import rag_chat
+    router = rag_chat.get_rag_components().get("router")
+    if router is None:
+        sys.exit("The intent router is disabled (RAG_INTENT_ROUTER=0) or intents.json could not be loaded.")
+    if args.build:
+        answers = router.build_answers(rag_chat.faq_answer)
+        for intent in router.intents.values():
+            if intent["kind"] == "faq" and not intent.get("answer"):
+                for lang in intent["examples"]:
+                    stored = lang in answers.get(intent["name"], {})
+                    print(f"{intent['name']} [{lang}]: {'stored' if stored else 'NOT stored, answered by the pipeline'}")
+        print(f"FAQ answers written to {router.store.path}")
+    for query in args.queries:
+        vec = rag_chat.embed_query(query)[0]
+        name, score = router.classify(vec, detect_language(query))
+        match = router.route(query, vec)
+        decision = f"fast path ({match.intent})" if match is not None and match.fast else \
+            f"pipeline, no stored FAQ answer ({match.intent})" if match is not None else "pipeline"
+        print(f"{query!r}: closest {name} ({score:.3f}) -> {decision}")
+
+if __name__ == "__main__":
+    main()
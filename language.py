@@ -0,0 +1,14 @@
+# language.py
+import re
+
+# Arabic, Arabic Supplement, Arabic Extended-A and presentation forms
+ARABIC_RE = re.compile("[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFF]")
+LATIN_RE = re.compile(r"[A-Za-z]")
+
+def detect_language(text: str) -> str:
+    """Return "ar" when Arabic letters dominate the text, otherwise "en"."""
+    arabic = len(ARABIC_RE.findall(text or ""))
+    latin = len(LATIN_RE.findall(text or ""))
+    if arabic and arabic >= latin:
+        return "ar"
+    return "en"
@@ -0,0 +1,130 @@
+# language_index.py
+"""
+Per-language FAISS sub-indexes, for routing a query to the chunks of its language.
+
+build_index.py tags every chunk "ar" or "en" (language.detect_language:
+the dominant script) and, besides faiss.index over all chunks, writes one
+sub-index per language holding only that language's chunks under the same
+chunk ids:
+
+    faiss_ar.index, faiss_en.index   id-mapped FAISS indexes (ann_index.py types)
+    languages.json                   {lang: {"ntotal", "index_type", "build_params",
+                                      "search_params", "model", "model_key"}}
+
+A language may use its own embedding model (RAG_EMB_MODEL_AR /
+RAG_EMB_MODEL_EN, e.g. a multilingual model for Arabic); its sub-index then
+holds that model's vectors and queries in that language are encoded with
+it. RAG_RERANK_MODEL_AR / RAG_RERANK_MODEL_EN pick the cross-encoder for
+queries in a language and only matter at query time.
+
+route_search() searches the query's own language; when its best score is
+below min_score (or the language has no chunks), the other language's
+sub-index is searched too and the hits are merged by score, so a question
+asked in one language can still be answered from documents in the other.
+"""
+import os
+import json
+import numpy as np
+import faiss
+from language import detect_language
+
+LANGUAGES = ("ar", "en")
+META_FILE = "languages.json"
+
+def index_file(lang: str) -> str:
+    return f"faiss_{lang}.index"
+
+def other_language(lang: str) -> str:
+    return "en" if lang == "ar" else "ar"
+
+def embedding_model(lang: str, default: str) -> str:
+    """Embedding model for the chunks (and queries) of a language."""
+    return os.getenv(f"RAG_EMB_MODEL_{lang.upper()}") or default
+
+def rerank_model(lang: str, default: str = None) -> str:
+    """Cross-encoder for queries in a language (default: the shared one)."""
+    return os.getenv(f"RAG_RERANK_MODEL_{lang.upper()}") or default
+
+def chunk_languages(texts):
+    return [detect_language(str(t)) for t in texts]
+
+def has_language_indexes(index_dir: str) -> bool:
+    meta = read_language_meta(index_dir)
+    return bool(meta) and all(os.path.exists(os.path.join(index_dir, index_file(lang))) for lang in meta)
+
+def read_language_meta(index_dir: str) -> dict:
+    path = os.path.join(index_dir, META_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def write_language_indexes(index_dir: str, indexes: dict, meta: dict):
+    """Atomically replace the sub-indexes; languages missing from indexes are removed."""
+    for lang, index in indexes.items():
+        tmp = os.path.join(index_dir, index_file(lang) + ".tmp")
+        faiss.write_index(index, tmp)
+        os.replace(tmp, os.path.join(index_dir, index_file(lang)))
+    write_language_meta(index_dir, {lang: {**meta[lang], "ntotal": int(indexes[lang].ntotal)} for lang in indexes})
+    for lang in LANGUAGES:
+        path = os.path.join(index_dir, index_file(lang))
+        if lang not in indexes and os.path.exists(path):
+            os.remove(path)
+
+def write_language_meta(index_dir: str, meta: dict):
+    tmp = os.path.join(index_dir, META_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp, os.path.join(index_dir, META_FILE))
+
+def remove_language_indexes(index_dir: str):
+    for name in [META_FILE] + [index_file(lang) for lang in LANGUAGES]:
+        path = os.path.join(index_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+def _merge(d1, i1, d2, i2, k: int):
+    """Top k of two result rows by score, each id once."""
+    ids = np.concatenate([i1, i2])
+    scores = np.concatenate([d1, d2])
+    order = np.argsort(-scores, kind="stable")
+    _, first = np.unique(ids[order], return_index=True)
+    keep = order[np.sort(first)]
+    keep = keep[ids[keep] != -1][:k]
+    D = np.full(k, -np.inf, dtype=np.float32)
+    I = np.full(k, -1, dtype=np.int64)
+    D[:len(keep)], I[:len(keep)] = scores[keep], ids[keep]
+    return D, I
+
+def route_search(indexes: dict, langs, encode, k: int, min_score: float):
+    """FAISS search of each query's language sub-index, with cross-lingual fallback.
+
+    langs is the language of each query; encode(lang, rows) returns the
+    vectors of those query rows for lang's sub-index. Returns (D, I, routes)
+    shaped like index.search() over all queries, routes[row] being
+    {"lang", "fallback" (the other language, if it was searched), "searched"
+    (vectors in the indexes searched)}.
+    """
+    n = len(langs)
+    D = np.full((n, k), -np.inf, dtype=np.float32)
+    I = np.full((n, k), -1, dtype=np.int64)
+    routes = [{"lang": lang, "fallback": None, "searched": 0} for lang in langs]
+    for lang in LANGUAGES:
+        rows = [r for r, q_lang in enumerate(langs) if q_lang == lang]
+        if not rows:
+            continue
+        index = indexes.get(lang)
+        if index is not None and index.ntotal:
+            D[rows], I[rows] = index.search(encode(lang, rows), k)
+            for r in rows:
+                routes[r]["searched"] += int(index.ntotal)
+        other = indexes.get(other_language(lang))
+        weak = [r for r in rows if I[r, 0] == -1 or D[r, 0] < min_score]
+        if not weak or other is None or not other.ntotal:
+            continue
+        d, i = other.search(encode(other_language(lang), weak), k)
+        for j, r in enumerate(weak):
+            D[r], I[r] = _merge(D[r], I[r], d[j], i[j], k)
+            routes[r]["fallback"] = other_language(lang)
+            routes[r]["searched"] += int(other.ntotal)
+    return D, I, routes
@@ -0,0 +1,194 @@
+# lexical_index.py
+"""
+Compact BM25 inverted index over the chunk texts, with Arabic normalisation.
+
+Layout inside the index directory (written next to the chunk store):
+    lexical_vocab.json   {"terms": [...], "k1", "b", "avgdl"}; a term's
+                         position is its term id
+    lexical_offsets.npy  int64 posting-list offsets, len = n_terms + 1
+    lexical_rows.npy     int32 row of each posting (rows of lexical_ids.npy)
+    lexical_tfs.npy      uint16 term frequency of each posting
+    lexical_doclen.npy   uint32 token count per row
+    lexical_ids.npy      int64 chunk id (FAISS id) per row
+
+Postings are memory-mapped; a query only touches the lists of its terms.
+Index and queries go through the same analyzer: Arabic diacritics and
+tatweel are stripped, alef/yaa/taa-marbuta/hamza forms folded, Arabic-Indic
+digits mapped to ASCII, and words lightly stemmed (Light10-style affixes
+for Arabic, plural endings for English).
+"""
+import os
+import re
+import json
+from collections import Counter
+import numpy as np
+
+VOCAB_FILE = "lexical_vocab.json"
+OFFSETS_FILE = "lexical_offsets.npy"
+ROWS_FILE = "lexical_rows.npy"
+TFS_FILE = "lexical_tfs.npy"
+DOCLEN_FILE = "lexical_doclen.npy"
+IDS_FILE = "lexical_ids.npy"
+FILES = (VOCAB_FILE, OFFSETS_FILE, ROWS_FILE, TFS_FILE, DOCLEN_FILE, IDS_FILE)
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Harakat, superscript alef, Quranic marks and tatweel
+DIACRITICS_RE = re.compile("[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]")
+THOUSANDS_RE = re.compile(r"(?<=\d)[,\u066C](?=\d{3})")
+TOKEN_RE = re.compile(r"\w+")
+ARABIC_FOLD = str.maketrans({
+    "\u0623": "\u0627", "\u0625": "\u0627", "\u0622": "\u0627", "\u0671": "\u0627",  # أ إ آ ٱ -> ا
+    "\u0649": "\u064A",  # ى -> ي
+    "\u0629": "\u0647",  # ة -> ه
+    "\u0624": "\u0648",  # ؤ -> و
+    "\u0626": "\u064A",  # ئ -> ي
+    **{chr(0x0660 + d): str(d) for d in range(10)},  # Arabic-Indic digits
+    **{chr(0x06F0 + d): str(d) for d in range(10)},  # Extended Arabic-Indic digits
+})
+# Light10 affixes, written after folding (so ية is يه)
+AR_PREFIXES = ("\u0648\u0627\u0644", "\u0628\u0627\u0644", "\u0643\u0627\u0644", "\u0641\u0627\u0644",
+               "\u0644\u0644", "\u0627\u0644")  # وال بال كال فال لل ال
+AR_SUFFIXES = ("\u0647\u0627", "\u0627\u0646", "\u0627\u062A", "\u0648\u0646", "\u064A\u0646",
+               "\u064A\u0647", "\u0647", "\u064A")  # ها ان ات ون ين يه ه ي
+ARABIC_LETTER_RE = re.compile("[\u0621-\u064A]")
+
+def normalize(text: str) -> str:
+    text = DIACRITICS_RE.sub("", text.lower())
+    return THOUSANDS_RE.sub("", text.translate(ARABIC_FOLD))
+
+def _stem_arabic(word: str) -> str:
+    if len(word) > 3 and word.startswith("\u0648"):  # conjunction و
+        word = word[1:]
+    for prefix in AR_PREFIXES:
+        if word.startswith(prefix) and len(word) - len(prefix) >= 2:
+            word = word[len(prefix):]
+            break
+    for suffix in AR_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 2:
+            word = word[:-len(suffix)]
+    return word
+
+def _stem_english(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("ches", "shes", "sses", "xes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+def analyze(text: str) -> list[str]:
+    """Normalised, lightly stemmed terms of a text."""
+    terms = []
+    for tok in TOKEN_RE.findall(normalize(text or "")):
+        if ARABIC_LETTER_RE.search(tok):
+            tok = _stem_arabic(tok)
+        elif not tok.isdigit():
+            tok = _stem_english(tok)
+        terms.append(tok)
+    return terms
+
+def has_lexical_index(index_dir: str) -> bool:
+    return all(os.path.exists(os.path.join(index_dir, f)) for f in FILES)
+
+def write_lexical_index(index_dir: str, texts, ids=None):
+    """Build the BM25 index for texts (rows of the chunk store, chunk ids = ids or row numbers)."""
+    ids = np.arange(len(texts), dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64)
+    vocab = {}
+    postings = []  # per term: list of (row, tf)
+    doclen = np.zeros(len(texts), dtype=np.uint32)
+    for row, text in enumerate(texts):
+        counts = Counter(analyze(str(text)))
+        doclen[row] = sum(counts.values())
+        for term, tf in counts.items():
+            tid = vocab.setdefault(term, len(vocab))
+            if tid == len(postings):
+                postings.append([])
+            postings[tid].append((row, min(tf, 65535)))
+
+    offsets = np.zeros(len(postings) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(p) for p in postings])
+    rows = np.empty(int(offsets[-1]), dtype=np.int32)
+    tfs = np.empty(int(offsets[-1]), dtype=np.uint16)
+    for tid, plist in enumerate(postings):
+        if plist:
+            block = np.asarray(plist, dtype=np.int64)
+            rows[offsets[tid]:offsets[tid + 1]] = block[:, 0]
+            tfs[offsets[tid]:offsets[tid + 1]] = block[:, 1]
+
+    meta = {"terms": list(vocab), "k1": BM25_K1, "b": BM25_B,
+            "avgdl": float(doclen.mean()) if len(doclen) else 0.0}
+    tmp_files = []
+    for name, arr in ((OFFSETS_FILE, offsets), (ROWS_FILE, rows), (TFS_FILE, tfs),
+                      (DOCLEN_FILE, doclen), (IDS_FILE, ids)):
+        tmp = os.path.join(index_dir, name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, arr)
+        tmp_files.append((name, tmp))
+    tmp = os.path.join(index_dir, VOCAB_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    tmp_files.append((VOCAB_FILE, tmp))
+    for name, tmp in tmp_files:
+        os.replace(tmp, os.path.join(index_dir, name))
+    return len(vocab)
+
+def remove_lexical_index(index_dir: str):
+    for name in FILES:
+        path = os.path.join(index_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+class LexicalIndex:
+    """Memory-mapped BM25 reader for an index written by write_lexical_index."""
+
+    def __init__(self, index_dir: str):
+        with open(os.path.join(index_dir, VOCAB_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.vocab = {t: i for i, t in enumerate(meta["terms"])}
+        self.k1, self.b, self.avgdl = meta["k1"], meta["b"], meta["avgdl"] or 1.0
+        load = lambda name: np.load(os.path.join(index_dir, name), mmap_mode="r")
+        self._offsets = load(OFFSETS_FILE)
+        self._rows = load(ROWS_FILE)
+        self._tfs = load(TFS_FILE)
+        self._ids = load(IDS_FILE)
+        doclen = np.asarray(load(DOCLEN_FILE), dtype=np.float32)
+        # per-row part of the BM25 denominator, computed once
+        self._norm = self.k1 * (1 - self.b + self.b * doclen / self.avgdl)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def search(self, query: str, k: int = 30):
+        """Top-k (chunk ids, BM25 scores), best first; empty arrays when no query term is indexed."""
+        n = len(self)
+        scores = None
+        for term in set(analyze(query)):
+            tid = self.vocab.get(term)
+            if tid is None:
+                continue
+            start, end = int(self._offsets[tid]), int(self._offsets[tid + 1])
+            rows = np.asarray(self._rows[start:end])
+            tf = np.asarray(self._tfs[start:end], dtype=np.float32)
+            idf = np.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+            if scores is None:
+                scores = np.zeros(n, dtype=np.float32)
+            scores[rows] += idf * tf * (self.k1 + 1) / (tf + self._norm[rows])
+        if scores is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        hits = np.flatnonzero(scores)
+        top = hits[np.argsort(-scores[hits], kind="stable")[:k]]
+        return np.asarray(self._ids[top], dtype=np.int64), scores[top]
+
+def reciprocal_rank_fusion(rankings, rrf_k: int = 60, limit: int = None):
+    """Fuse ranked id lists: score(id) = sum over lists of 1 / (rrf_k + rank). Returns [(id, score)], best first."""
+    fused = {}
+    for ranking in rankings:
+        for rank, cid in enumerate(ranking, start=1):
+            cid = int(cid)
+            if cid != -1:
+                fused[cid] = fused.get(cid, 0.0) + 1.0 / (rrf_k + rank)
+    ranked = sorted(fused.items(), key=lambda kv: -kv[1])
+    return ranked[:limit] if limit else ranked
@@ -1,12 +1,16 @@
 # main.py
-from rag_chat import answer
+import resources
+import metrics
+from gradio_wrapper import gradio_answer_stream
 from ui import build_ui
 
 if __name__ == "__main__":
-    demo = build_ui(answer)
+    resources.start()  # load and warm up models/index while the UI comes up
+    metrics.start_server()  # /metrics when RAG_METRICS_PORT is set
+    demo = build_ui(gradio_answer_stream)
     demo.launch(
         server_name="127.0.0.1",
         server_port=7871,
         share=True,
         inbrowser=True
-    )
\ No newline at end of file
+    )
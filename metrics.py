@@ -0,0 +1,339 @@
+# metrics.py
+"""
+Low-overhead tracing and metrics for the RAG pipeline.
+
+A request runs inside a trace (answer(), answer_stream(), answer_async());
+each pipeline stage inside it is a span: encode, search, rerank, prompt,
+llm. A span costs two perf_counter() calls and a locked histogram update,
+so instrumentation stays on in production. Process-wide the registry keeps
+counters (requests, cache hits, empty retrievals, LLM and pipeline errors,
+prompt/completion tokens from the completion's usage) and latency
+histograms per stage and per request.
+
+Finished traces go to the exporters: JsonlExporter appends one JSON line
+per request (stage timings, tokens, error), and any object with an
+export(record) method can be added with add_exporter(). The registry is
+served in Prometheus text format at /metrics by start_server().
+
+A sampled share of traces (RAG_PROFILE_SAMPLE) runs under cProfile; the
+profile is kept (RAG_PROFILE_DIR) only when the request took longer than
+RAG_PROFILE_SLOW_MS. One request is profiled at a time, on its own thread.
+
+RAG_METRICS=0 turns everything off; RAG_METRICS_PORT starts the endpoint
+(0 = none); RAG_METRICS_JSONL is the JSON-lines path (empty = none).
+"""
+import os
+import json
+import time
+import random
+import threading
+import contextvars
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_ENABLED = os.getenv("RAG_METRICS", "1") == "1"
+METRICS_PORT = int(os.getenv("RAG_METRICS_PORT", "0"))
+METRICS_JSONL = os.getenv("RAG_METRICS_JSONL", "")
+PROFILE_SAMPLE = float(os.getenv("RAG_PROFILE_SAMPLE", "0"))
+PROFILE_SLOW_MS = float(os.getenv("RAG_PROFILE_SLOW_MS", "2000"))
+PROFILE_DIR = os.getenv("RAG_PROFILE_DIR", "./profiles")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_current = contextvars.ContextVar("rag_trace", default=None)
+
+def _label_key(labels: dict):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(key) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in key) + "}"
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.n = 0
+
+    def observe(self, value: float):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.total += value
+        self.n += 1
+
+class Registry:
+    """Counters and histograms keyed by (name, labels)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}    # name -> {label key: value}
+        self.histograms = {}  # name -> {label key: Histogram}
+        self.help = {}
+
+    def describe(self, name: str, text: str):
+        self.help[name] = text
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            key = _label_key(labels)
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    def snapshot(self) -> dict:
+        """Counters and per-series count / mean, as a plain dict (for a UI or a test)."""
+        with self._lock:
+            out = {}
+            for name, series in self.counters.items():
+                out[name] = {_format_labels(k) or "total": v for k, v in series.items()}
+            for name, series in self.histograms.items():
+                out[name] = {_format_labels(k) or "total": {"count": h.n, "mean": h.total / h.n if h.n else 0.0}
+                             for k, h in series.items()}
+            return out
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+            for name, series in sorted(self.histograms.items()):
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, h in series.items():
+                    cumulative = 0
+                    for bound, count in zip(list(h.buckets) + ["+Inf"], h.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key + (('le', bound),))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {h.total}")
+                    lines.append(f"{name}_count{_format_labels(key)} {h.n}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+registry.describe("rag_requests_total", "Requests by entry point")
+registry.describe("rag_cache_hits_total", "Requests answered from the semantic answer cache")
+registry.describe("rag_empty_retrievals_total", "Retrievals that returned no context")
+registry.describe("rag_llm_errors_total", "Failed LLM calls")
+registry.describe("rag_errors_total", "Exceptions caught in the pipeline, by stage")
+registry.describe("rag_llm_tokens_total", "LLM tokens, from the completion usage")
+registry.describe("rag_stage_seconds", "Latency of a pipeline stage")
+registry.describe("rag_request_seconds", "End-to-end request latency")
+
+_exporters = []
+
+def add_exporter(exporter):
+    """Send every finished trace to exporter.export(record)."""
+    _exporters.append(exporter)
+
+class JsonlExporter:
+    """Appends one JSON line per finished request."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def export(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+class Trace:
+    """Stage timings and attributes of one request."""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.attrs = {}
+        self.error = None
+
+    def add_span(self, name: str, seconds: float):
+        # A stage that runs more than once in a request adds up
+        self.stages[name] = round(self.stages.get(name, 0.0) + seconds * 1000, 3)
+        registry.observe("rag_stage_seconds", seconds, stage=name)
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def finish(self, error: str = None) -> dict:
+        seconds = time.perf_counter() - self.start
+        self.error = error or self.error
+        registry.inc("rag_requests_total", kind=self.kind)
+        registry.observe("rag_request_seconds", seconds, kind=self.kind)
+        record = {"ts": round(time.time(), 3), "kind": self.kind, "latency_ms": round(seconds * 1000, 3),
+                  "stages": self.stages, **self.attrs, "error": self.error}
+        for exporter in _exporters:
+            try:
+                exporter.export(record)
+            except Exception as e:
+                print(f"Warning: metrics exporter {type(exporter).__name__} failed: {e}")
+        return record
+
+class _NullTrace(Trace):
+    def add_span(self, name: str, seconds: float):
+        pass
+
+    def finish(self, error: str = None) -> dict:
+        return {}
+
+def current() -> Trace:
+    return _current.get()
+
+@contextmanager
+def activate(trace: Trace):
+    """Make trace the current one, for code (such as a generator) that manages a trace itself."""
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+def start_trace(kind: str) -> Trace:
+    return Trace(kind) if METRICS_ENABLED else _NullTrace(kind)
+
+@contextmanager
+def trace(kind: str, profile: bool = True):
+    """Trace one request; finished (and exported) on exit, also when it raises."""
+    tr = start_trace(kind)
+    profiler = _maybe_profile() if profile and METRICS_ENABLED else None
+    error = None
+    try:
+        with activate(tr):
+            yield tr
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        if profiler is not None:
+            _finish_profile(profiler, tr)
+        tr.finish(error)
+
+@contextmanager
+def span(name: str):
+    """Time a stage into the current trace (or only the stage histogram outside a trace)."""
+    if not METRICS_ENABLED:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - t0
+        tr = _current.get()
+        if tr is not None:
+            tr.add_span(name, seconds)
+        else:
+            registry.observe("rag_stage_seconds", seconds, stage=name)
+
+def inc(name: str, value: float = 1, **labels):
+    if METRICS_ENABLED:
+        registry.inc(name, value, **labels)
+
+def record_error(stage: str, error: Exception):
+    """Count an exception the pipeline turned into a fallback reply, and attach it to the trace."""
+    inc("rag_errors_total", stage=stage)
+    tr = _current.get()
+    if tr is not None:
+        tr.error = f"{stage}: {type(error).__name__}: {error}"
+
+def record_usage(usage):
+    """Token usage of a completion (an OpenAI usage object or a dict), into the counters and the trace."""
+    if usage is None:
+        return
+    get = usage.get if isinstance(usage, dict) else lambda k: getattr(usage, k, None)
+    tokens = {k: get(k) for k in ("prompt_tokens", "completion_tokens") if get(k) is not None}
+    for k, v in tokens.items():
+        inc("rag_llm_tokens_total", v, type=k.split("_")[0])
+    tr = _current.get()
+    if tr is not None:
+        tr.set(usage=tokens)
+
+_profile_lock = threading.Lock()
+
+def _maybe_profile():
+    if PROFILE_SAMPLE <= 0 or random.random() >= PROFILE_SAMPLE:
+        return None
+    if not _profile_lock.acquire(blocking=False):  # only one profiler can be active per process
+        return None
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # another profiler (or debugger) is active
+        _profile_lock.release()
+        return None
+    return profiler
+
+def _finish_profile(profiler, tr: Trace):
+    """Stop profiling; keep the profile (and name it in the trace) if the request was slow."""
+    try:
+        profiler.disable()
+        latency_ms = (time.perf_counter() - tr.start) * 1000
+        if latency_ms >= PROFILE_SLOW_MS:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = os.path.join(PROFILE_DIR, f"{tr.kind}-{int(time.time() * 1000)}.prof")
+            profiler.dump_stats(path)
+            tr.set(profile=path)
+            print(f"Slow request ({latency_ms:.0f} ms) profiled to {path}")
+    finally:
+        _profile_lock.release()
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+_server = None
+_server_failed = False  # the bind failed once; reruns (e.g. Streamlit's) don't retry it
+_server_lock = threading.Lock()
+
+def start_server(port: int = None, host: str = "0.0.0.0"):
+    """Serve /metrics on a daemon thread (idempotent; no-op when the port is 0 or failed to bind). Returns the server."""
+    global _server, _server_failed
+    port = METRICS_PORT if port is None else port
+    if not METRICS_ENABLED or not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            if _server_failed:
+                return None
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:  # e.g. a second process on the same host
+                _server_failed = True
+                print(f"Warning: metrics endpoint not started on port {port}: {e}")
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="rag-metrics", daemon=True).start()
+            print(f"Metrics at http://{host}:{port}/metrics")
+    return _server
+
+if METRICS_ENABLED and METRICS_JSONL:
+    add_exporter(JsonlExporter(METRICS_JSONL))
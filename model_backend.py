@@ -0,0 +1,197 @@
+# model_backend.py
+"""
+Selectable inference backend for the embedder and the cross-encoder.
+
+MODEL_BACKEND:
+    torch      sentence-transformers on PyTorch (default)
+    onnx       ONNX Runtime, fp32 export of the same weights
+    onnx-int8  ONNX Runtime with dynamic int8 quantization of the weights
+
+The ONNX backends export each model once (this needs torch and optimum) and
+cache the artefacts in ONNX_CACHE_DIR (default: <INDEX_DIR>/onnx). Later
+processes only load onnxruntime and the fast tokenizer, never torch.
+
+The loaded objects expose the subset of the sentence-transformers API this
+repo uses: SentenceTransformer.encode(...) and CrossEncoder.predict(...).
+
+    python model_backend.py --export   # pre-build the artefacts, e.g. in a deploy step
+"""
+import os
+import sys
+import json
+import argparse
+import threading
+import numpy as np
+
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "torch")
+BACKENDS = ("torch", "onnx", "onnx-int8")
+ONNX_CACHE_DIR = os.getenv("ONNX_CACHE_DIR", os.path.join(os.getenv("INDEX_DIR", "./kb_index"), "onnx"))
+ORT_THREADS = int(os.getenv("ORT_THREADS", "0"))  # 0 = onnxruntime default (all cores)
+
+EMB_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+EMB_MAX_LENGTH = 256  # all-MiniLM-L6-v2 max_seq_length
+RERANK_MAX_LENGTH = 512
+
+_export_lock = threading.Lock()
+
+def model_key(model_name: str, backend: str = None) -> str:
+    """Identity of the vectors a model produces: int8 weights give (slightly) different embeddings."""
+    backend = backend or MODEL_BACKEND
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+def _artefact_dir(model_name: str) -> str:
+    return os.path.join(ONNX_CACHE_DIR, model_name.replace("/", "__"))
+
+def export_model(model_name: str, task: str, backend: str) -> str:
+    """Export (and for onnx-int8 quantize) model_name once; returns the .onnx path to load."""
+    out_dir = _artefact_dir(model_name)
+    fp32_path = os.path.join(out_dir, "model.onnx")
+    int8_path = os.path.join(out_dir, "model_int8.onnx")
+    target = int8_path if backend == "onnx-int8" else fp32_path
+    with _export_lock:
+        if os.path.exists(target) and os.path.exists(os.path.join(out_dir, "tokenizer.json")):
+            return target
+        os.makedirs(out_dir, exist_ok=True)
+        if not os.path.exists(fp32_path):
+            # Only the export step needs torch/transformers
+            from optimum.exporters.onnx import main_export
+            print(f"Exporting {model_name} to ONNX in {out_dir}/ ...")
+            tmp_dir = out_dir + ".tmp"
+            main_export(model_name, output=tmp_dir, task=task, opset=17)
+            for name in os.listdir(tmp_dir):
+                os.replace(os.path.join(tmp_dir, name), os.path.join(out_dir, name))
+            os.rmdir(tmp_dir)
+        if backend == "onnx-int8" and not os.path.exists(int8_path):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            print(f"Quantizing {model_name} to int8 ...")
+            quantize_dynamic(fp32_path, int8_path + ".tmp", weight_type=QuantType.QInt8)
+            os.replace(int8_path + ".tmp", int8_path)
+    return target
+
+def _session(path: str):
+    import onnxruntime as ort
+    opts = ort.SessionOptions()
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if ORT_THREADS:
+        opts.intra_op_num_threads = ORT_THREADS
+    return ort.InferenceSession(path, sess_options=opts, providers=["CPUExecutionProvider"])
+
+def _tokenizer(model_dir: str, max_length: int):
+    from tokenizers import Tokenizer
+    tok = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+    tok.enable_truncation(max_length=max_length)
+    tok.enable_padding()
+    return tok
+
+class _OnnxModel:
+    def __init__(self, model_name: str, task: str, backend: str, max_length: int):
+        path = export_model(model_name, task, backend)
+        self.model_name = model_name
+        self.backend = backend
+        self.model_dir = os.path.dirname(path)
+        self.session = _session(path)
+        self.tokenizer = _tokenizer(self.model_dir, max_length)
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def _run(self, encodings):
+        feeds = {
+            "input_ids": np.asarray([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.asarray([e.attention_mask for e in encodings], dtype=np.int64),
+        }
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.asarray([e.type_ids for e in encodings], dtype=np.int64)
+        return self.session.run(None, feeds)[0], feeds["attention_mask"]
+
+    @staticmethod
+    def _batches(n: int, batch_size: int):
+        for start in range(0, n, batch_size):
+            yield start, min(n, start + batch_size)
+
+class OnnxSentenceEmbedder(_OnnxModel):
+    """SentenceTransformer.encode() on ONNX Runtime: mean pooling over the last hidden state."""
+
+    def __init__(self, model_name: str = EMB_MODEL, backend: str = "onnx-int8"):
+        super().__init__(model_name, "feature-extraction", backend, EMB_MAX_LENGTH)
+
+    def encode(self, sentences, batch_size: int = 32, show_progress_bar: bool = False,
+               normalize_embeddings: bool = False, convert_to_numpy: bool = True, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        out = []
+        for start, end in self._batches(len(texts), batch_size):
+            hidden, mask = self._run(self.tokenizer.encode_batch(texts[start:end]))
+            mask = mask[..., None].astype(np.float32)
+            emb = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if normalize_embeddings:
+                emb /= np.clip(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12, None)
+            out.append(emb.astype(np.float32))
+        embs = np.concatenate(out) if out else np.zeros((0, self.get_sentence_embedding_dimension()), np.float32)
+        return embs[0] if single else embs
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return int(self.session.get_outputs()[0].shape[-1])
+
+class OnnxCrossEncoder(_OnnxModel):
+    """CrossEncoder.predict() on ONNX Runtime for single-logit relevance models."""
+
+    def __init__(self, model_name: str = RERANK_MODEL, backend: str = "onnx-int8"):
+        super().__init__(model_name, "text-classification", backend, RERANK_MAX_LENGTH)
+        self.apply_sigmoid = self._default_sigmoid(self.model_dir)
+
+    @staticmethod
+    def _default_sigmoid(model_dir: str) -> bool:
+        # Same default as sentence-transformers: sigmoid for 1-label models unless the config says otherwise
+        path = os.path.join(model_dir, "config.json")
+        if not os.path.exists(path):
+            return False
+        with open(path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        activation = config.get("sbert_ce_default_activation_function")
+        if activation:
+            return activation.endswith("Sigmoid")
+        return config.get("num_labels", len(config.get("id2label", {})) or 1) == 1
+
+    def predict(self, sentences, batch_size: int = 32, show_progress_bar: bool = False, **kwargs):
+        pairs = [tuple(p) for p in sentences]
+        scores = []
+        for start, end in self._batches(len(pairs), batch_size):
+            logits, _ = self._run(self.tokenizer.encode_batch(pairs[start:end]))
+            scores.append(logits[:, 0] if logits.ndim == 2 else logits)
+        scores = np.concatenate(scores).astype(np.float32) if scores else np.zeros(0, np.float32)
+        if self.apply_sigmoid:
+            scores = 1 / (1 + np.exp(-scores))
+        return scores
+
+def load_embedder(model_name: str = EMB_MODEL, backend: str = None):
+    backend = backend or MODEL_BACKEND
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown MODEL_BACKEND {backend!r}; expected one of {BACKENDS}")
+    return OnnxSentenceEmbedder(model_name, backend)
+
+def load_cross_encoder(model_name: str = RERANK_MODEL, backend: str = None):
+    backend = backend or MODEL_BACKEND
+    if backend == "torch":
+        from sentence_transformers import CrossEncoder
+        return CrossEncoder(model_name)
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown MODEL_BACKEND {backend!r}; expected one of {BACKENDS}")
+    return OnnxCrossEncoder(model_name, backend)
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Export the embedder and cross-encoder to ONNX")
+    p.add_argument("--export", action="store_true", help="export (and quantize) both models into ONNX_CACHE_DIR")
+    p.add_argument("--backend", choices=BACKENDS[1:], default="onnx-int8")
+    args = p.parse_args(argv)
+    if not args.export:
+        p.print_help()
+        return 1
+    print(export_model(EMB_MODEL, "feature-extraction", args.backend))
+    print(export_model(RERANK_MODEL, "text-classification", args.backend))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
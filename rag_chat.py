@@ -1,16 +1,89 @@
 import os
+import time
+import asyncio
+import threading
+import weakref
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import faiss
+import httpx
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer, CrossEncoder
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+from answer_cache import SemanticCache
+from language import detect_language
+from batching import MicroBatcher
+from rerank_policy import RerankPolicy, RerankStats
+from context_budget import ContextBudget, count_message_tokens, count_tokens
+from conversation import Memory, Turn, normalize_history
+from intent_router import IntentRouter
+from chunk_store import ChunkStore, has_chunk_store
+from lexical_index import LexicalIndex, has_lexical_index, reciprocal_rank_fusion
+from model_backend import EMB_MODEL, RERANK_MODEL, load_embedder, load_cross_encoder, model_key
+import ann_index
+import index_generations
+import language_index
+import metrics
 
 load_dotenv()
 
 INDEX_DIR = os.getenv("INDEX_DIR", "./kb_index")
+# Point at any OpenAI-compatible endpoint (e.g. benchmarks/stub_llm.py for offline runs)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+
+# Async serving path: LLM connection pool/timeouts and CPU-stage thread pool size
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "64"))
+RAG_CPU_WORKERS = int(os.getenv("RAG_CPU_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Cross-session micro-batching of encode/re-rank calls on the shared models
+MICROBATCH_ENABLED = os.getenv("RAG_MICROBATCH", "0") == "1"
+BATCH_MAX_WAIT_MS = float(os.getenv("RAG_BATCH_MAX_WAIT_MS", "5"))
+ENCODE_MAX_BATCH = int(os.getenv("RAG_ENCODE_MAX_BATCH", "64"))
+RERANK_MAX_BATCH = int(os.getenv("RAG_RERANK_MAX_BATCH", "256"))
+
+# Adaptive re-ranking (RAG_RERANK_POLICY=full re-ranks every FAISS candidate)
+reranking = RerankPolicy.from_env()
+_rerank_counters = RerankStats()
+
+# Hybrid retrieval: BM25 candidates fused with the FAISS ones (reciprocal rank fusion)
+HYBRID_ENABLED = os.getenv("RAG_HYBRID", "1") == "1"
+RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+LEXICAL_K = int(os.getenv("RAG_LEXICAL_K", "30"))
+
+# Language routing: a query searches the sub-index of its language (language_index.py), and the
+# other language's too when its best score is below RAG_LANG_FALLBACK_SCORE
+LANG_ROUTING_ENABLED = os.getenv("RAG_LANG_ROUTING", "1") == "1"
+LANG_FALLBACK_SCORE = float(os.getenv("RAG_LANG_FALLBACK_SCORE", "0.3"))
+metrics.registry.describe("rag_lang_routes_total", "Dense searches by query language and cross-lingual fallback")
+
+# Intent router: small talk, out-of-scope requests and known FAQs are answered without retrieval or the LLM
+INTENT_ROUTER_ENABLED = os.getenv("RAG_INTENT_ROUTER", "1") == "1"
+metrics.registry.describe("rag_intent_requests_total", "Requests by routed intent and path (fast or pipeline)")
+
+# Prompt context: token budget for the re-ranked chunks (0 = legacy 200-word truncation per chunk)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKENS", "1200"))
+context_budget = ContextBudget(
+    max_tokens=CONTEXT_TOKEN_BUDGET,
+    model=LLM_MODEL,
+    redundancy=float(os.getenv("RAG_CONTEXT_REDUNDANCY", "0.9")),
+)
+
+# Conversation memory: rolling summary + recent window, follow-up rewriting (RAG_QUERY_REWRITE=llm|concat|off)
+HISTORY_ENABLED = os.getenv("RAG_HISTORY", "1") == "1"
+REWRITE_TIMEOUT = float(os.getenv("RAG_REWRITE_TIMEOUT", "5"))
 
 # Global variables (lazy loaded)
 _rag_cache = {}
+_rag_lock = threading.Lock()
+_cpu_executor = None
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> AsyncOpenAI
+_batchers = {}
+
+# Semantic answer cache shared by answer() and answer_stream()
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+answer_cache = SemanticCache.from_env(index_dir=INDEX_DIR)
 
 def get_api_key():
     """Get API key from Streamlit secrets or environment variables."""
@@ -30,40 +103,129 @@ def get_rag_components():
     
     if "initialized" in _rag_cache:
         return _rag_cache
-    
+
+    with _rag_lock:
+        if "initialized" in _rag_cache:
+            return _rag_cache
+        return _load_rag_components()
+
+def read_index(path: str):
+    """Open a FAISS index memory-mapped so worker processes share its pages."""
+    flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    try:
+        return faiss.read_index(path, flags)
+    except RuntimeError:
+        # Index types without mmap support are read into memory
+        return faiss.read_index(path)
+
+def _lap(timings: dict, name: str, t0: float) -> float:
+    now = time.perf_counter()
+    timings[name] = round(now - t0, 4)
+    return now
+
+def _load_rag_components():
+    global _rag_cache
+
     # Get API key
     OPENAI_API_KEY = get_api_key()
     if not OPENAI_API_KEY:
         raise RuntimeError("OPENAI_API_KEY missing. Please set it in Streamlit secrets or .env file")
     
-    # Initialize components
-    client = OpenAI(api_key=OPENAI_API_KEY)
-    emb = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-    reranker = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
+    # Initialize components; seconds per component go to load_timings
+    timings = {}
+    t0 = time.perf_counter()
+    client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
+    t0 = _lap(timings, "client", t0)
+    # PyTorch or ONNX Runtime, per MODEL_BACKEND
+    emb = load_embedder(EMB_MODEL)
+    t0 = _lap(timings, "embedder", t0)
+    reranker = load_cross_encoder(RERANK_MODEL)
+    # Cross-encoders of their own for queries in a language (RAG_RERANK_MODEL_AR / _EN)
+    lang_rerankers, loaded = {}, {RERANK_MODEL: reranker}
+    for lang in language_index.LANGUAGES:
+        name = language_index.rerank_model(lang, RERANK_MODEL)
+        if name not in loaded:
+            loaded[name] = load_cross_encoder(name)
+        if name != RERANK_MODEL:
+            lang_rerankers[lang] = loaded[name]
+    t0 = _lap(timings, "cross_encoder", t0)
     
     # Load index with error handling
     try:
-        index_path = os.path.join(INDEX_DIR, "faiss.index")
-        texts_path = os.path.join(INDEX_DIR, "texts.npy")
-        sources_path = os.path.join(INDEX_DIR, "sources.npy")
+        # Every file comes from the one published generation, even if a rebuild swaps it meanwhile
+        index_dir = index_generations.current_dir(INDEX_DIR)
+        index_path = os.path.join(index_dir, "faiss.index")
         
         if not os.path.exists(index_path):
             raise FileNotFoundError(f"FAISS index not found at {index_path}")
         
-        index = faiss.read_index(index_path)
-        texts = np.load(texts_path, allow_pickle=True)
-        sources = np.load(sources_path, allow_pickle=True)
+        index = read_index(index_path)
+        index_meta = ann_index.read_meta(index_dir)
+        query_model = model_key(EMB_MODEL)
+        if index_meta.get("model") and index_meta["model"] != query_model:
+            print(f"Warning: index was built with {index_meta['model']}, queries use {query_model}")
+        ann_index.apply_search_params(index, index_meta.get("search_params", {}))
+        t0 = _lap(timings, "faiss_index", t0)
+        if has_chunk_store(index_dir):
+            store = ChunkStore(index_dir)
+            texts = store.texts
+            sources = store.sources
+            also_in = store.also_in
+        else:
+            store = None
+            # Legacy pickled arrays (run `python chunk_store.py` to convert)
+            texts = np.load(os.path.join(index_dir, "texts.npy"), allow_pickle=True)
+            sources = np.load(os.path.join(index_dir, "sources.npy"), allow_pickle=True)
+            also_in = {}
+        t0 = _lap(timings, "chunk_store", t0)
+        # BM25 side of hybrid retrieval; dense-only when the index predates it
+        lexical = LexicalIndex(index_dir) if has_lexical_index(index_dir) else None
+        t0 = _lap(timings, "lexical_index", t0)
+        # Per-language sub-indexes; the whole index is searched when the build has none
+        lang_indexes, lang_embedders = {}, {}
+        if LANG_ROUTING_ENABLED and language_index.has_language_indexes(index_dir):
+            embedders = {EMB_MODEL: emb}
+            for lang, entry in language_index.read_language_meta(index_dir).items():
+                lang_indexes[lang] = read_index(os.path.join(index_dir, language_index.index_file(lang)))
+                ann_index.apply_search_params(lang_indexes[lang], entry.get("search_params", {}))
+                if model_key(entry["model"]) != entry["model_key"]:
+                    print(f"Warning: {lang} sub-index was built with {entry['model_key']}, "
+                          f"queries use {model_key(entry['model'])}")
+                if entry["model"] not in embedders:
+                    embedders[entry["model"]] = load_embedder(entry["model"])
+                if entry["model"] != EMB_MODEL:
+                    lang_embedders[lang] = embedders[entry["model"]]
+        t0 = _lap(timings, "language_indexes", t0)
         
     except Exception as e:
         raise RuntimeError(f"Failed to load RAG index: {str(e)}")
+
+    # Intent examples are encoded with the shared embedder; FAQ answers are tied to this index build
+    router = None
+    if INTENT_ROUTER_ENABLED:
+        try:
+            router = IntentRouter.from_env(lambda texts: emb.encode(texts, normalize_embeddings=True), INDEX_DIR,
+                                           f"{index_meta.get('built_at')}|{index.ntotal}")
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: intent router disabled: {e}")
+    _lap(timings, "intent_router", t0)
     
     _rag_cache = {
         "client": client,
         "emb": emb,
         "reranker": reranker,
         "index": index,
+        "index_meta": index_meta,
         "texts": texts,
         "sources": sources,
+        "also_in": also_in,
+        "chunk_store": store,
+        "lexical": lexical,
+        "lang_indexes": lang_indexes,
+        "lang_embedders": lang_embedders,
+        "lang_rerankers": lang_rerankers,
+        "router": router,
+        "load_timings": timings,
         "initialized": True
     }
     
@@ -72,6 +234,167 @@ def get_rag_components():
     
     return _rag_cache
 
+def _small_completion(messages, max_tokens: int) -> str:
+    """Short deterministic completion for query rewrites and conversation summaries."""
+    client = get_rag_components()["client"].with_options(timeout=REWRITE_TIMEOUT, max_retries=0)
+    resp = client.chat.completions.create(model=LLM_MODEL, messages=messages, temperature=0, max_tokens=max_tokens)
+    metrics.record_usage(resp.usage)
+    return resp.choices[0].message.content
+
+async def _small_completion_async(messages, max_tokens: int) -> str:
+    """_small_completion() on the AsyncOpenAI client, for rewrites on the async path."""
+    client = get_async_client().with_options(timeout=REWRITE_TIMEOUT, max_retries=0)
+    resp = await client.chat.completions.create(model=LLM_MODEL, messages=messages, temperature=0,
+                                                max_tokens=max_tokens)
+    metrics.record_usage(resp.usage)
+    return resp.choices[0].message.content
+
+memory = Memory(
+    complete=_small_completion,
+    acomplete=_small_completion_async,
+    window_messages=int(os.getenv("RAG_HISTORY_MESSAGES", "6")),
+    history_tokens=int(os.getenv("RAG_HISTORY_TOKENS", "500")),
+    summary_tokens=int(os.getenv("RAG_SUMMARY_TOKENS", "200")),
+    rewrite=os.getenv("RAG_QUERY_REWRITE", "llm"),
+    model=LLM_MODEL,
+)
+
+def prepare_turn(query: str, history, rewrite: bool = True) -> Turn:
+    """Recent messages, rolling summary and retrieval query for this question (see conversation.py)."""
+    if not HISTORY_ENABLED:
+        return Turn(query, query, "", [], False)
+    with metrics.span("history"):
+        return memory.prepare(query, history, rewrite)
+
+async def prepare_turn_async(query: str, history) -> Turn:
+    """prepare_turn() for the event loop: a follow-up rewrite is awaited on the async client, not run on a thread."""
+    if not HISTORY_ENABLED:
+        return Turn(query, query, "", [], False)
+    turn = await _run_cpu(prepare_turn, query, history, False)
+    with metrics.span("history"):
+        turn.search_query, turn.rewritten = await memory.rewrite_async(query, turn.recent, turn.summary)
+    return turn
+
+def route_intent(query: str, q_emb, history):
+    """Intent match (intent_router.py) for small talk and known FAQs, or None for the full pipeline.
+
+    A match with an answer (match.fast) is served as is; a FAQ without a
+    stored answer (see faq_answer) goes through the pipeline.
+    """
+    router = get_rag_components().get("router")
+    if router is None:
+        return None
+    with metrics.span("intent"):
+        match = router.route(query, q_emb[0], in_conversation=bool(normalize_history(history, query)[1]))
+    fast = match is not None and match.fast
+    metrics.inc("rag_intent_requests_total", intent=match.intent if match else "knowledge",
+                path="fast" if fast else "pipeline")
+    tr = metrics.current()
+    if tr is not None and match is not None:
+        tr.set(intent=match.intent, fast_path=fast)
+    return match
+
+def faq_answer(query: str):
+    """(answer, sources) to store for a FAQ: no history, no answer cache, temperature 0.
+
+    Used offline by `intent_router.py --build`; (None, []) when nothing was retrieved.
+    """
+    ctx = retrieve(query, k=30, top_n=5)
+    if not ctx:
+        return None, []
+    text = _complete(get_rag_components()["client"], build_messages(query, ctx), temperature=0)
+    return text, [c["source"] for c in ctx]
+
+def intent_stats():
+    """Share of requests served on the intent fast path (empty without the router or before loading)."""
+    router = _rag_cache.get("router")
+    return router.stats() if router is not None else {}
+
+def get_cpu_executor():
+    """Bounded thread pool for the CPU stages (encode, FAISS search, re-rank) of the async path."""
+    global _cpu_executor
+    if _cpu_executor is None:
+        with _rag_lock:
+            if _cpu_executor is None:
+                _cpu_executor = ThreadPoolExecutor(max_workers=RAG_CPU_WORKERS, thread_name_prefix="rag-cpu")
+    return _cpu_executor
+
+def get_async_client():
+    """AsyncOpenAI client for the running event loop, with a bounded connection pool."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        OPENAI_API_KEY = get_api_key()
+        if not OPENAI_API_KEY:
+            raise RuntimeError("OPENAI_API_KEY missing. Please set it in Streamlit secrets or .env file")
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS),
+            timeout=httpx.Timeout(LLM_TIMEOUT, connect=5.0),
+        )
+        client = AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, http_client=http_client, max_retries=2)
+        _async_clients[loop] = client
+    return client
+
+def _predict_sorted(reranker, pairs, batch_size: int = 32):
+    """CrossEncoder.predict with pairs sorted by length so each internal batch pads evenly."""
+    if not pairs:
+        return np.zeros(0, dtype=np.float32)
+    order = sorted(range(len(pairs)), key=lambda j: len(pairs[j][0]) + len(pairs[j][1]))
+    sorted_scores = reranker.predict([pairs[j] for j in order], batch_size=batch_size)
+    scores = np.zeros(len(pairs), dtype=np.float32)
+    scores[order] = sorted_scores
+    return scores
+
+def get_batchers():
+    """Shared micro-batchers for the embedder and the cross-encoder (created on first use)."""
+    if not _batchers:
+        rag = get_rag_components()
+        emb = rag["emb"]
+        reranker = rag["reranker"]
+        with _rag_lock:
+            if not _batchers:
+                _batchers["encode"] = MicroBatcher(
+                    lambda texts: emb.encode(texts, batch_size=ENCODE_MAX_BATCH, normalize_embeddings=True),
+                    max_batch=ENCODE_MAX_BATCH, max_wait_ms=BATCH_MAX_WAIT_MS, name="encode",
+                )
+                _batchers["rerank"] = MicroBatcher(
+                    lambda pairs: _predict_sorted(reranker, pairs),
+                    max_batch=RERANK_MAX_BATCH, max_wait_ms=BATCH_MAX_WAIT_MS, name="rerank",
+                )
+    return _batchers
+
+def batcher_stats():
+    """Queue depth and batch-size histograms of the micro-batchers."""
+    return {name: b.stats() for name, b in _batchers.items()}
+
+def encode_texts(texts):
+    """Encode texts with the shared embedder, micro-batched across sessions when enabled."""
+    if MICROBATCH_ENABLED:
+        return np.asarray(get_batchers()["encode"](texts), dtype=np.float32)
+    return get_rag_components()["emb"].encode(texts, normalize_embeddings=True)
+
+def rerank_pairs(pairs, lang: str = None):
+    """Score (query, passage) pairs with the shared cross-encoder, micro-batched when enabled.
+
+    Queries in a language with a cross-encoder of its own (RAG_RERANK_MODEL_AR / _EN) use that one.
+    """
+    reranker = get_rag_components()["lang_rerankers"].get(lang)
+    if reranker is not None:
+        return reranker.predict(pairs)
+    if MICROBATCH_ENABLED:
+        return np.asarray(get_batchers()["rerank"](pairs), dtype=np.float32)
+    return get_rag_components()["reranker"].predict(pairs)
+
+def rerank_stats():
+    """Skip rate, chosen-k histogram and cross-encoder pairs saved by the re-rank policy."""
+    return _rerank_counters.stats()
+
+async def _run_cpu(fn, *args):
+    loop = asyncio.get_running_loop()
+    # Carry the request's trace (metrics.py) over to the worker thread
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(get_cpu_executor(), ctx.run, fn, *args)
+
 # In rag_chat.py - UPDATE THE SYSTEM PROMPT
 SYS_PROMPT = (
     "You are Manara, a friendly bilingual assistant for Applied Technology Schools (ATS) in UAE. "
@@ -89,103 +412,544 @@ def truncate_chunk(txt: str, max_words: int = 200) -> str:
         return " ".join(words[:max_words]) + "… (truncated)"
     return txt
 
-def retrieve(query: str, k: int = 30, top_n: int = 5):
-    """Retrieve and re-rank the most relevant chunks."""
+def embed_query(query: str):
+    """Encode a query into a normalized (1, dim) float32 vector."""
+    with metrics.span("encode"):
+        return encode_texts([query])
+
+def _dense_search(queries, langs, q, k: int, rag, stats=None):
+    """FAISS search: the whole index, or each query's language sub-index when routing is on.
+
+    q holds the queries' vectors from the shared embedder; a language with
+    its own embedding model encodes its queries again with that model.
+    """
+    lang_indexes = rag.get("lang_indexes")
+    if not (LANG_ROUTING_ENABLED and lang_indexes):
+        if stats is not None:
+            stats["searched"] = int(rag["index"].ntotal)
+        return rag["index"].search(q, k)
+
+    def encode(lang, rows):
+        emb = rag["lang_embedders"].get(lang)
+        if emb is None:
+            return np.ascontiguousarray(q[rows], dtype=np.float32)
+        return emb.encode([queries[r] for r in rows], normalize_embeddings=True)
+
+    D, I, routes = language_index.route_search(lang_indexes, langs, encode, k, LANG_FALLBACK_SCORE)
+    for route in routes:
+        metrics.inc("rag_lang_routes_total", lang=route["lang"], fallback=route["fallback"] or "none")
+    if stats is not None:
+        stats.update(lang=routes[0]["lang"], lang_fallback=routes[0]["fallback"], searched=routes[0]["searched"])
+    return D, I
+
+def _initial_candidates(ids, scores, texts, sources, also_in=None):
+    """Turn one row of FAISS search results into candidate dicts."""
+    initial_ctx = []
+    for i, score in zip(ids, scores):
+        if i == -1:
+            continue
+        cand = {"id": int(i), "text": texts[i], "source": sources[i], "score": float(score)}
+        if also_in and int(i) in also_in:
+            # near-duplicates of this chunk in other files were dropped at build time
+            cand["also_in"] = also_in[int(i)]
+        initial_ctx.append(cand)
+    return initial_ctx
+
+def _hybrid_candidates(query: str, ids, scores, k: int, rag):
+    """FAISS and BM25 candidates fused by reciprocal rank, best first, at most k.
+
+    Fused candidates carry the RRF score scaled to [0, 1] (1 = ranked first
+    by both retrievers) as "score", and their FAISS score, if FAISS found
+    them, as "dense_score".
+    """
+    lexical = rag.get("lexical")
+    if not HYBRID_ENABLED or lexical is None:
+        return _initial_candidates(ids, scores, rag["texts"], rag["sources"], rag.get("also_in"))
+    lex_ids, _ = lexical.search(query, LEXICAL_K)
+    dense = {int(i): float(s) for i, s in zip(ids, scores) if i != -1}
+    fused = reciprocal_rank_fusion([ids, lex_ids], rrf_k=RRF_K, limit=k)
+    best = 2.0 / (RRF_K + 1)
+    initial_ctx = _initial_candidates([cid for cid, _ in fused], [rrf / best for _, rrf in fused],
+                                      rag["texts"], rag["sources"], rag.get("also_in"))
+    for cand in initial_ctx:
+        if cand["id"] in dense:
+            cand["dense_score"] = dense[cand["id"]]
+    return initial_ctx
+
+def _top_reranked(initial_ctx, scores, top_n: int):
+    """Order candidates by re-ranker score and keep the top_n."""
+    # Sort the initial context based on the re-ranker scores
+    reranked_ctx = sorted(
+        zip(initial_ctx, scores),
+        key=lambda x: x[1],
+        reverse=True
+    )
+
+    final_ctx = []
+    for (ctx_item, score) in reranked_ctx[:top_n]:
+        # Update the score to the re-ranker score for transparency
+        ctx_item["score"] = float(score)
+        final_ctx.append(ctx_item)
+    return final_ctx
+
+def _record_plan(plan, rerank_seconds: float, stats):
+    _rerank_counters.record(plan)
+    if stats is not None:
+        stats.update({key: v for key, v in plan.items() if key != "rerank"})
+        stats["reranked"] = len(plan["rerank"] or ())
+        stats["rerank_ms"] = round(rerank_seconds * 1000, 2)
+
+def _expand_parents(ranked, top_n: int, store):
+    """Small-to-big: the parent spans of the best children, one per parent, top_n of them.
+
+    The matched child stays available as "chunk"; "text" becomes the parent
+    span the LLM sees. Without parents the ranked chunks are returned as is.
+    """
+    if store is None or store.parents is None:
+        return ranked[:top_n]
+    final_ctx, seen = [], set()
+    for cand in ranked:
+        pid = store.parent_id(cand["id"])
+        if pid in seen:
+            continue
+        seen.add(pid)
+        final_ctx.append({**cand, "chunk": cand["text"], "parent_id": pid, "text": store.parents.text(pid)})
+        if len(final_ctx) == top_n:
+            break
+    return final_ctx
+
+def _apply_plan(initial_ctx, plan, scores, top_n: int, store=None):
+    """top_n of the candidates: FAISS order when re-ranking was skipped, else by re-ranker score."""
+    if plan["rerank"] is None:
+        ranked = initial_ctx
+    else:
+        ranked = _top_reranked([initial_ctx[p] for p in plan["rerank"]], scores, len(plan["rerank"]))
+    return _expand_parents(ranked, top_n, store)
+
+def _rerank_plan(query: str, initial_ctx, top_n: int, D_row, I_row):
+    """Re-rank plan from the FAISS score distribution of one query.
+
+    A skip keeps the candidates' own top_n, which is only justified by the
+    FAISS gap when rank fusion left the FAISS top_n in place.
+    """
+    found = I_row != -1
+    dense_top = {int(i) for i in I_row[found][:top_n]}
+    allow_skip = {c["id"] for c in initial_ctx[:top_n]} == dense_top
+    return reranking.plan(query, initial_ctx, top_n, confidence=D_row[found], allow_skip=allow_skip)
+
+def retrieve(query: str, k: int = 30, top_n: int = 5, q_emb=None, stats=None):
+    """Retrieve and re-rank the most relevant chunks.
+
+    Pass q_emb (from embed_query) to reuse an already computed query vector.
+    k is the number of FAISS candidates; the re-rank policy decides how many
+    of them the cross-encoder sees. Pass a dict as stats to receive that
+    decision (k, skip, stage-1 cut, pairs re-ranked), the language routing
+    (query language, cross-lingual fallback, vectors searched) and the
+    encode, search and re-rank timings.
+    """
     try:
         rag = get_rag_components()
-        emb = rag["emb"]
-        reranker = rag["reranker"]
-        index = rag["index"]
-        texts = rag["texts"]
-        sources = rag["sources"]
-        
-        # 1. Initial retrieval (vector search)
-        q = emb.encode([query], normalize_embeddings=True)
-        D, I = index.search(q, k)
-        
-        initial_ctx = []
-        for i, score in zip(I[0], D[0]):
-            if i == -1:
-                continue
-            initial_ctx.append({"text": texts[i], "source": sources[i], "score": float(score)})
-            
+        lang = detect_language(query)
+
+        # 1. Initial retrieval (vector search, fused with BM25 when hybrid)
+        t0 = time.perf_counter()
+        q = embed_query(query) if q_emb is None else q_emb
+        t_search = time.perf_counter()
+        with metrics.span("search"):
+            D, I = _dense_search([query], [lang], q, k, rag, stats)
+            initial_ctx = _hybrid_candidates(query, I[0], D[0], k, rag)
+        if stats is not None:
+            stats["encode_ms"] = round((t_search - t0) * 1000, 2)
+            stats["search_ms"] = round((time.perf_counter() - t_search) * 1000, 2)
         if not initial_ctx:
+            metrics.inc("rag_empty_retrievals_total")
             return []
 
-        # 2. Re-ranking (cross-encoder)
-        sentences = [c["text"] for c in initial_ctx]
-        pairs = [[query, sentence] for sentence in sentences]
-        
-        # The CrossEncoder returns a score for each pair
-        scores = reranker.predict(pairs)
-        
-        # Sort the initial context based on the re-ranker scores
-        reranked_ctx = sorted(
-            zip(initial_ctx, scores),
-            key=lambda x: x[1],
-            reverse=True
-        )
-        
+        # 2. Re-ranking (cross-encoder) of the candidates the policy keeps;
+        # its k/skip decisions always follow the FAISS score distribution
+        plan = _rerank_plan(query, initial_ctx, top_n, D[0], I[0])
+        t0 = time.perf_counter()
+        scores = None
+        if plan["rerank"] is not None:
+            pairs = [[query, initial_ctx[p]["text"]] for p in plan["rerank"]]
+            # The CrossEncoder returns a score for each pair
+            with metrics.span("rerank"):
+                scores = rerank_pairs(pairs, lang)
+        _record_plan(plan, time.perf_counter() - t0, stats)
+
         # 3. Select the top_n chunks
-        final_ctx = []
-        for (ctx_item, score) in reranked_ctx[:top_n]:
-            # Update the score to the re-ranker score for transparency
-            ctx_item["score"] = float(score)
-            final_ctx.append(ctx_item)
-            
-        return final_ctx
+        return _apply_plan(initial_ctx, plan, scores, top_n, rag.get("chunk_store"))
     except Exception as e:
         print(f"Error in retrieve function: {e}")
+        metrics.record_error("retrieve", e)
         return []
 
-def answer(query: str, history):
-    """Generate an answer using RAG with GPT-4o-mini."""
+def retrieve_many(queries, k: int = 30, top_n: int = 5, batch_size: int = 32):
+    """Batched retrieve(): one encode, one FAISS search and one re-rank call for all queries.
+
+    Returns one context list per query, in the same order and format as retrieve().
+    """
+    queries = list(queries)
+    if not queries:
+        return []
     try:
         rag = get_rag_components()
-        client = rag["client"]
-        
-        # Use the retrieve function with re-ranking.
-        # It retrieves 30 candidates and re-ranks to the top 5 for quality context.
-        ctx = retrieve(query, k=30, top_n=5)
-        
-        # If no context is found, return a polite "I don't know" message
-        if not ctx:
-            return "I am sorry, but I cannot find the answer to your question in the provided documents. Please try asking about admissions, fees, curriculum, locations, or other ATS-related topics."
+        emb = rag["emb"]
+        langs = [detect_language(query) for query in queries]
+
+        # 1. Encode every query in one batch and search all rows at once
+        with metrics.span("encode"):
+            q = emb.encode(queries, batch_size=batch_size, normalize_embeddings=True)
+        with metrics.span("search"):
+            D, I = _dense_search(queries, langs, np.ascontiguousarray(q, dtype=np.float32), k, rag)
+            all_ctx = [_hybrid_candidates(queries[row], I[row], D[row], k, rag) for row in range(len(queries))]
+        plans = [_rerank_plan(queries[row], ctx, top_n, D[row], I[row]) for row, ctx in enumerate(all_ctx)]
 
+        # 2. Score every kept (query, candidate) pair in one predict call. Pairs
+        # are sorted by length so each internal batch pads to similar lengths.
+        pairs = []
+        owners = []
+        for row, (ctx, plan) in enumerate(zip(all_ctx, plans)):
+            for j, pos in enumerate(plan["rerank"] or ()):
+                pairs.append([queries[row], ctx[pos]["text"]])
+                owners.append((row, j))
+
+        # (one call per cross-encoder when a language has its own)
+        pair_scores = np.zeros(len(pairs), dtype=np.float32)
+        with metrics.span("rerank"):
+            for lang in sorted({langs[row] for row, _ in owners}):
+                sel = [j for j, (row, _) in enumerate(owners) if langs[row] == lang]
+                reranker = rag["lang_rerankers"].get(lang, rag["reranker"])
+                pair_scores[sel] = _predict_sorted(reranker, [pairs[j] for j in sel], batch_size)
+
+        scores = [np.zeros(len(plan["rerank"] or ()), dtype=np.float32) for plan in plans]
+        for (row, j), score in zip(owners, pair_scores):
+            scores[row][j] = score
+        for plan in plans:
+            _rerank_counters.record(plan)
+
+        # 3. Select the top_n chunks per query
+        store = rag.get("chunk_store")
+        return [_apply_plan(ctx, plan, s, top_n, store) for ctx, plan, s in zip(all_ctx, plans, scores)]
+    except Exception as e:
+        print(f"Error in retrieve_many function: {e}")
+        metrics.record_error("retrieve_many", e)
+        return [[] for _ in queries]
+
+NO_CONTEXT_REPLY = (
+    "I am sorry, but I cannot find the answer to your question in the provided documents. "
+    "Please try asking about admissions, fees, curriculum, locations, or other ATS-related topics."
+)
+
+def build_messages(query: str, ctx, stats=None, turn=None):
+    """Build the chat messages sent to the LLM for a query and its retrieved context.
+
+    The context is fitted into CONTEXT_TOKEN_BUDGET tokens (see context_budget.py).
+    With a turn (prepare_turn) the conversation summary and recent messages go
+    between the system prompt and the question. Pass a dict as stats to
+    receive the token accounting.
+    """
+    with metrics.span("prompt"):
+        return _build_messages(query, ctx, stats, turn)
+
+def _build_messages(query: str, ctx, stats, turn):
+    if CONTEXT_TOKEN_BUDGET > 0:
+        # Sentences are scored against the standalone form of a follow-up
+        focus = turn.search_query if turn is not None else query
+        short_ctx, tokens = context_budget.assemble(focus, [c["text"] for c in ctx], encode_texts)
+    else:
         short_ctx = [truncate_chunk(c["text"]) for c in ctx]
+        tokens = {"budget": 0, "chunks": len(ctx), "compressed": False}
 
-        joined = "\n---\n".join(
-            f"{txt}"
-            for i, (c, txt) in enumerate(zip(ctx, short_ctx))
-        )
+    joined = "\n---\n".join(short_ctx)
 
-        # More direct prompt without encouraging reasoning
-        prompt = (
-            f"Context information:\n{joined}\n\n"
-            f"Question: {query}\n\n"
-            f"Using the context above, provide a helpful answer to the question. "
-            f"**Important: Answer in the exact same language as the question.** "
-            f"If the question is in Arabic, answer entirely in Arabic. "
-            f"If the question is in English, answer entirely in English. "
-            f"Be friendly and conversational. "
-            f"Use the context information to provide the best possible answer. "
-            f"If the context contains relevant information, use it to answer. "
-            f"Only say you cannot find the answer if the context is completely unrelated. "
-            f"Keep it brief (2-4 sentences). "
-            f"Do not mention file names or sources."
-        )
+    # More direct prompt without encouraging reasoning
+    prompt = (
+        f"Context information:\n{joined}\n\n"
+        f"Question: {query}\n\n"
+        f"Using the context above, provide a helpful answer to the question. "
+        f"**Important: Answer in the exact same language as the question.** "
+        f"If the question is in Arabic, answer entirely in Arabic. "
+        f"If the question is in English, answer entirely in English. "
+        f"Be friendly and conversational. "
+        f"Use the context information to provide the best possible answer. "
+        f"If the context contains relevant information, use it to answer. "
+        f"Only say you cannot find the answer if the context is completely unrelated. "
+        f"Keep it brief (2-4 sentences). "
+        f"Do not mention file names or sources."
+    )
 
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",  # Fixed model name
-            messages=[
-                {"role": "system", "content": SYS_PROMPT},
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.7,
-            max_tokens=300,
-        )
-        return resp.choices[0].message.content
+    conversation = turn.messages() if turn is not None else []
+    messages = [
+        {"role": "system", "content": SYS_PROMPT},
+        *conversation,
+        {"role": "user", "content": prompt},
+    ]
+    if stats is not None:
+        stats.update(tokens)
+        stats["history_tokens"] = count_message_tokens(conversation, LLM_MODEL) if conversation else 0
+        stats["prompt_tokens"] = count_message_tokens(messages, LLM_MODEL)
+    return messages
+
+def _cache_hit():
+    metrics.inc("rag_cache_hits_total")
+    tr = metrics.current()
+    if tr is not None:
+        tr.set(cached=True)
+
+def _complete(client, messages, temperature: float = 0.7):
+    """Blocking chat completion, timed and counted as the llm stage."""
+    with metrics.span("llm"):
+        try:
+            resp = client.chat.completions.create(
+                model=LLM_MODEL,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=300,
+            )
+        except Exception:
+            metrics.inc("rag_llm_errors_total")
+            raise
+    metrics.record_usage(resp.usage)
+    return resp.choices[0].message.content
+
+def answer(query: str, history):
+    """Generate an answer using RAG with GPT-4o-mini."""
+    with metrics.trace("answer"):
+        try:
+            rag = get_rag_components()
+            client = rag["client"]
+
+            # Small talk and known FAQs are answered without retrieval or the LLM
+            q_emb = embed_query(query)
+            intent = route_intent(query, q_emb, history)
+            if intent is not None and intent.fast:
+                return intent.answer
+
+            # Follow-ups are searched (and cached) as standalone questions
+            turn = prepare_turn(query, history)
+            if turn.search_query != query:
+                q_emb = embed_query(turn.search_query)
+
+            # Paraphrases of recent questions are served from the semantic cache
+            lang = detect_language(query)
+            if ANSWER_CACHE_ENABLED:
+                cached = answer_cache.lookup(q_emb[0], lang)
+                if cached is not None:
+                    _cache_hit()
+                    return cached
+            
+            # Use the retrieve function with re-ranking.
+            # It retrieves 30 candidates and re-ranks to the top 5 for quality context.
+            ctx = retrieve(turn.search_query, k=30, top_n=5, q_emb=q_emb)
+            
+            # If no context is found, return a polite "I don't know" message
+            if not ctx:
+                return NO_CONTEXT_REPLY
+
+            text = _complete(client, build_messages(query, ctx, turn=turn))
+            if ANSWER_CACHE_ENABLED and text:
+                answer_cache.store(q_emb[0], lang, text)
+            return text
+        except Exception as e:
+            print(f"Error in answer function: {e}")
+            metrics.record_error("answer", e)
+            return f"I encountered an error while processing your request. Please try again. Error: {str(e)}"
+
+def stream_completion(client, messages, usage=None):
+    """Yield text deltas from a streaming chat completion.
+
+    Pass a dict as usage to receive the token usage the API reports in its final chunk.
+    """
+    stream = client.chat.completions.create(
+        model=LLM_MODEL,
+        messages=messages,
+        temperature=0.7,
+        max_tokens=300,
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    try:
+        for chunk in stream:
+            if usage is not None and getattr(chunk, "usage", None) is not None:
+                usage.update(prompt_tokens=chunk.usage.prompt_tokens, completion_tokens=chunk.usage.completion_tokens)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+    finally:
+        stream.close()  # also when the consumer stops early: release the HTTP connection
+
+def answer_stream(query: str, history):
+    """Stream an answer token-by-token.
+
+    Yields ``{"type": "delta", "text": ...}`` events as the LLM produces text,
+    then a single ``{"type": "done", ...}`` record carrying the full answer,
+    the context sources, whether it came from the answer cache, the re-rank
+    decision (``retrieval``), the prompt/completion token accounting
+    (``tokens``), per-stage milliseconds (``stages``), timings (``ttft``
+    and ``latency`` in seconds), the query used for retrieval
+    (``search_query``), the routed ``intent`` and whether it was answered
+    on the ``fast_path``, and the compacted ``history`` to send with the
+    next question.
+    """
+    start = time.perf_counter()
+    ttft = None
+    parts = []
+    sources = []
+    cached = None
+    error = None
+    retrieval = {}
+    tokens = {}
+    turn = None
+    intent = None
+    # The trace is only made current around code that does not yield
+    trace = metrics.start_trace("answer_stream")
+    try:
+        with metrics.activate(trace):
+            rag = get_rag_components()
+            client = rag["client"]
+
+            q_emb = embed_query(query)
+            intent = route_intent(query, q_emb, history)
+            if intent is not None and intent.fast:
+                turn = prepare_turn(query, history, rewrite=False)
+            else:
+                turn = prepare_turn(query, history)
+                if turn.search_query != query:
+                    q_emb = embed_query(turn.search_query)
+                lang = detect_language(query)
+                if ANSWER_CACHE_ENABLED:
+                    cached = answer_cache.lookup(q_emb[0], lang)
+
+        if intent is not None and intent.fast:
+            parts.append(intent.answer)
+            sources = intent.sources
+            ttft = time.perf_counter() - start
+            yield {"type": "delta", "text": intent.answer}
+        elif cached is not None:
+            with metrics.activate(trace):
+                _cache_hit()
+            parts.append(cached)
+            ttft = time.perf_counter() - start
+            yield {"type": "delta", "text": cached}
+        else:
+            with metrics.activate(trace):
+                ctx = retrieve(turn.search_query, k=30, top_n=5, q_emb=q_emb, stats=retrieval)
+                sources = [c["source"] for c in ctx]
+                messages = build_messages(query, ctx, stats=tokens, turn=turn) if ctx else None
+
+            if not ctx:
+                parts.append(NO_CONTEXT_REPLY)
+                ttft = time.perf_counter() - start
+                yield {"type": "delta", "text": NO_CONTEXT_REPLY}
+            else:
+                usage = {}
+                t_llm = time.perf_counter()
+                deltas = stream_completion(client, messages, usage)
+                try:
+                    for delta in deltas:
+                        if ttft is None:
+                            ttft = time.perf_counter() - start
+                        parts.append(delta)
+                        yield {"type": "delta", "text": delta}
+                except Exception:
+                    metrics.inc("rag_llm_errors_total")
+                    raise
+                finally:
+                    deltas.close()
+                    trace.add_span("llm", time.perf_counter() - t_llm)
+                if ANSWER_CACHE_ENABLED and parts:
+                    answer_cache.store(q_emb[0], lang, "".join(parts))
+                # The API's own count when it reports usage, else tiktoken's
+                tokens["completion_tokens"] = usage.get("completion_tokens") or count_tokens("".join(parts), LLM_MODEL)
+                with metrics.activate(trace):
+                    metrics.record_usage(usage or {"completion_tokens": tokens["completion_tokens"]})
+    except GeneratorExit:  # closed by the consumer (e.g. the client went away) before the done event
+        trace.finish(error="closed before completion")
+        raise
     except Exception as e:
-        print(f"Error in answer function: {e}")
-        return f"I encountered an error while processing your request. Please try again. Error: {str(e)}"
-    
\ No newline at end of file
+        print(f"Error in answer_stream function: {e}")
+        error = str(e)
+        with metrics.activate(trace):
+            metrics.record_error("answer_stream", e)
+        msg = f"I encountered an error while processing your request. Please try again. Error: {error}"
+        parts.append(msg)
+        yield {"type": "delta", "text": msg}
+
+    if ttft is not None:
+        trace.set(ttft_ms=round(ttft * 1000, 3))
+    trace.finish()
+    if turn is None:  # failed before the history was prepared: keep it as it came in
+        turn = Turn(query, query, *normalize_history(history, query), False)
+    yield {
+        "type": "done",
+        "answer": "".join(parts),
+        "sources": sources,
+        "cached": cached is not None,
+        "intent": intent.intent if intent is not None else None,
+        "fast_path": intent is not None and intent.fast,
+        "retrieval": retrieval,
+        "tokens": tokens,
+        "stages": trace.stages,
+        "ttft": ttft,
+        "latency": time.perf_counter() - start,
+        "error": error,
+        "search_query": turn.search_query,
+        "history": turn.history("".join(parts) if error is None else None),
+    }
+
+async def retrieve_async(query: str, k: int = 30, top_n: int = 5, q_emb=None, stats=None):
+    """Async retrieve(): the CPU-bound stages run on the bounded CPU thread pool."""
+    return await _run_cpu(retrieve, query, k, top_n, q_emb, stats)
+
+async def answer_async(query: str, history):
+    """Async answer() for serving many concurrent conversations from one event loop."""
+    # Not profiled: the event loop thread interleaves many requests
+    with metrics.trace("answer_async", profile=False):
+        try:
+            await _run_cpu(get_rag_components)
+            client = get_async_client()
+
+            q_emb = await _run_cpu(embed_query, query)
+            intent = route_intent(query, q_emb, history)
+            if intent is not None and intent.fast:
+                return intent.answer
+
+            turn = await prepare_turn_async(query, history)
+            if turn.search_query != query:
+                q_emb = await _run_cpu(embed_query, turn.search_query)
+            lang = detect_language(query)
+            if ANSWER_CACHE_ENABLED:
+                cached = answer_cache.lookup(q_emb[0], lang)
+                if cached is not None:
+                    _cache_hit()
+                    return cached
+
+            ctx = await retrieve_async(turn.search_query, 30, 5, q_emb)
+            if not ctx:
+                return NO_CONTEXT_REPLY
+
+            # Context compression encodes sentences, so it runs on the CPU pool too
+            messages = await _run_cpu(build_messages, query, ctx, None, turn)
+            with metrics.span("llm"):
+                try:
+                    resp = await client.chat.completions.create(
+                        model=LLM_MODEL,
+                        messages=messages,
+                        temperature=0.7,
+                        max_tokens=300,
+                    )
+                except Exception:
+                    metrics.inc("rag_llm_errors_total")
+                    raise
+            metrics.record_usage(resp.usage)
+            text = resp.choices[0].message.content
+            if ANSWER_CACHE_ENABLED and text:
+                answer_cache.store(q_emb[0], lang, text)
+            return text
+        except Exception as e:
+            print(f"Error in answer_async function: {e}")
+            metrics.record_error("answer_async", e)
+            return f"I encountered an error while processing your request. Please try again. Error: {str(e)}"
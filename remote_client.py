@@ -0,0 +1,78 @@
+# remote_client.py
+"""
+Client for server.py, with the same answer / answer_stream / retrieve
+interface as rag_chat, so the Streamlit and Gradio UIs can run against a
+remote backend instead of loading the models themselves.
+
+Set RAG_BACKEND_URL (e.g. http://rag-backend:8000) to use it. Failures,
+including 429 / 503 from a saturated backend, come back as the same kind of
+apology text rag_chat returns, plus the error in the final "done" event.
+"""
+import os
+import json
+import time
+import httpx
+
+BACKEND_URL = os.getenv("RAG_BACKEND_URL", "").rstrip("/")
+BACKEND_TIMEOUT = float(os.getenv("RAG_BACKEND_TIMEOUT", "60"))
+ENABLED = bool(BACKEND_URL)
+
+BUSY_REPLY = "Manara is handling many questions right now. Please try again in a moment."
+
+_client = None
+
+def get_client() -> httpx.Client:
+    global _client
+    if _client is None:
+        _client = httpx.Client(base_url=BACKEND_URL, timeout=httpx.Timeout(BACKEND_TIMEOUT, connect=5.0))
+    return _client
+
+def _error_reply(error: str) -> str:
+    return f"I encountered an error while processing your request. Please try again. Error: {error}"
+
+class BackendBusy(Exception):
+    pass
+
+def _post(path: str, payload: dict) -> dict:
+    resp = get_client().post(path, json=payload)
+    if resp.status_code in (429, 503):
+        raise BackendBusy(resp.json().get("error", "busy"))
+    resp.raise_for_status()
+    return resp.json()
+
+def answer(query: str, history):
+    try:
+        return _post("/v1/answer", {"query": query, "history": history or []})["answer"]
+    except BackendBusy:
+        return BUSY_REPLY
+    except Exception as e:
+        print(f"Error in remote answer: {e}")
+        return _error_reply(str(e))
+
+def answer_stream(query: str, history):
+    """rag_chat.answer_stream() events, read from the backend's NDJSON stream."""
+    start = time.perf_counter()
+    try:
+        with get_client().stream("POST", "/v1/answer/stream", json={"query": query, "history": history or []}) as resp:
+            if resp.status_code in (429, 503):
+                raise BackendBusy(json.loads(resp.read() or b"{}").get("error", "busy"))
+            resp.raise_for_status()
+            for line in resp.iter_lines():
+                if line:
+                    yield json.loads(line)
+        return
+    except BackendBusy as e:
+        text, error = BUSY_REPLY, str(e)
+    except Exception as e:
+        print(f"Error in remote answer_stream: {e}")
+        text, error = _error_reply(str(e)), str(e)
+    yield {"type": "delta", "text": text}
+    yield {"type": "done", "answer": text, "sources": [], "cached": False, "intent": None,
+           "fast_path": False, "retrieval": {}, "tokens": {}, "stages": {}, "ttft": None, "latency": time.perf_counter() - start, "error": error}
+
+def retrieve(query: str, k: int = 30, top_n: int = 5):
+    try:
+        return _post("/v1/retrieve", {"query": query, "k": k, "top_n": top_n})["chunks"]
+    except Exception as e:
+        print(f"Error in remote retrieve: {e}")
+        return []
@@ -0,0 +1,134 @@
+# rerank_policy.py
+import os
+import re
+import threading
+from collections import Counter
+import numpy as np
+
+WORD_RE = re.compile(r"\w{3,}")
+
+class RerankPolicy:
+    """
+    Decides, per request, how much cross-encoder work the FAISS scores justify.
+
+    1. Dynamic k: only candidates within margin of the best FAISS score are
+       kept (never fewer than min_k).
+    2. Skip: when the top_n candidates are separated from the rest by at
+       least skip_gap and the best score reaches skip_min_score, re-ranking
+       could only reorder chunks that all reach the LLM anyway, so the FAISS
+       order is used as is.
+    3. Stages: when more than stage1_keep candidates remain, a cheap score
+       (FAISS score plus query-term overlap) keeps stage1_keep of them for
+       the full cross-encoder.
+
+    mode "full" always re-ranks every FAISS candidate (the original behaviour).
+    """
+
+    def __init__(self, mode: str = "adaptive", margin: float = 0.15, min_k: int = 10, skip_gap: float = 0.08,
+                 skip_min_score: float = 0.55, stage1_keep: int = 15, lexical_weight: float = 0.1):
+        self.mode = mode
+        self.margin = margin
+        self.min_k = min_k
+        self.skip_gap = skip_gap
+        self.skip_min_score = skip_min_score
+        self.stage1_keep = stage1_keep
+        self.lexical_weight = lexical_weight
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            mode=os.getenv("RAG_RERANK_POLICY", "adaptive"),
+            margin=float(os.getenv("RAG_RERANK_MARGIN", "0.15")),
+            min_k=int(os.getenv("RAG_RERANK_MIN_K", "10")),
+            skip_gap=float(os.getenv("RAG_RERANK_SKIP_GAP", "0.08")),
+            skip_min_score=float(os.getenv("RAG_RERANK_SKIP_MIN_SCORE", "0.55")),
+            stage1_keep=int(os.getenv("RAG_RERANK_STAGE1_KEEP", "15")),
+        )
+
+    def plan(self, query: str, candidates, top_n: int, confidence=None, allow_skip: bool = True) -> dict:
+        """
+        candidates are dicts with "text" and a "score", best first.
+        confidence are the FAISS scores (best first) the k and skip decisions
+        are based on; by default the candidates' own scores. Hybrid retrieval
+        passes the dense scores here while the candidates are rank-fused, and
+        allow_skip=False when fusion changed the FAISS top_n: the FAISS gap
+        then says nothing about the candidates that would reach the LLM.
+        Returns {"rerank": positions to cross-encode (None = skip), ...} plus
+        the k/skip/stage decisions for the per-request stats.
+        """
+        scores = np.asarray([c["score"] for c in candidates], dtype=np.float32)
+        conf = scores if confidence is None else np.asarray(confidence, dtype=np.float32)
+        n = len(scores)
+        plan = {"policy": self.mode, "candidates": n, "k": n, "k_reason": "fixed", "skip_allowed": allow_skip,
+                "skipped": False, "skip_reason": None, "stage1_kept": None, "rerank": list(range(n))}
+        if self.mode != "adaptive" or n == 0:
+            return plan
+
+        if n <= top_n:
+            plan.update(skipped=True, skip_reason="few_candidates", rerank=None)
+            return plan
+
+        # 1. Dynamic k from the score distribution
+        k = min(n, int(np.sum(conf >= conf[0] - self.margin))) if len(conf) else n
+        plan["k"], plan["k_reason"] = max(k, min(self.min_k, n)), "margin"
+        if k < self.min_k:
+            plan["k_reason"] = "min_k"
+        if not allow_skip and plan["k"] <= top_n:
+            plan["k"], plan["k_reason"] = top_n + 1, "top_n"  # the cross-encoder still picks among more than top_n
+        k = plan["k"]
+
+        # 2. Confident FAISS ranking: the top_n set would not change
+        gap = float(conf[top_n - 1] - conf[top_n]) if len(conf) > top_n else 0.0
+        plan["top_gap"] = round(gap, 4)
+        if allow_skip and (k <= top_n or (gap >= self.skip_gap and conf[0] >= self.skip_min_score)):
+            plan.update(skipped=True, skip_reason="gap" if k > top_n else "k<=top_n", rerank=None)
+            return plan
+
+        # 3. Cheap first stage before the cross-encoder
+        positions = list(range(k))
+        if k > self.stage1_keep:
+            cheap = scores[:k] + self.lexical_weight * self._overlap(query, [c["text"] for c in candidates[:k]])
+            positions = sorted(np.argsort(-cheap, kind="stable")[:self.stage1_keep].tolist())
+            plan["stage1_kept"] = len(positions)
+        plan["rerank"] = positions
+        return plan
+
+    @staticmethod
+    def _overlap(query: str, texts) -> np.ndarray:
+        """Share of the query's terms that occur in each text."""
+        terms = set(WORD_RE.findall(query.lower()))
+        if not terms:
+            return np.zeros(len(texts), dtype=np.float32)
+        return np.asarray([len(terms.intersection(WORD_RE.findall(t.lower()))) / len(terms) for t in texts],
+                          dtype=np.float32)
+
+class RerankStats:
+    """Process-wide counters of the policy's decisions (per-request details go to the caller's stats dict)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.skipped = Counter()
+        self.k_chosen = Counter()
+        self.pairs_reranked = 0
+        self.pairs_full = 0
+
+    def record(self, plan: dict):
+        with self._lock:
+            self.requests += 1
+            if plan["skipped"]:
+                self.skipped[plan["skip_reason"]] += 1
+            self.k_chosen[plan["k"]] += 1
+            self.pairs_reranked += len(plan["rerank"] or ())
+            self.pairs_full += plan["candidates"]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "skipped": dict(self.skipped),
+                "skip_rate": sum(self.skipped.values()) / self.requests if self.requests else 0.0,
+                "k_histogram": dict(sorted(self.k_chosen.items())),
+                "pairs_reranked": self.pairs_reranked,
+                "pairs_saved": self.pairs_full - self.pairs_reranked,
+            }
@@ -0,0 +1,110 @@
+# resources.py
+"""
+Process-wide residency of the RAG models and index.
+
+start() loads everything rag_chat needs on a background thread as soon as
+the process starts (Streamlit, Gradio or any other front end), then runs a
+warmup pass: a query encode in both languages, a FAISS search, a re-rank of
+a few real chunks and the prompt tokenizer, so the first user does not pay
+for lazy initialisation, kernel selection or allocator growth.
+
+All sessions share the one copy held by rag_chat; loading is guarded by
+rag_chat's lock, so a request that arrives early simply waits for it.
+status() reports the state ("idle", "loading", "warming", "ready",
+"failed") and the seconds spent per component, for a UI banner or a
+health check.
+
+RAG_PRELOAD=0 turns the background start off (models then load on the first
+question); RAG_WARMUP=0 skips the warmup pass. Nothing is loaded when the
+UI answers through server.py (RAG_BACKEND_URL, see remote_client.py).
+"""
+import os
+import time
+import threading
+
+PRELOAD_ENABLED = os.getenv("RAG_PRELOAD", "1") == "1"
+WARMUP_ENABLED = os.getenv("RAG_WARMUP", "1") == "1"
+WARMUP_QUERIES = ["What are the admission requirements?", "ما هي شروط القبول؟"]
+
+class ResourceManager:
+    def __init__(self, warmup: bool = WARMUP_ENABLED):
+        self.warmup_enabled = warmup
+        self.state = "idle"
+        self.error = None
+        self.timings = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+        self._started_at = None
+
+    def start(self):
+        """Begin loading on a daemon thread (idempotent); returns self."""
+        with self._lock:
+            if self._thread is None:
+                self._started_at = time.perf_counter()
+                self.state = "loading"
+                self._thread = threading.Thread(target=self._load, name="rag-preload", daemon=True)
+                self._thread.start()
+        return self
+
+    def _load(self):
+        try:
+            t0 = time.perf_counter()
+            import rag_chat
+            self.timings["import"] = round(time.perf_counter() - t0, 4)
+            rag = rag_chat.get_rag_components()
+            self.timings.update(rag.get("load_timings", {}))
+            if self.warmup_enabled:
+                self.state = "warming"
+                self._warmup(rag_chat, rag)
+            self.state = "ready"
+        except Exception as e:
+            self.error = str(e)
+            self.state = "failed"
+            print(f"Error preloading RAG components: {e}")
+        finally:
+            self.timings["total"] = round(time.perf_counter() - self._started_at, 4)
+            self._ready.set()
+
+    def _warmup(self, rag_chat, rag):
+        t0 = time.perf_counter()
+        q = rag_chat.encode_texts(WARMUP_QUERIES)
+        t0 = self._lap("warmup_encode", t0)
+        _, I = rag["index"].search(q, 10)
+        t0 = self._lap("warmup_search", t0)
+        chunks = [rag["texts"][int(i)] for i in I[0] if i != -1][:4] or ["warmup"]
+        rag_chat.rerank_pairs([[WARMUP_QUERIES[0], c] for c in chunks])
+        t0 = self._lap("warmup_rerank", t0)
+        rag_chat.count_tokens(WARMUP_QUERIES[0], rag_chat.LLM_MODEL)
+        self._lap("warmup_tokenizer", t0)
+
+    def _lap(self, name: str, t0: float) -> float:
+        now = time.perf_counter()
+        self.timings[name] = round(now - t0, 4)
+        return now
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def wait(self, timeout: float = None) -> bool:
+        """Block until loading finished (ready or failed); False on timeout or if never started."""
+        if self._thread is None:
+            return False
+        return self._ready.wait(timeout) and self.state == "ready"
+
+    def status(self) -> dict:
+        elapsed = time.perf_counter() - self._started_at if self._started_at else 0.0
+        return {"state": self.state, "elapsed": round(elapsed, 2), "timings": dict(self.timings), "error": self.error}
+
+resources = ResourceManager()
+
+def start() -> ResourceManager:
+    """Start the shared background load unless RAG_PRELOAD=0 or the UI uses a remote backend."""
+    import remote_client
+    if PRELOAD_ENABLED and not remote_client.ENABLED:
+        resources.start()
+    return resources
+
+def status() -> dict:
+    return resources.status()
@@ -0,0 +1,316 @@
+# server.py
+"""
+Headless HTTP/JSON answer API with a pre-forked worker pool.
+
+The parent binds the listening socket and forks --workers processes that
+accept from it. Each worker loads the models once (resources.py, including
+the warmup pass) before it accepts connections; the FAISS index and the
+chunk store are memory-mapped read-only, so all workers share their pages
+through the page cache. The parent restarts a worker that dies while
+serving, and stops the pool when one cannot load the models or index.
+
+Admission control per worker: at most --concurrency requests run the
+pipeline at once and up to --queue more wait for a slot (up to
+--queue-timeout seconds, then 503). Beyond that the request is refused
+right away with 429 and a Retry-After header, so a saturated backend
+pushes back instead of piling up latency.
+
+    POST /v1/answer         {"query": ..., "history": [...]}  -> answer, sources, tokens, stage timings
+    POST /v1/answer/stream  same body; NDJSON answer_stream() events
+    POST /v1/retrieve       {"query": ..., "k": 30, "top_n": 5} -> re-ranked chunks and retrieval stats
+    GET  /healthz           load state, in-flight and queued requests of the worker that answers
+    GET  /metrics           Prometheus metrics (metrics.py) of the worker that answers
+
+    python server.py --workers 4 --port 8000
+
+Point the UIs at it with RAG_BACKEND_URL=http://host:8000 (see remote_client.py).
+"""
+import os
+import sys
+import json
+import signal
+import socket
+import argparse
+import threading
+from contextlib import closing, contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import metrics
+
+HOST = os.getenv("RAG_SERVER_HOST", "127.0.0.1")
+PORT = int(os.getenv("RAG_SERVER_PORT", "8000"))
+WORKERS = int(os.getenv("RAG_SERVER_WORKERS", str(min(4, os.cpu_count() or 1))))
+CONCURRENCY = int(os.getenv("RAG_SERVER_CONCURRENCY", "8"))
+QUEUE = int(os.getenv("RAG_SERVER_QUEUE", "32"))
+QUEUE_TIMEOUT = float(os.getenv("RAG_SERVER_QUEUE_TIMEOUT", "10"))
+MAX_BODY_BYTES = 64 * 1024
+MAX_K = 200  # FAISS candidates a /v1/retrieve request may ask for
+STARTUP_FAILED = 3  # worker exit code: could not load, so restarting it would not help
+
+metrics.registry.describe("rag_server_rejected_total", "Requests refused by admission control")
+metrics.registry.describe("rag_server_disconnects_total", "Streams the client closed before the done event")
+
+class StartupError(RuntimeError):
+    pass
+
+class Saturated(Exception):
+    def __init__(self, status: int, reason: str):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+
+class Admission:
+    """Bounded in-flight work plus a bounded wait queue; refuses instead of growing."""
+
+    def __init__(self, concurrency: int = CONCURRENCY, queue: int = QUEUE, queue_timeout: float = QUEUE_TIMEOUT):
+        self.concurrency = concurrency
+        self.queue_size = queue
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(concurrency + queue)
+        self._running = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.running = 0
+
+    @contextmanager
+    def admit(self):
+        if not self._slots.acquire(blocking=False):
+            metrics.inc("rag_server_rejected_total", reason="saturated")
+            raise Saturated(429, "server saturated")
+        try:
+            with self._lock:
+                self.admitted += 1
+            if not self._running.acquire(timeout=self.queue_timeout):
+                metrics.inc("rag_server_rejected_total", reason="queue_timeout")
+                raise Saturated(503, "timed out waiting in the queue")
+            with self._lock:
+                self.running += 1
+            try:
+                yield
+            finally:
+                with self._lock:
+                    self.running -= 1
+                self._running.release()
+        finally:
+            with self._lock:
+                self.admitted -= 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"running": self.running, "queued": self.admitted - self.running,
+                    "concurrency": self.concurrency, "queue": self.queue_size}
+
+def _json_default(o):
+    # numpy scalars in chunk metadata and stats
+    return o.item() if hasattr(o, "item") else str(o)
+
+def _bounded_int(body: dict, key: str, default: int, maximum: int) -> int:
+    value = body.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, (int, str)) or not str(value).strip().isdigit() \
+            or not 1 <= int(value) <= maximum:
+        raise ValueError(f'"{key}" must be an integer from 1 to {maximum}')
+    return int(value)
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive for the JSON endpoints
+    server_version = "ManaraRAG/1.0"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False, default=_json_default).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            raise ValueError("invalid Content-Length") from None
+        if length < 0:
+            raise ValueError("invalid Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise ValueError("request body too large")
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not isinstance(body, dict) or not isinstance(body.get("query"), str) or not body["query"].strip():
+            raise ValueError('expected a JSON object with a non-empty string "query"')
+        history = body.get("history") or []
+        if not isinstance(history, list) or not all(
+                isinstance(m, dict) and isinstance(m.get("role"), str) and isinstance(m.get("content"), str)
+                for m in history):
+            raise ValueError('"history" must be a list of {"role": str, "content": str} messages')
+        body["k"] = _bounded_int(body, "k", 30, MAX_K)
+        body["top_n"] = _bounded_int(body, "top_n", 5, body["k"])
+        return body
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/healthz":
+            import resources
+            status = resources.status()
+            self._send_json(200 if status["state"] == "ready" else 503,
+                            {**status, "pid": os.getpid(), **self.server.admission.stats()})
+        elif path == "/metrics":
+            body = metrics.registry.render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        routes = {"/v1/answer": self._answer, "/v1/answer/stream": self._answer_stream,
+                  "/v1/retrieve": self._retrieve}
+        route = routes.get(self.path.split("?")[0])
+        if route is None:
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            body = self._read_json()
+        except ValueError as e:  # includes malformed JSON
+            self.close_connection = True
+            self._send_json(400, {"error": str(e)})
+            return
+        try:
+            with self.server.admission.admit():
+                route(body)
+        except Saturated as e:
+            self._send_json(e.status, {"error": e.reason}, {"Retry-After": "1"})
+
+    def _answer(self, body):
+        import rag_chat
+        done = {}
+        for event in rag_chat.answer_stream(body["query"], body.get("history") or []):
+            if event["type"] == "done":
+                done = {k: v for k, v in event.items() if k != "type"}
+        self._send_json(500 if done.get("error") else 200, done)
+
+    def _answer_stream(self, body):
+        import rag_chat
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")  # the stream ends when the connection closes
+        self.end_headers()
+        self.close_connection = True
+        # Closing the generator finishes its trace and releases the LLM stream when the client goes away
+        with closing(rag_chat.answer_stream(body["query"], body.get("history") or [])) as events:
+            try:
+                for event in events:
+                    line = json.dumps(event, ensure_ascii=False, default=_json_default).encode("utf-8")
+                    self.wfile.write(line + b"\n")
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                metrics.inc("rag_server_disconnects_total")
+
+    def _retrieve(self, body):
+        import rag_chat
+        stats = {}
+        ctx = rag_chat.retrieve(body["query"], k=body["k"], top_n=body["top_n"], stats=stats)
+        self._send_json(200, {"chunks": ctx, "retrieval": stats})
+
+class APIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, sock, admission: Admission):
+        super().__init__(sock.getsockname()[:2], Handler, bind_and_activate=False)
+        self.socket.close()
+        self.socket = sock  # shared listening socket, inherited from the parent
+        self.admission = admission
+
+def run_worker(sock, args):
+    import resources
+    manager = resources.resources.start()
+    if not manager.wait():
+        raise StartupError(f"could not load the RAG components: {manager.status()['error']}")
+    httpd = APIServer(sock, Admission(args.concurrency, args.queue, args.queue_timeout))
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=httpd.shutdown, daemon=True).start())
+    print(f"worker {os.getpid()} ready")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+def serve(args):
+    sock = socket.create_server((args.host, args.port), backlog=max(128, args.workers * (args.concurrency + args.queue)))
+    print(f"Manara API on http://{args.host}:{args.port} with {args.workers} worker(s)")
+    if args.workers == 1 or not hasattr(os, "fork"):
+        run_worker(sock, args)
+        return
+
+    # Split the cores between workers instead of every worker's torch/ONNX pool claiming all of them
+    os.environ.setdefault("OMP_NUM_THREADS", str(max(1, (os.cpu_count() or 1) // args.workers)))
+    children = set()
+    state = {"stopping": False, "exit": 0}
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                # Not the parent's stop handler (it would signal the sibling workers)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.default_int_handler)
+                run_worker(sock, args)
+            except StartupError as e:
+                print(f"worker {os.getpid()}: {e}")
+                code = STARTUP_FAILED
+            except BaseException as e:
+                print(f"worker {os.getpid()} failed: {e}")
+                code = 1
+            finally:
+                sys.stdout.flush()
+                os._exit(code)
+        children.add(pid)
+
+    def stop(*_):
+        state["stopping"] = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(args.workers):
+        spawn()
+    while children:
+        pid, status = os.wait()
+        if pid not in children:
+            continue
+        children.discard(pid)
+        code = os.waitstatus_to_exitcode(status)
+        if state["stopping"]:
+            continue
+        if code == STARTUP_FAILED:
+            state["exit"] = 1
+            stop()
+        else:
+            print(f"worker {pid} exited ({code}); restarting")
+            spawn()
+    sock.close()
+    sys.exit(state["exit"])
+
+def main():
+    parser = argparse.ArgumentParser(description="Manara RAG answer API")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=WORKERS, help="pre-forked worker processes")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="requests running at once per worker")
+    parser.add_argument("--queue", type=int, default=QUEUE, help="requests waiting per worker before 429")
+    parser.add_argument("--queue-timeout", type=float, default=QUEUE_TIMEOUT,
+                        help="seconds a request may wait for a slot before 503")
+    serve(parser.parse_args())
+
+if __name__ == "__main__":
+    main()
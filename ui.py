@@ -78,6 +78,8 @@ def quick_button(label: str, question: str, textbox: gr.Textbox):
     return gr.Button(label, elem_classes="quick-action-btn").click(fn=fill, outputs=textbox)
 
 def build_ui(chat_fn):
+    # chat_fn may return a string or be a generator yielding the growing answer;
+    # ChatInterface streams generator output into the chat bubble.
     with gr.Blocks(css=CUSTOM_CSS, theme=gr.themes.Soft(), title="ATS Knowledge Hub") as demo:
         header_html()
         features_html()